@@ -0,0 +1,158 @@
+"""
+Shared mail dispatch layer.
+
+Every mail path goes through a per-thread pooled backend connection, so an
+SMTP session is opened once and reused across messages instead of being set
+up and torn down for each send_mail call. Messages are handed to the backend
+in batches, one send_messages call per batch, and each one gets its own
+DeliveryResult.
+"""
+import smtplib
+import threading
+import time
+from typing import NamedTuple, Optional
+from django.conf import settings
+from django.core.mail import get_connection
+
+DEFAULT_BATCH_SIZE = 50
+# SMTP servers drop long or busy sessions; recycle before they do
+DEFAULT_MAX_MESSAGES_PER_CONNECTION = 100
+DEFAULT_MAX_CONNECTION_AGE = 60
+# Errors that mean the session is gone rather than that one message was refused
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
+
+
+class DeliveryResult(NamedTuple):
+    message: object
+    sent: bool
+    error: Optional[Exception] = None
+
+
+class _Progress:
+    """A batch handed to a backend, remembering which message it was sending when it failed"""
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.position = 0
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __iter__(self):
+        for self.position, message in enumerate(self.messages):
+            yield message
+
+
+class ConnectionPool:
+    """Keeps one open backend connection per thread and recycles it by age and message count"""
+
+    def __init__(self, backend=None, max_messages=None, max_age=None):
+        self.backend = backend
+        self.max_messages = max_messages or getattr(
+            settings, 'EMAIL_POOL_MAX_MESSAGES', DEFAULT_MAX_MESSAGES_PER_CONNECTION
+        )
+        self.max_age = max_age or getattr(settings, 'EMAIL_POOL_MAX_AGE', DEFAULT_MAX_CONNECTION_AGE)
+        self._local = threading.local()
+
+    def _current(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and (
+            self._local.sent >= self.max_messages
+            or time.monotonic() - self._local.opened_at > self.max_age
+        ):
+            self.close()
+            connection = None
+        if connection is None:
+            connection = get_connection(self.backend, fail_silently=False)
+            connection.open()
+            self._local.connection = connection
+            self._local.opened_at = time.monotonic()
+            self._local.sent = 0
+        return connection
+
+    def send_batch(self, messages):
+        """
+        Send messages with one send_messages call on the pooled connection; returns a
+        DeliveryResult per message. When the backend rejects a message part-way, the
+        messages it got through count as sent, the failing one carries the error and
+        the rest go out in another call. A session that drops after delivering is
+        reconnected; a connection that cannot be opened, or drops before delivering
+        anything, fails the rest of the batch with that error.
+        """
+        results = []
+        messages = list(messages)
+        while messages:
+            progress = _Progress(messages)
+            try:
+                connection = self._current()
+            except Exception as e:
+                self.close()
+                results.extend(DeliveryResult(message, False, e) for message in messages)
+                break
+            reused = self._local.sent > 0
+            try:
+                connection.send_messages(progress)
+            except Exception as e:
+                # The session state is unknown after an error, start a fresh one
+                self.close()
+                done = progress.position
+                results.extend(DeliveryResult(message, True) for message in messages[:done])
+                if isinstance(e, CONNECTION_ERRORS):
+                    # Reconnect only if this session got somewhere; otherwise the server is unreachable
+                    if reused or done:
+                        messages = messages[done:]
+                        continue
+                    results.extend(DeliveryResult(message, False, e) for message in messages[done:])
+                    break
+                results.append(DeliveryResult(messages[done], False, e))
+                messages = messages[done + 1:]
+                continue
+            self._local.sent += len(messages)
+            results.extend(DeliveryResult(message, True) for message in messages)
+            break
+        return results
+
+    def send(self, message):
+        """Send one message over the pooled connection, raising its delivery error"""
+        result = self.send_batch([message])[0]
+        if result.error is not None:
+            raise result.error
+        return 1
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+
+pool = ConnectionPool()
+
+
+def dispatch(messages, batch_size=None, connection_pool=None):
+    """Send messages in batches over pooled connections. Returns one DeliveryResult per message."""
+    connection_pool = connection_pool or pool
+    batch_size = batch_size or getattr(settings, 'EMAIL_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    messages = list(messages)
+    results = []
+    for start in range(0, len(messages), batch_size):
+        results.extend(connection_pool.send_batch(messages[start:start + batch_size]))
+    return results
+
+
+def send_messages(messages, fail_silently=False, connection=None):
+    """
+    Replacement for send_mail() at call sites. Uses the given connection or the pool,
+    raises the first delivery error unless fail_silently, and returns the number sent.
+    """
+    if connection is not None:
+        return connection.send_messages(list(messages)) or 0
+    results = dispatch(messages)
+    if not fail_silently:
+        for result in results:
+            if result.error is not None:
+                raise result.error
+    return sum(1 for result in results if result.sent)
@@ -0,0 +1,132 @@
+import statistics
+import time
+from datetime import datetime, timedelta
+from django.contrib import admin
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import connection, reset_queries
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from accounts.models import ProviderProfile, User
+from appointments.models import Appointment
+from patients.models import Patient
+
+BENCH_DOMAIN = 'bench.mediconnect.test'
+SLOTS_PER_DAY = 16
+BATCH_SIZE = 5000
+
+class Command(BaseCommand):
+    help = (
+        'Seed benchmark patients, providers and appointments (idempotent) and time the '
+        'Appointment and Patient admin changelists, with and without exact counts'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--appointments', type=int, default=1_000_000)
+        parser.add_argument('--patients', type=int, default=50_000)
+        parser.add_argument('--providers', type=int, default=500)
+        parser.add_argument('--runs', type=int, default=5, help='Requests per scenario; the median is reported')
+        parser.add_argument('--skip-seed', action='store_true')
+
+    def handle(self, *args, **options):
+        if not options['skip_seed']:
+            self.seed(options['patients'], options['providers'], options['appointments'])
+
+        superuser = User.objects.filter(email=f'admin@{BENCH_DOMAIN}').first() or User.objects.create_superuser(
+            f'admin@{BENCH_DOMAIN}', None, username=f'admin@{BENCH_DOMAIN}'
+        )
+        scenarios = [
+            (Appointment, 'first page', {}),
+            (Appointment, 'page 200', {'p': '200'}),
+            (Appointment, 'status filter', {'status__exact': 'SCHEDULED'}),
+            (Appointment, 'email search', {'q': 'patient-1234@'}),
+            (Appointment, 'name search', {'q': 'Provider42'}),
+            (Patient, 'first page', {}),
+            (Patient, 'email search', {'q': 'patient-777'}),
+            (Patient, 'phone search', {'q': '+1555000012'}),
+        ]
+        for model, label, params in scenarios:
+            model_admin = admin.site._registry[model]
+            fast = self.time_changelist(model_admin, params, superuser, options['runs'])
+            # What Django does out of the box: exact COUNT(*) per page plus the full-table count
+            paginator, show_full = model_admin.paginator, model_admin.show_full_result_count
+            model_admin.paginator, model_admin.show_full_result_count = Paginator, True
+            try:
+                exact = self.time_changelist(model_admin, params, superuser, options['runs'])
+            finally:
+                model_admin.paginator, model_admin.show_full_result_count = paginator, show_full
+            self.stdout.write(
+                f'{model.__name__:12} {label:14} {fast[0]:9.1f} ms ({fast[1]} queries)'
+                f'   exact counts: {exact[0]:9.1f} ms ({exact[1]} queries)'
+            )
+
+    def time_changelist(self, model_admin, params, user, runs):
+        factory = RequestFactory()
+        timings = []
+        for _ in range(runs):
+            request = factory.get('/admin/', params)
+            request.user = user
+            # Keep the DEBUG query log from hitting its cap between runs
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                model_admin.changelist_view(request).render()
+                timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings), len(queries)
+
+    def seed(self, patients, providers, appointments):
+        self.stdout.write('Seeding benchmark data...')
+        self.seed_users('patient', patients)
+        self.seed_users('provider', providers)
+
+        provider_users = User.objects.filter(email__endswith=f'@{BENCH_DOMAIN}', user_type='provider')
+        ProviderProfile.objects.bulk_create([
+            ProviderProfile(user_id=pk, license_number=f'BENCH-{pk}', specialization='General Practice')
+            for pk in provider_users.filter(providerprofile__isnull=True).values_list('pk', flat=True)
+        ], batch_size=BATCH_SIZE)
+
+        patient_ids = list(
+            User.objects.filter(email__endswith=f'@{BENCH_DOMAIN}', user_type='patient').values_list('pk', flat=True)
+        )
+        Patient.objects.bulk_create([
+            Patient(user_id=pk, gender='O', phone_number=f'+1555{pk:07d}')
+            for pk in User.objects.filter(pk__in=patient_ids, patient__isnull=True).values_list('pk', flat=True)
+        ], batch_size=BATCH_SIZE)
+
+        provider_ids = list(
+            ProviderProfile.objects.filter(license_number__startswith='BENCH-').values_list('pk', flat=True)
+        )
+        existing = Appointment.objects.filter(provider_id__in=provider_ids).count()
+        # Each provider gets SLOTS_PER_DAY distinct slots a day, spread a year either side of today
+        first_day = timezone.localdate() - timedelta(days=365)
+        batch = []
+        for n in range(existing, appointments):
+            slot = n // len(provider_ids)
+            day = first_day + timedelta(days=slot // SLOTS_PER_DAY)
+            at = (datetime.min + timedelta(hours=9, minutes=30 * (slot % SLOTS_PER_DAY))).time()
+            appointment = Appointment(
+                patient_id=patient_ids[n % len(patient_ids)], provider_id=provider_ids[n % len(provider_ids)],
+                date=day, time=at, reason='Benchmark',
+                status='SCHEDULED' if day >= timezone.localdate() else 'COMPLETED',
+            )
+            appointment.sync_window()
+            batch.append(appointment)
+            if len(batch) == BATCH_SIZE:
+                Appointment.objects.bulk_create(batch)
+                batch = []
+        Appointment.objects.bulk_create(batch)
+        # Let the planner see the new row counts
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def seed_users(self, user_type, count):
+        existing = User.objects.filter(email__endswith=f'@{BENCH_DOMAIN}', user_type=user_type).count()
+        label = user_type.capitalize()
+        User.objects.bulk_create([
+            User(
+                email=f'{user_type}-{n}@{BENCH_DOMAIN}', username=f'{user_type}-{n}@{BENCH_DOMAIN}',
+                first_name=f'{label}{n}', last_name='Bench', user_type=user_type, password='!',
+            )
+            for n in range(existing, count)
+        ], batch_size=BATCH_SIZE)
@@ -0,0 +1,49 @@
+import time
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from Healthcore.mail import ConnectionPool, dispatch
+from Healthcore.smtp_sink import SMTPSink
+
+SMTP_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+
+class Command(BaseCommand):
+    help = 'Compare per-message SMTP connections with the pooled, batched dispatcher against a local SMTP sink'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=500)
+        parser.add_argument('--batch-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        count = options['messages']
+        sink = SMTPSink().start()
+        try:
+            with override_settings(
+                EMAIL_BACKEND=SMTP_BACKEND, EMAIL_HOST='127.0.0.1', EMAIL_PORT=sink.port,
+                EMAIL_USE_TLS=False, EMAIL_USE_SSL=False, EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='',
+            ):
+                messages = [
+                    EmailMessage(f'Benchmark {n}', 'body', 'bench@mediconnect.test', ['patient@mediconnect.test'])
+                    for n in range(count)
+                ]
+
+                # What send_mail() does at every call site: a fresh connection per message
+                start = time.perf_counter()
+                for message in messages:
+                    get_connection().send_messages([message])
+                unpooled = time.perf_counter() - start
+                unpooled_connections = sink.connections
+
+                pool = ConnectionPool()
+                start = time.perf_counter()
+                results = dispatch(messages, batch_size=options['batch_size'], connection_pool=pool)
+                pooled = time.perf_counter() - start
+                pool.close()
+                pooled_connections = sink.connections - unpooled_connections
+        finally:
+            sink.stop()
+
+        failed = sum(1 for result in results if not result.sent)
+        self.stdout.write(f'Per-message connections: {count / unpooled:8.1f} msg/s ({unpooled_connections} connections)')
+        self.stdout.write(f'Pooled dispatcher:       {count / pooled:8.1f} msg/s ({pooled_connections} connections, {failed} failed)')
+        self.stdout.write(self.style.SUCCESS(f'Speed-up: {unpooled / pooled:.1f}x'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from Healthcore.smtp_sink import SMTPSink
+
+class Command(BaseCommand):
+    help = 'Run a local SMTP server that accepts and discards all mail'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=1025)
+
+    def handle(self, *args, **options):
+        sink = SMTPSink(options['host'], options['port'])
+        self.stdout.write(self.style.SUCCESS(f'SMTP sink listening on {options["host"]}:{sink.port}'))
+        try:
+            sink.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sink.server_close()
+            self.stdout.write(f'Accepted {sink.messages} messages over {sink.connections} connections')
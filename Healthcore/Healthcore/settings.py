@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -40,6 +41,7 @@ DEFAULT_FROM_EMAIL = 'MediConnect <noreply@mediconnect.com>'
 # Application definition
 
 INSTALLED_APPS = [
+    'daphne',  # ASGI runserver, so WebSockets work in development too
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -78,6 +80,34 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = 'your-email@gmail.com'
 EMAIL_HOST_PASSWORD = 'your-app-password'
 
+# How long an email verification link stays valid (accounts/verification.py)
+EMAIL_VERIFICATION_TOKEN_SECONDS = 48 * 60 * 60
+
+# Pooled mail dispatch (Healthcore/mail.py)
+EMAIL_BATCH_SIZE = 50
+EMAIL_POOL_MAX_MESSAGES = 100  # Recycle an SMTP session after this many messages
+EMAIL_POOL_MAX_AGE = 60  # ...or after this many seconds
+
+# How long a patient keeps a slot reserved while filling in the booking form
+SLOT_HOLD_SECONDS = 300
+
+# How long a freed slot stays reserved for the waitlisted patient it was offered to
+WAITLIST_OFFER_SECONDS = 1800
+
+# Minutes before an appointment starts at which process_reminders emails a reminder
+REMINDER_OFFSETS = (24 * 60, 60)
+
+# Versioned JSON API (appointments/api.py), mounted at /api/v1/
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAuthenticated'],
+    # Machine clients only need JSON; the browsable API renders full templates
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+}
+
 # Crispy Forms
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
@@ -87,6 +117,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.roles.RoleMiddleware',
     'allauth.account.middleware.AccountMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -104,12 +135,28 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'accounts.roles.role',
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'Healthcore.wsgi.application'
+ASGI_APPLICATION = 'Healthcore.asgi.application'
+
+# Channel layer for WebSocket push (appointments/events.py). The in-memory layer only
+# reaches consumers in the same process; set REDIS_URL when running several workers.
+if os.environ.get('REDIS_URL'):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [os.environ['REDIS_URL']]},
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+    }
 
 
 # Database
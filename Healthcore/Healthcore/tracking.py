@@ -0,0 +1,102 @@
+"""
+Dirty-field tracking for models.
+
+FieldTrackerMixin snapshots field values when an instance is loaded from the
+database (or saved), so code can ask what changed without re-reading the row.
+The snapshot is refreshed after save() returns, which means post_save
+receivers still see the pre-save values.
+"""
+from copy import deepcopy
+from django.db.models.fields.files import FieldFile
+
+
+def _frozen(value):
+    # Copy mutable values so in-place edits show up as changes; files compare by name
+    if isinstance(value, FieldFile):
+        return value.name
+    if isinstance(value, (dict, list)):
+        return deepcopy(value)
+    return value
+
+
+class FieldTrackerMixin:
+    # Limit tracking to these field names; None tracks every concrete field
+    tracked_fields = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._take_snapshot()
+        return instance
+
+    def _tracked(self):
+        for field in self._meta.concrete_fields:
+            if self.tracked_fields is None or field.name in self.tracked_fields:
+                yield field
+
+    def _take_snapshot(self, field_names=None):
+        # Deferred fields are missing from __dict__ and stay untracked
+        snapshot = {
+            field.attname: _frozen(self.__dict__[field.attname])
+            for field in self._tracked()
+            if field.attname in self.__dict__
+            and (field_names is None or field.name in field_names or field.attname in field_names)
+        }
+        if field_names is not None and self.is_tracked:
+            self._loaded_values.update(snapshot)
+        else:
+            self._loaded_values = snapshot
+
+    @property
+    def is_tracked(self):
+        """False for instances that were never loaded or saved"""
+        return hasattr(self, '_loaded_values')
+
+    def get_changed_fields(self):
+        """Return {field_name: (old_value, new_value)} for fields changed since load or last save"""
+        if not self.is_tracked:
+            return {field.name: (None, self.__dict__.get(field.attname)) for field in self._tracked()}
+        changed = {}
+        for field in self._tracked():
+            if field.attname not in self._loaded_values or field.attname not in self.__dict__:
+                continue
+            old, new = self._loaded_values[field.attname], self.__dict__[field.attname]
+            if old != new:
+                changed[field.name] = (old, new)
+        return changed
+
+    def has_changed(self, field_name):
+        return field_name in self.get_changed_fields()
+
+    def previous_value(self, field_name):
+        """Value of field_name as of the last load or save"""
+        field = self._meta.get_field(field_name)
+        return getattr(self, '_loaded_values', {}).get(field.attname)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Fields left out of update_fields were not written and stay dirty
+        update_fields = kwargs.get('update_fields')
+        self._take_snapshot(set(update_fields) if update_fields is not None else None)
+
+    def save_changed(self, **kwargs):
+        """
+        Save only the changed fields (plus auto_now fields) with update_fields.
+        New or untracked instances get a full save. Returns True if a write happened.
+        """
+        if self._state.adding or not self.is_tracked:
+            self.save(**kwargs)
+            return True
+        changed = list(self.get_changed_fields())
+        if not changed:
+            return False
+        changed += [
+            field.name for field in self._meta.concrete_fields
+            if getattr(field, 'auto_now', False) and field.name not in changed
+        ]
+        self.save(update_fields=changed, **kwargs)
+        return True
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._take_snapshot(set(fields) if fields is not None else None)
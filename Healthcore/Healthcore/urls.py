@@ -24,6 +24,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/', include('accounts.urls')),
     path('appointments/', include('appointments.urls')),
+    path('api/v1/', include('appointments.api_urls')),
     path('', views.homepage, name='homepage'),
 ]
 
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Profile, ProviderProfile
+from .models import EmailVerificationToken, User, Profile, ProviderProfile
 
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
@@ -26,3 +26,10 @@ class ProviderProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'specialization', 'license_number')
     list_filter = ('specialization',)
     search_fields = ('user__email', 'license_number', 'specialization')
+
+@admin.register(EmailVerificationToken)
+class EmailVerificationTokenAdmin(admin.ModelAdmin):
+    # Only the hash is stored, so there is nothing useful to edit
+    list_display = ('user', 'created_at', 'expires_at')
+    raw_id_fields = ('user',)
+    readonly_fields = ('user', 'token_hash', 'created_at', 'expires_at')
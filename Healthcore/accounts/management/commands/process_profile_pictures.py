@@ -0,0 +1,35 @@
+import time
+from django.core.management.base import BaseCommand
+from accounts.pictures import DEFAULT_BATCH_SIZE, process_pending, queue_unprocessed
+
+class Command(BaseCommand):
+    help = 'Render the avatar, thumbnail and full-size renditions of newly uploaded profile pictures'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting when nothing is pending')
+        parser.add_argument('--sleep', type=float, default=5.0, help='Seconds to wait between polls in --loop mode')
+        parser.add_argument(
+            '--backfill', action='store_true',
+            help='First queue every user whose picture has no renditions yet (pictures uploaded before the worker existed)',
+        )
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            self.stdout.write(f'{queue_unprocessed()} pictures queued')
+
+        total_processed = total_failed = 0
+        while True:
+            processed, failed = process_pending(options['batch_size'])
+            total_processed += processed
+            total_failed += failed
+            if processed or failed:
+                self.stdout.write(f'Batch processed: {processed} rendered, {failed} unreadable')
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Profile pictures processed: {total_processed} rendered, {total_failed} unreadable')
+        )
@@ -0,0 +1,8 @@
+from django.core.management.base import BaseCommand
+from accounts.verification import purge_expired
+
+class Command(BaseCommand):
+    help = 'Delete expired email verification links'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f'{purge_expired()} expired verification tokens deleted'))
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:31
+
+import hashlib
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+# Links already sent stay valid for this long after the upgrade
+CARRIED_OVER_TTL = timedelta(days=2)
+
+
+def carry_over_tokens(apps, schema_editor):
+    User = apps.get_model('accounts', 'User')
+    EmailVerificationToken = apps.get_model('accounts', 'EmailVerificationToken')
+    expires_at = timezone.now() + CARRIED_OVER_TTL
+    pending = User.objects.filter(is_email_verified=False).exclude(email_verification_token='')
+    batch = []
+    for pk, token in pending.values_list('pk', 'email_verification_token').iterator(chunk_size=2000):
+        batch.append(EmailVerificationToken(
+            user_id=pk, token_hash=hashlib.sha256(token.encode()).hexdigest(), expires_at=expires_at,
+        ))
+        if len(batch) >= 2000:
+            EmailVerificationToken.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    EmailVerificationToken.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_user_picture_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailVerificationToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token_hash', models.CharField(max_length=64, unique=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='verification_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(carry_over_tokens, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='user',
+            name='email_verification_token',
+        ),
+    ]
@@ -1,10 +1,11 @@
 from django.contrib.auth.models import AbstractUser 
 from django.db import models
+from django.db.models.functions import Lower
 from django.utils import timezone
-from PIL import Image
+from Healthcore.tracking import FieldTrackerMixin
 from .managers import CustomUserManager  # Import the custom user manager
 
-class User(AbstractUser):
+class User(FieldTrackerMixin, AbstractUser):
     #Custom User model extending Django's AbstractUser
     USER_TYPES = (
         ('patient', 'Patient'),
@@ -17,8 +18,12 @@ class User(AbstractUser):
     phone_number = models.CharField(max_length=15, blank=True)
     date_of_birth = models.DateField(null=True, blank=True)
     profile_picture = models.ImageField(upload_to='profile_pics/', default='default.jpg')
+    # sha256 of the picture; its sized renditions are stored under renditions/<hash>/ (accounts/pictures.py).
+    # 'unreadable' once the worker failed to decode it, '' until it has been processed
+    picture_hash = models.CharField(max_length=64, blank=True, editable=False)
+    # Set when a new picture is waiting for the process_profile_pictures worker
+    picture_pending = models.BooleanField(default=False, editable=False)
     is_email_verified = models.BooleanField(default=False)
-    email_verification_token = models.CharField(max_length=100, blank=True)    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     objects = CustomUserManager()  #Add this line
@@ -26,25 +31,31 @@ class User(AbstractUser):
     # Required fields for registration
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['user_type']
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Case-insensitive prefix search in the admin changelists (Healthcore/changelist.py)
+            models.Index(Lower('email'), name='user_email_lower_idx'),
+            models.Index(Lower('last_name'), name='user_last_name_lower_idx'),
+            models.Index(Lower('first_name'), name='user_first_name_lower_idx'),
+            # The picture worker's queue
+            models.Index(fields=['id'], name='user_picture_pending_idx', condition=models.Q(picture_pending=True)),
+        ]
     
     def __str__(self):
         return f"{self.get_full_name()} ({self.user_type})"
     
     def save(self, *args, **kwargs):
+        # Saves never open the image: a new picture is queued for the process_profile_pictures
+        # worker, which renders its sizes off the request path
+        if self.has_changed('profile_picture'):
+            self.picture_pending = bool(self.profile_picture)
+            self.picture_hash = ''
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'profile_picture' in update_fields:
+                kwargs['update_fields'] = set(update_fields) | {'picture_pending', 'picture_hash'}
         super().save(*args, **kwargs)
-        
-        #Resize profile picture
-        if self.profile_picture and hasattr(self.profile_picture, 'path'):
-            try:
-                img = Image.open(self.profile_picture.path)
-                if img.height > 300 or img.width > 300:
-                    output_size = (300, 300)
-                    img.thumbnail(output_size)
-                    img.save(self.profile_picture.path)
-            except Exception:
-                pass
-                
-                
+
     @property
     def full_name(self):
         return f"{self.first_name} {self.last_name}".strip()
@@ -56,7 +67,17 @@ class User(AbstractUser):
             return (today - self.date_of_birth).days // 365
         return None
         
-class Profile(models.Model):
+class EmailVerificationToken(models.Model):
+    #Single-use email verification link (accounts/verification.py); only a hash of the token is stored
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='verification_tokens')
+    token_hash = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Verification token for {self.user_id} (expires {self.expires_at:%Y-%m-%d %H:%M})"
+
+class Profile(FieldTrackerMixin, models.Model):
     #Extended profile information for users
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     bio = models.TextField(max_length=500, blank=True)
@@ -71,7 +92,7 @@ class Profile(models.Model):
     def __str__(self):
         return f"{self.user.username}'s Profile"
     
-class ProviderProfile(models.Model):
+class ProviderProfile(FieldTrackerMixin, models.Model):
     #Additional profile information for healthcare providers 
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     license_number = models.CharField(max_length=50, unique=True)
@@ -80,6 +101,7 @@ class ProviderProfile(models.Model):
     hospital_affiliation = models.CharField(max_length=200, blank=True)
     consultation_fee = models.DecimalField(max_digits=8, decimal_places=2, default=0.00)
     availability_hours = models.JSONField(default=dict)  #Store schedule as JSON
+    updated_at = models.DateTimeField(auto_now=True)  #Drives API ETags
     
     def __str__(self):
         return f"Dr. {self.user.get_full_name()} - {self.specialization}"
@@ -0,0 +1,110 @@
+"""
+Profile picture renditions.
+
+Saving a user never opens its picture; a new upload only marks the user
+picture_pending. The process_profile_pictures worker reads each pending
+picture once, hashes its content and renders every size in RENDITIONS under
+renditions/<hash>/ in the default storage. Renditions are keyed by content, so
+a picture already rendered (the default one, or the same photo uploaded twice)
+is hashed but not decoded again.
+
+Templates ask for the size they display with {% picture_url user 'avatar' %}
+(accounts/templatetags/pictures.py); users whose picture has not been
+processed yet get the original upload.
+"""
+import hashlib
+from io import BytesIO
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# name: (width, height, crop to exactly that size rather than fit inside it)
+RENDITIONS = {
+    'avatar': (48, 48, True),
+    'thumb': (150, 150, True),
+    'full': (600, 600, False),
+}
+RENDITION_DIR = 'renditions'
+JPEG_QUALITY = 85
+DEFAULT_BATCH_SIZE = 50
+# Stored in picture_hash for a picture that could not be read, so a backfill does not queue it again
+UNREADABLE = 'unreadable'
+
+
+def rendition_name(digest, size):
+    return f'{RENDITION_DIR}/{digest[:2]}/{digest}/{size}.jpg'
+
+
+def picture_url(user, size='full'):
+    """URL of user's picture at one of the RENDITIONS sizes, or of the original until it is processed"""
+    if size not in RENDITIONS:
+        raise ValueError(f'Unknown picture size {size!r}')
+    if user.picture_hash and user.picture_hash != UNREADABLE:
+        return default_storage.url(rendition_name(user.picture_hash, size))
+    return user.profile_picture.url if user.profile_picture else ''
+
+
+def _render(image, width, height, crop):
+    if crop:
+        return ImageOps.fit(image, (width, height), Image.LANCZOS)
+    image = image.copy()
+    image.thumbnail((width, height), Image.LANCZOS)
+    return image
+
+
+def render_renditions(name):
+    """
+    Hash the stored picture `name` and write whichever of its renditions are
+    missing. Returns the hash; raises OSError if the file cannot be read or decoded.
+    """
+    with default_storage.open(name, 'rb') as picture:
+        data = picture.read()
+    digest = hashlib.sha256(data).hexdigest()
+    missing = [size for size in RENDITIONS if not default_storage.exists(rendition_name(digest, size))]
+    if not missing:
+        return digest
+
+    image = Image.open(BytesIO(data))
+    # Phones store rotation in EXIF; JPEG has no alpha channel
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    for size in missing:
+        output = BytesIO()
+        _render(image, *RENDITIONS[size]).save(output, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+        default_storage.save(rendition_name(digest, size), ContentFile(output.getvalue()))
+    return digest
+
+
+def process_pending(batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Render one batch of pending pictures; returns (processed, failed). A picture
+    that cannot be read is marked UNREADABLE and the user keeps the original
+    until they upload a new one. Each user is cleared with a conditional update
+    on the picture it was rendered from, so one replaced meanwhile stays pending
+    for the next batch.
+    """
+    User = get_user_model()
+    batch = list(
+        User.objects.filter(picture_pending=True).order_by('id').values_list('id', 'profile_picture')[:batch_size]
+    )
+    processed = failed = 0
+    digests = {}
+    for pk, name in batch:
+        if name not in digests:
+            try:
+                digests[name] = render_renditions(name)
+            except (OSError, ValueError, Image.DecompressionBombError):
+                digests[name] = UNREADABLE
+        if digests[name] == UNREADABLE:
+            failed += 1
+        else:
+            processed += 1
+        User.objects.filter(pk=pk, profile_picture=name).update(picture_hash=digests[name], picture_pending=False)
+    return processed, failed
+
+
+def queue_unprocessed():
+    """Mark every user whose picture was never processed as pending; returns how many"""
+    return get_user_model().objects.filter(picture_hash='', picture_pending=False).exclude(
+        profile_picture=''
+    ).update(picture_pending=True)
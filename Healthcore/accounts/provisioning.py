@@ -0,0 +1,259 @@
+"""
+Bulk user provisioning from CSV, for onboarding a clinic.
+
+Each row creates a User with its Profile and, by user_type, a ProviderProfile
+or a patients.Patient. Rows are validated in batches against lookup sets
+filled with one query per batch (emails, usernames, licence numbers), and each
+batch is inserted with one bulk_create per table in a single transaction.
+
+Password hashing is deliberately slow, so it dominates an import: a batch's
+hashes are computed across a process pool while the parent validates the next
+batch and writes the previous one. bulk_create skips User.save and the post_save signals, which is fine
+here as neither does anything a brand new account needs.
+"""
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import NamedTuple
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from patients.models import Patient
+from .models import Profile, ProviderProfile, User
+
+PROVISION_BATCH_SIZE = 500
+USER_TYPES = ('patient', 'provider')
+
+PROFILE_FIELDS = ('bio', 'address', 'city', 'state', 'zip_code', 'emergency_contact_name', 'emergency_contact_phone')
+PATIENT_FIELDS = (
+    'address', 'emergency_contact_name', 'emergency_contact_phone', 'allergies', 'medical_conditions',
+    'current_medications', 'insurance_provider', 'insurance_policy_number',
+)
+
+
+class ProvisionResult(NamedTuple):
+    created: int
+    # [(line number, message), ...] for every row that was skipped
+    errors: list
+    seconds: float
+
+    @property
+    def rate(self):
+        """Users created per second"""
+        return self.created / self.seconds if self.seconds else 0.0
+
+
+def read_rows(stream):
+    """Yield (line number, dict) for each CSV record, with keys and values stripped"""
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, {
+            (key or '').strip(): (value or '').strip() for key, value in row.items() if key is not None
+        }
+
+
+def _init_worker():
+    # Forked workers inherit the configured settings; spawned ones have to load them
+    django.setup()
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
+def _parse_decimal(value, name):
+    try:
+        return Decimal(value) if value else None
+    except InvalidOperation:
+        raise ValueError(f'{name} must be a number')
+
+
+def _check_fields(instance, exclude):
+    # Lengths, digits and validators up front: bulk_create would insert them unchecked
+    # on SQLite and abort the whole import with a DataError on PostgreSQL
+    try:
+        instance.clean_fields(exclude=exclude)
+    except ValidationError as e:
+        raise ValueError('; '.join(f'{name}: {" ".join(messages)}' for name, messages in e.message_dict.items()))
+
+
+class UserProvisioner:
+    """
+    Validates and inserts user records batch by batch. Passwords are hashed by
+    `workers` processes (in this process when workers is 1); the pool lives as
+    long as the provisioner is used as a context manager.
+    """
+    genders = {value for value, _ in Patient.GENDER_CHOICES}
+    blood_types = {value for value, _ in Patient.BLOOD_TYPES}
+
+    def __init__(self, batch_size=PROVISION_BATCH_SIZE, workers=None, dry_run=False, verified=False):
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.dry_run = dry_run
+        self.verified = verified
+        self.pool = None
+        # Seen in the file so far; the database is checked batch by batch
+        self.emails, self.usernames, self.licenses = set(), set(), set()
+
+    def __enter__(self):
+        if self.workers > 1 and not self.dry_run:
+            self.pool = ProcessPoolExecutor(self.workers, initializer=_init_worker)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def run(self, rows):
+        """Provision (line number, dict) records; returns a ProvisionResult"""
+        started = time.monotonic()
+        created, errors, batch, pending = 0, [], [], None
+        for record in rows:
+            batch.append(record)
+            if len(batch) == self.batch_size:
+                # Hash this batch while the previous one is written
+                prepared = self.prepare_batch(batch, errors)
+                if pending is not None:
+                    created += self.write_batch(*pending)
+                pending, batch = prepared, []
+        if pending is not None:
+            created += self.write_batch(*pending)
+        if batch:
+            created += self.provision_batch(batch, errors)
+        return ProvisionResult(created, errors, time.monotonic() - started)
+
+    def hash_passwords(self, passwords):
+        """
+        Hashes for passwords, in order. With a pool the work is submitted at once
+        and the returned iterator waits for it; blank passwords get an unusable hash
+        (the user sets one through password reset).
+        """
+        passwords = [password or None for password in passwords]
+        if self.pool is None:
+            return [make_password(password) for password in passwords]
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        return self.pool.map(make_password, passwords, chunksize=chunksize)
+
+    def _taken(self, batch):
+        # One query per unique column for the whole batch
+        emails = {User.objects.normalize_email(row.get('email', '')) for _, row in batch} - {''}
+        # Stored addresses keep the case of their local part
+        emails |= {email.lower() for email in emails}
+        usernames = {row.get('username') or row.get('email', '') for _, row in batch} - {''}
+        licenses = {row.get('license_number', '') for _, row in batch} - {''}
+        return (
+            {email.lower() for email in User.objects.filter(email__in=emails).values_list('email', flat=True)},
+            set(User.objects.filter(username__in=usernames).values_list('username', flat=True)),
+            set(ProviderProfile.objects.filter(license_number__in=licenses).values_list('license_number', flat=True)),
+        )
+
+    def build(self, row, taken):
+        """Unsaved (User, Profile, ProviderProfile or Patient) for a record, or raise ValueError"""
+        taken_emails, taken_usernames, taken_licenses = taken
+        email = User.objects.normalize_email(row.get('email', ''))
+        try:
+            validate_email(email)
+        except ValidationError:
+            raise ValueError(f'Invalid email {email!r}')
+        if email.lower() in taken_emails or email.lower() in self.emails:
+            raise ValueError(f'A user with email {email!r} already exists')
+        username = row.get('username') or email
+        if username in taken_usernames or username in self.usernames:
+            raise ValueError(f'Username {username!r} is taken')
+        user_type = row.get('user_type', '').lower()
+        if user_type not in USER_TYPES:
+            raise ValueError(f'user_type must be one of {", ".join(USER_TYPES)}')
+        try:
+            date_of_birth = _parse_date(row.get('date_of_birth'))
+        except ValueError:
+            raise ValueError('date_of_birth must be YYYY-MM-DD')
+
+        user = User(
+            email=email, username=username, user_type=user_type,
+            first_name=row.get('first_name', ''), last_name=row.get('last_name', ''),
+            phone_number=row.get('phone_number', ''), date_of_birth=date_of_birth,
+            is_email_verified=self.verified,
+        )
+        profile = Profile(**{name: row.get(name, '') for name in PROFILE_FIELDS})
+
+        if user_type == 'provider':
+            license_number = row.get('license_number', '')
+            if not license_number or not row.get('specialization'):
+                raise ValueError('Providers need a license_number and a specialization')
+            if license_number in taken_licenses or license_number in self.licenses:
+                raise ValueError(f'License number {license_number!r} is already registered')
+            try:
+                years = int(row.get('years_of_experience') or 0)
+            except ValueError:
+                raise ValueError('years_of_experience must be a whole number')
+            detail = ProviderProfile(
+                license_number=license_number, specialization=row['specialization'],
+                years_of_experience=years, hospital_affiliation=row.get('hospital_affiliation', ''),
+                consultation_fee=_parse_decimal(row.get('consultation_fee'), 'consultation_fee') or Decimal('0.00'),
+            )
+        else:
+            gender = row.get('gender', '').upper()
+            if gender not in self.genders:
+                raise ValueError(f'gender must be one of {", ".join(sorted(self.genders))}')
+            blood_type = row.get('blood_type', '').upper()
+            if blood_type and blood_type not in self.blood_types:
+                raise ValueError(f'Invalid blood_type {blood_type!r}')
+            detail = Patient(
+                date_of_birth=date_of_birth, gender=gender, blood_type=blood_type,
+                phone_number=row.get('phone_number', ''),
+                height=_parse_decimal(row.get('height'), 'height'),
+                weight=_parse_decimal(row.get('weight'), 'weight'),
+                **{name: row.get(name, '') for name in PATIENT_FIELDS},
+            )
+        # The password is hashed later and the user links are set on insert
+        _check_fields(user, exclude=['password'])
+        _check_fields(profile, exclude=['user'])
+        _check_fields(detail, exclude=['user', 'availability_hours'])
+
+        self.emails.add(email.lower())
+        self.usernames.add(username)
+        if user_type == 'provider':
+            self.licenses.add(license_number)
+        return user, profile, detail
+
+    def prepare_batch(self, batch, errors):
+        """Validate a batch and start hashing its passwords; returns (accepted, hashes)"""
+        taken = self._taken(batch)
+        accepted, passwords, rejected = [], [], []
+        for line_number, row in batch:
+            try:
+                accepted.append(self.build(row, taken))
+                passwords.append(row.get('password', ''))
+            except ValueError as e:
+                rejected.append((line_number, str(e)))
+        errors.extend(rejected)
+        if not accepted or self.dry_run:
+            return accepted, None
+        return accepted, self.hash_passwords(passwords)
+
+    def write_batch(self, accepted, hashes):
+        """Insert a prepared batch in one transaction; returns the number of users"""
+        if not accepted or self.dry_run:
+            return len(accepted)
+        for (user, _, _), password in zip(accepted, hashes):
+            user.password = password
+        with transaction.atomic():
+            users = User.objects.bulk_create([user for user, _, _ in accepted])
+            for user, (_, profile, detail) in zip(users, accepted):
+                profile.user = user
+                detail.user = user
+            Profile.objects.bulk_create([profile for _, profile, _ in accepted])
+            ProviderProfile.objects.bulk_create(
+                [detail for _, _, detail in accepted if isinstance(detail, ProviderProfile)]
+            )
+            Patient.objects.bulk_create([detail for _, _, detail in accepted if isinstance(detail, Patient)])
+        return len(accepted)
+
+    def provision_batch(self, batch, errors):
+        return self.write_batch(*self.prepare_batch(batch, errors))
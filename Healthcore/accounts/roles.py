@@ -0,0 +1,71 @@
+"""
+Request-scoped user roles.
+
+RoleMiddleware puts a Role on every request as request.role, resolved the first
+time it is used: patients cost no query, other users one ProviderProfile
+lookup, cached on request.user.providerprofile as well. Views check
+request.role instead of hasattr(request.user, 'providerprofile'), which queries
+on every call and raises for patients; templates get it as {{ role }} through
+the role context processor.
+"""
+from django.utils.functional import SimpleLazyObject
+from .models import ProviderProfile
+
+
+class Role:
+    """What the signed-in user is: their user_type and, for providers, their ProviderProfile"""
+
+    def __init__(self, user, provider=None):
+        self.user = user
+        self.provider = provider
+
+    @property
+    def user_type(self):
+        return self.user.user_type if self.user.is_authenticated else None
+
+    @property
+    def is_patient(self):
+        return self.user_type == 'patient'
+
+    @property
+    def is_provider(self):
+        return self.provider is not None
+
+    @property
+    def is_admin(self):
+        return self.user_type == 'admin'
+
+    def can_access(self, appointment):
+        """True for the appointment's patient and provider; compares ids, so nothing is loaded"""
+        if not self.user.is_authenticated:
+            return False
+        if appointment.patient_id == self.user.pk:
+            return True
+        return self.provider is not None and appointment.provider_id == self.provider.pk
+
+
+def get_role(user):
+    if not user.is_authenticated or user.user_type == 'patient':
+        return Role(user)
+    provider = ProviderProfile.objects.filter(user=user).first()
+    if provider is not None:
+        # Later user.providerprofile reads hit this cache instead of the database
+        user.providerprofile = provider
+    return Role(user, provider)
+
+
+class RoleMiddleware:
+    """Sets request.role; must come after AuthenticationMiddleware"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Read request.user when the role is first used: API authentication replaces it after the middleware ran
+        request.role = SimpleLazyObject(lambda: get_role(request.user))
+        return self.get_response(request)
+
+
+def role(request):
+    """Template context processor exposing request.role as {{ role }}"""
+    return {'role': getattr(request, 'role', None)}
@@ -0,0 +1,10 @@
+from django import template
+from accounts.pictures import picture_url as rendition_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture_url(user, size='full'):
+    """{% picture_url user 'avatar' %}: URL of the user's picture at that size"""
+    return rendition_url(user, size)
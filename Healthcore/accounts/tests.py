@@ -1,3 +1,322 @@
-from django.test import TestCase
+import os
+import re
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+from django.core import mail
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from .models import EmailVerificationToken, Profile, ProviderProfile, User
+from .pictures import (
+    RENDITIONS, UNREADABLE, picture_url, process_pending, queue_unprocessed, render_renditions, rendition_name,
+)
+from .provisioning import UserProvisioner, read_rows as read_provision_rows
+from .verification import purge_expired, verify_token
 
-# Create your tests here.
+
+class UserTrackingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'patient@example.com', 'pass1234', username='patient', user_type='patient'
+        )
+        User.objects.filter(pk=self.user.pk).update(picture_pending=False)
+        self.user.refresh_from_db()
+
+    def test_saves_never_open_the_picture(self):
+        with mock.patch('accounts.pictures.Image.open') as image_open:
+            self.user.last_login = self.user.created_at
+            self.user.save()
+            self.user.is_email_verified = True
+            self.user.save(update_fields=['is_email_verified'])
+            self.user.profile_picture = 'profile_pics/new.jpg'
+            self.user.save(update_fields=['profile_picture'])
+        image_open.assert_not_called()
+
+    def test_new_picture_is_queued(self):
+        self.user.last_login = self.user.created_at
+        self.user.save()
+        self.assertFalse(User.objects.get(pk=self.user.pk).picture_pending)
+        User.objects.filter(pk=self.user.pk).update(picture_hash='abc')
+        self.user.profile_picture = 'profile_pics/new.jpg'
+        self.user.save(update_fields=['profile_picture'])
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.picture_pending, self.user.picture_hash), (True, ''))
+
+
+class PictureRenditionTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self, username, color='red', size=(800, 400)):
+        output = BytesIO()
+        Image.new('RGB', size, color).save(output, 'PNG')
+        user = User.objects.create_user(f'{username}@example.com', None, username=username, user_type='patient')
+        user.profile_picture = SimpleUploadedFile(f'{username}.png', output.getvalue(), content_type='image/png')
+        user.save()
+        return user
+
+    def test_pending_pictures_are_rendered_once_per_content(self):
+        first = self.upload('first')
+        self.assertEqual(process_pending(), (1, 0))
+        first.refresh_from_db()
+        self.assertFalse(first.picture_pending)
+        for size, (width, height, crop) in RENDITIONS.items():
+            with default_storage.open(rendition_name(first.picture_hash, size)) as rendition:
+                dimensions = Image.open(rendition).size
+            self.assertEqual(dimensions, (width, height) if crop else (width, height // 2))
+
+        # The same photo uploaded again is hashed but not decoded
+        second = self.upload('second')
+        with mock.patch('accounts.pictures.Image.open') as image_open:
+            self.assertEqual(process_pending(), (1, 0))
+        image_open.assert_not_called()
+        second.refresh_from_db()
+        self.assertEqual(second.picture_hash, first.picture_hash)
+        self.assertEqual(picture_url(second, 'avatar'), f'/media/{rendition_name(first.picture_hash, "avatar")}')
+        rendered = Template("{% load pictures %}{% picture_url user 'thumb' %}").render(Context({'user': second}))
+        self.assertEqual(rendered, f'/media/{rendition_name(first.picture_hash, "thumb")}')
+
+    def test_unreadable_picture_keeps_the_original(self):
+        user = User.objects.create_user('broken@example.com', None, username='broken', user_type='patient')
+        user.profile_picture = SimpleUploadedFile('broken.jpg', b'not an image', content_type='image/jpeg')
+        user.save()
+        User.objects.exclude(pk=user.pk).update(picture_pending=False)
+        self.assertEqual(process_pending(), (0, 1))
+        user.refresh_from_db()
+        self.assertEqual((user.picture_pending, user.picture_hash), (False, UNREADABLE))
+        self.assertEqual(picture_url(user, 'thumb'), user.profile_picture.url)
+        # A backfill leaves it alone; a new upload is tried again
+        self.assertEqual(queue_unprocessed(), 0)
+        user.profile_picture = SimpleUploadedFile('retry.jpg', b'still not an image', content_type='image/jpeg')
+        user.save()
+        self.assertEqual(process_pending(), (0, 1))
+
+    def test_picture_replaced_while_rendering_stays_pending(self):
+        user = self.upload('mover')
+
+        def replace_then_render(name):
+            User.objects.filter(pk=user.pk).update(profile_picture='profile_pics/newer.png')
+            return render_renditions(name)
+
+        with mock.patch('accounts.pictures.render_renditions', side_effect=replace_then_render):
+            process_pending()
+        user.refresh_from_db()
+        self.assertTrue(user.picture_pending)
+
+
+class EmailVerificationTests(TestCase):
+    def register(self, email='new@example.com'):
+        return self.client.post(reverse('accounts:register'), {
+            'username': email.split('@')[0], 'email': email, 'first_name': 'New', 'last_name': 'User',
+            'user_type': 'patient', 'password1': 'Str0ng-pass-123', 'password2': 'Str0ng-pass-123',
+        })
+
+    def link_token(self):
+        return re.search(r'/accounts/verify/([^/]+)/', mail.outbox[-1].body).group(1)
+
+    def test_registration_saves_the_user_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.register()
+        self.assertRedirects(response, reverse('accounts:login'), fetch_redirect_response=False)
+        writes = [query['sql'] for query in queries.captured_queries if query['sql'].startswith(('INSERT', 'UPDATE'))]
+        self.assertEqual(len([sql for sql in writes if 'accounts_user"' in sql.split('(')[0]]), 1)
+        self.assertEqual(EmailVerificationToken.objects.count(), 1)
+        # Only the hash is stored
+        self.assertFalse(EmailVerificationToken.objects.filter(token_hash=self.link_token()).exists())
+
+    def test_link_verifies_once(self):
+        self.register()
+        url = reverse('accounts:verify_email', args=[self.link_token()])
+        self.client.get(url)
+        self.assertTrue(User.objects.get(email='new@example.com').is_email_verified)
+        self.assertFalse(EmailVerificationToken.objects.exists())
+        self.assertIsNone(verify_token(self.link_token()))
+
+    def test_expired_link_is_rejected_and_login_sends_a_new_one(self):
+        self.register()
+        token = self.link_token()
+        EmailVerificationToken.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertIsNone(verify_token(token))
+        self.assertFalse(User.objects.get(email='new@example.com').is_email_verified)
+
+        self.client.post(reverse('accounts:login'), {'username': 'new@example.com', 'password': 'Str0ng-pass-123'})
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertNotEqual(self.link_token(), token)
+        self.assertEqual(purge_expired(), 1)
+        self.assertIsNotNone(verify_token(self.link_token()))
+
+    def test_lookup_uses_the_token_index(self):
+        self.register()
+        token_hash = EmailVerificationToken.objects.get().token_hash
+        plan = EmailVerificationToken.objects.filter(token_hash=token_hash).explain()
+        self.assertIn('USING INDEX', plan)
+
+
+class RoleDecoratorTests(TestCase):
+    def test_dashboards_check_the_request_role(self):
+        patient = User.objects.create_user('patient@example.com', None, username='patient', user_type='patient')
+        self.client.force_login(patient)
+        # Session and user only: the role of a patient needs no provider lookup
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(reverse('accounts:provider_dashboard')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('accounts:patient_dashboard')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('accounts:admin_dashboard')).status_code, 403)
+
+        provider = User.objects.create_user('doctor@example.com', None, username='doctor', user_type='provider')
+        self.client.force_login(provider)
+        # A provider account without a ProviderProfile has nothing to show on the dashboard
+        self.assertEqual(self.client.get(reverse('accounts:provider_dashboard')).status_code, 403)
+        ProviderProfile.objects.create(user=provider, license_number='LIC-1', specialization='Cardiology')
+        self.assertEqual(self.client.get(reverse('accounts:provider_dashboard')).status_code, 200)
+
+
+class ProfileViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'doctor@example.com', 'pass1234', username='doctor', first_name='Doc', last_name='Tor',
+            user_type='provider', phone_number='555-0100',
+        )
+        self.provider = ProviderProfile.objects.create(
+            user=self.user, license_number='LIC-1', specialization='Cardiology', consultation_fee='50.00'
+        )
+        Profile.objects.create(user=self.user, city='Lagos')
+        self.client.force_login(self.user)
+        self.url = reverse('accounts:profile')
+
+    def form_data(self, **changes):
+        data = {
+            'first_name': 'Doc', 'last_name': 'Tor', 'phone_number': '555-0100', 'date_of_birth': '',
+            'bio': '', 'address': '', 'city': 'Lagos', 'state': '', 'zip_code': '',
+            'emergency_contact_name': '', 'emergency_contact_phone': '',
+            'license_number': 'LIC-1', 'specialization': 'Cardiology', 'years_of_experience': '0',
+            'hospital_affiliation': '', 'consultation_fee': '50.00',
+        }
+        data.update(changes)
+        return data
+
+    def writes(self, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, data)
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        return [query['sql'] for query in queries.captured_queries if query['sql'].startswith(('INSERT', 'UPDATE'))]
+
+    def test_page_loads_user_and_profiles_in_one_query(self):
+        # Session, user, then the user joined with both profiles (which also serves the navigation)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Cardiology')
+
+    def test_only_changed_columns_are_written(self):
+        writes = self.writes(self.form_data(phone_number='555-0199'))
+        # The session is saved too
+        writes = [sql for sql in writes if 'django_session' not in sql]
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith('UPDATE "accounts_user" SET "phone_number"'))
+        self.assertNotIn('"first_name"', writes[0])
+        self.assertEqual(User.objects.get(pk=self.user.pk).phone_number, '555-0199')
+
+        writes = self.writes(self.form_data(phone_number='555-0199', consultation_fee='75.00'))
+        self.assertEqual([sql.split(' SET ')[0] for sql in writes if 'django_session' not in sql], [
+            'UPDATE "accounts_providerprofile"',
+        ])
+
+    def test_unchanged_submit_writes_nothing(self):
+        self.assertEqual([sql for sql in self.writes(self.form_data()) if 'django_session' not in sql], [])
+
+    def test_first_visit_creates_the_profile(self):
+        Profile.objects.all().delete()
+        self.client.get(self.url)
+        self.assertTrue(Profile.objects.filter(user=self.user).exists())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class UserProvisioningTests(TestCase):
+    HEADER = 'email,user_type,first_name,last_name,password,gender,blood_type,license_number,specialization,city\n'
+    ROWS = [
+        'pat1@clinic.example,patient,Pat,One,secret-1,F,O+,,,Lagos',
+        'doc1@clinic.example,provider,Doc,One,secret-2,,,LIC-9,Cardiology,Abuja',
+        'pat2@clinic.example,patient,Pat,Two,,M,,,,',
+        'PAT1@clinic.example,patient,Dup,Licate,x,F,,,,',
+        'taken@example.com,patient,Al,Ready,x,F,,,,',
+        'pat3@clinic.example,patient,Bad,Gender,x,Q,,,,',
+        'doc2@clinic.example,provider,No,License,x,,,,Cardiology,',
+        'doc3@clinic.example,provider,Doc,Three,secret-3,,,LIC-10,Dermatology,',
+    ]
+
+    def setUp(self):
+        User.objects.create_user('taken@example.com', None, username='taken', user_type='patient')
+
+    def provision(self, **kwargs):
+        rows = StringIO(self.HEADER + '\n'.join(self.ROWS) + '\n')
+        with UserProvisioner(**kwargs) as provisioner:
+            return provisioner.run(read_provision_rows(rows))
+
+    def test_rows_are_validated_and_inserted_with_their_profiles(self):
+        result = self.provision(batch_size=3, workers=1)
+        self.assertEqual(result.created, 4)
+        self.assertEqual([line for line, _ in result.errors], [5, 6, 7, 8])
+        patient = User.objects.get(email='pat1@clinic.example')
+        self.assertTrue(patient.check_password('secret-1'))
+        self.assertEqual((patient.patient.gender, patient.patient.blood_type, patient.profile.city), ('F', 'O+', 'Lagos'))
+        self.assertFalse(User.objects.get(email='pat2@clinic.example').has_usable_password())
+        provider = ProviderProfile.objects.get(license_number='LIC-9')
+        self.assertEqual((provider.user.email, provider.user.user_type), ('doc1@clinic.example', 'provider'))
+        self.assertEqual(Profile.objects.count(), 4)
+        self.assertEqual(ProviderProfile.objects.count(), 2)
+        self.assertFalse(User.objects.filter(email='pat1@clinic.example', is_email_verified=True).exists())
+
+    def test_values_that_do_not_fit_their_columns_are_rejected_per_line(self):
+        header = 'email,user_type,password,gender,zip_code,height,phone_number\n'
+        rows = [
+            f'{"a" * 140}@clinic.example,patient,x,F,,,',
+            'zip@clinic.example,patient,x,F,12345678901,,',
+            'tall@clinic.example,patient,x,F,,123456,',
+            'phone@clinic.example,patient,x,F,,,12-34',
+            'fits@clinic.example,patient,x,F,10001,180.5,+2348012345678',
+        ]
+        with UserProvisioner(workers=1) as provisioner:
+            result = provisioner.run(read_provision_rows(StringIO(header + '\n'.join(rows) + '\n')))
+        self.assertEqual(result.created, 1)
+        self.assertEqual([line for line, _ in result.errors], [2, 3, 4, 5])
+        self.assertTrue(result.errors[0][1].startswith('username: '))
+        self.assertTrue(result.errors[1][1].startswith('zip_code: '))
+        self.assertTrue(result.errors[2][1].startswith('height: '))
+        self.assertTrue(result.errors[3][1].startswith('phone_number: '))
+        self.assertEqual(User.objects.get(email='fits@clinic.example').patient.height, Decimal('180.5'))
+
+    def test_passwords_are_hashed_in_a_process_pool(self):
+        result = self.provision(batch_size=2, workers=2, verified=True)
+        self.assertEqual(result.created, 4)
+        user = User.objects.get(email='doc3@clinic.example')
+        self.assertTrue(user.check_password('secret-3'))
+        self.assertTrue(user.is_email_verified)
+
+    def test_dry_run_writes_nothing(self):
+        result = self.provision(workers=1, dry_run=True)
+        self.assertEqual((result.created, len(result.errors)), (4, 4))
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_command_reports_throughput(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as source:
+            source.write(self.HEADER + '\n'.join(self.ROWS) + '\n')
+        self.addCleanup(os.remove, source.name)
+        out, err = StringIO(), StringIO()
+        call_command('provision_users', source.name, '--workers', '1', stdout=out, stderr=err)
+        self.assertIn('Created 4 users, skipped 4 rows', out.getvalue())
+        self.assertIn('users/s', out.getvalue())
+        self.assertIn('Line 5: A user with email', err.getvalue())
@@ -0,0 +1,90 @@
+"""
+Email verification links.
+
+A link carries a random token; only its sha256 is stored, in
+EmailVerificationToken, so a link is found with one lookup on a unique index
+and the table can be purged of expired rows with one range delete on
+expires_at. Links expire after EMAIL_VERIFICATION_TOKEN_SECONDS and work once:
+verifying deletes every link the user was sent.
+"""
+import hashlib
+import secrets
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+from Healthcore.mail import send_messages
+from .models import EmailVerificationToken, User
+
+DEFAULT_TOKEN_SECONDS = 48 * 60 * 60
+
+
+def token_ttl():
+    return timedelta(seconds=getattr(settings, 'EMAIL_VERIFICATION_TOKEN_SECONDS', DEFAULT_TOKEN_SECONDS))
+
+
+def _hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def issue_token(user):
+    """Store a new verification token for user and return it (the only time it exists in clear)"""
+    token = secrets.token_urlsafe(32)
+    EmailVerificationToken.objects.create(user=user, token_hash=_hash(token), expires_at=timezone.now() + token_ttl())
+    return token
+
+
+def has_live_token(user):
+    return EmailVerificationToken.objects.filter(user=user, expires_at__gt=timezone.now()).exists()
+
+
+def verify_token(token):
+    """
+    Mark the owner of a valid, unexpired token as verified and use up their links.
+    Returns the user's id, or None if the token is unknown, expired or already used.
+    """
+    with transaction.atomic():
+        record = (
+            EmailVerificationToken.objects.select_for_update()
+            .filter(token_hash=_hash(token), expires_at__gt=timezone.now())
+            .values_list('pk', 'user_id').first()
+        )
+        if record is None:
+            return None
+        pk, user_id = record
+        # The delete decides between two clicks racing on the same link
+        if not EmailVerificationToken.objects.filter(pk=pk).delete()[0]:
+            return None
+        EmailVerificationToken.objects.filter(user_id=user_id).delete()
+        User.objects.filter(pk=user_id).update(is_email_verified=True, updated_at=timezone.now())
+    return user_id
+
+
+def purge_expired():
+    """Delete expired tokens; returns the number removed"""
+    return EmailVerificationToken.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+
+def send_verification_email(request, user, token):
+    subject = 'Verify your MediConnect account'
+    message = f"""
+    Hi {user.first_name},
+
+
+    Please click the link below to verify your email address:
+    {request.build_absolute_uri(reverse('accounts:verify_email', args=[token]))}
+
+    The link is valid for {int(token_ttl().total_seconds() // 3600)} hours.
+    if you didn't create this account, please ignore this email.
+
+
+    Best regards,
+    MediConnect Team
+    """
+
+    send_messages(
+        [EmailMessage(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email])],
+        fail_silently=False
+    )
@@ -7,13 +7,18 @@ from django.views.generic import CreateView
 from django.contrib.auth.views import LoginView, PasswordResetView, PasswordResetDoneView, PasswordResetConfirmView, PasswordResetCompleteView
 from django.utils.decorators import method_decorator 
 from django.views.decorators.csrf import csrf_protect
-from django.utils.crypto import get_random_string
-from django.core.mail import send_mail 
-from django.conf import settings
 from .forms import (UserRegistrationForm, UserLoginForm, ProfileUpdateForm, UserUpdateForm, ProviderProfileForm)
 from .models import User, Profile, ProviderProfile 
+from .roles import Role
+from .verification import has_live_token, issue_token, send_verification_email, verify_token
 from functools import wraps
-from django.http import HttpResponseForbidden
+from datetime import timedelta
+from django.http import HttpResponseForbidden, HttpResponseRedirect
+from django.utils import timezone
+from django.db import transaction
+from appointments.rollups import dashboard_stats
+
+DASHBOARD_PERIODS = (7, 30, 90, 365)
 
 # Create your views here.
 class CustomLoginView(LoginView):
@@ -24,7 +29,12 @@ class CustomLoginView(LoginView):
     def form_valid(self, form):
         user = form.get_user()
         if not user.is_email_verified:
-            messages.error(self.request, 'Please verify your email address before logging in.')
+            if has_live_token(user):
+                messages.error(self.request, 'Please verify your email address before logging in.')
+            else:
+                # The link we sent has expired (or was never delivered); send a fresh one
+                send_verification_email(self.request, user, issue_token(user))
+                messages.error(self.request, 'Your verification link has expired. We have emailed you a new one.')
             return redirect('accounts:login')
         return super().form_valid(form)
 
@@ -44,48 +54,17 @@ class RegisterView(CreateView):
     
     
     def form_valid(self, form):
-        user = form.save()
-        
-        # Generate email verification token
-        token = get_random_string(32)
-        user.email_verification_token = token
-        user.save()
-        
-        # Send verification email
-        self.send_verification_email(user, token)
-        
+        # One insert for the user and one for the token; CreateView.form_valid would save the user again
+        self.object = user = form.save()
+        send_verification_email(self.request, user, issue_token(user))
+
         messages.success(self.request, 'Account created successfully! Please check your email to verify your account.')
-        return super().form_valid(form)
-    
-    def send_verification_email(self, user, token):
-        # Send email verification link
-        subject = 'Verify your MediConnect account'
-        message = f"""
-        Hi {user.first_name},
-        
-                
-        Please click the link below to verify your email address:
-        {self.request.build_absolute_uri(f'/accounts/verify/{token}/')}
-                
-        if you didn't create this account, please ignore this email.
-        
-        
-        Best regards,
-        MediConnect Team
-        """ 
-        
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [user.email],
-            fail_silently=False
-        )
-        
+        return HttpResponseRedirect(self.get_success_url())
+
 def patient_required(view_func):
     @wraps(view_func)
     def _wrapped_view(request, *args, **kwargs):
-        if request.user.user_type != 'patient':
+        if not request.role.is_patient:
             return HttpResponseForbidden('You do not have permission to access this page.')
         return view_func(request, *args, **kwargs)
     return _wrapped_view
@@ -93,7 +72,7 @@ def patient_required(view_func):
 def provider_required(view_func):
     @wraps(view_func)
     def _wrapped_view(request, *args, **kwargs):
-        if request.user.user_type != 'provider':
+        if not request.role.is_provider:
             return HttpResponseForbidden('You do not have permission to access this page.')
         return view_func(request, *args, **kwargs)
     return _wrapped_view
@@ -101,42 +80,42 @@ def provider_required(view_func):
 def admin_required(view_func):
     @wraps(view_func)
     def _wrapped_view(request, *args, **kwargs):
-        if request.user.user_type != 'admin':
+        if not request.role.is_admin:
             return HttpResponseForbidden('You do not have permission to access this page.')
         return view_func(request, *args, **kwargs)
     return _wrapped_view
 
 @login_required
 def profile_view(request):
-    # View and update user profile
-    user = request.user
-    
-    
-    # Get or create profile
-    profile, created = Profile.objects.get_or_create(user=user)
-    
-    
-    # Get provider profile if user is a provider
-    provider_profile = None
-    if user.user_type == 'provider':
-        provider_profile, created = ProviderProfile.objects.get_or_create(user=user)
-        
+    # View and update user profile; the user and both profiles come from one joined query
+    user = User.objects.select_related('profile', 'providerprofile').get(pk=request.user.pk)
+    profile = getattr(user, 'profile', None)
+    if profile is None:
+        profile = Profile.objects.create(user=user)
+    provider_profile = getattr(user, 'providerprofile', None)
+    if provider_profile is None and user.user_type == 'provider':
+        provider_profile = ProviderProfile.objects.create(user=user)
+    # The navigation reads the role, which is known already
+    request.role = Role(user, provider_profile)
+    if user.user_type != 'provider':
+        provider_profile = None
+
     if request.method == 'POST':
         user_form = UserUpdateForm(request.POST, request.FILES, instance=user)
         profile_form = ProfileUpdateForm(request.POST, instance=profile)
-        provider_form = None
-        
-        if user.user_type == 'provider':
-            provider_form = ProviderProfileForm(request.POST, instance=provider_profile)
-            
-        if user_form.is_valid() and profile_form.is_valid():
-            if provider_form is None or provider_form.is_valid():
-                user_form.save()
-                profile_form.save()
-                if provider_form:
-                    provider_form.save()
+        provider_form = ProviderProfileForm(request.POST, instance=provider_profile) if provider_profile else None
+        forms = [form for form in (user_form, profile_form, provider_form) if form is not None]
+
+        # Validate every form so all errors show at once
+        if all([form.is_valid() for form in forms]):
+            # Only changed models are written, and only their changed columns
+            with transaction.atomic():
+                changed = [form.save(commit=False).save_changed() for form in forms]
+            if any(changed):
                 messages.success(request, 'Your profile has been updated!')
-                return redirect('accounts:profile')
+            else:
+                messages.info(request, 'No changes to save.')
+            return redirect('accounts:profile')
     else:
         user_form = UserUpdateForm(instance=user)
         profile_form = ProfileUpdateForm(instance=profile)
@@ -168,16 +147,11 @@ def dashboard_view(request):
     
 def verify_email(request, token):
     # Verify user email address
-    try:
-        user = User.objects.get(email_verification_token=token)
-        user.is_email_verified = True
-        user.email_verification_token = ''
-        user.save()
-        messages.success(request, 'Email verified successfully! You can log in.')
-        return redirect('accounts:login')
-    except User.DoesNotExist:
-        messages.error(request, 'Invalid verification token.')
+    if verify_token(token) is None:
+        messages.error(request, 'Invalid or expired verification link.')
         return redirect('accounts:login')
+    messages.success(request, 'Email verified successfully! You can log in.')
+    return redirect('accounts:login')
     
 def logout_view(request):
     # Custom logout view
@@ -215,6 +189,21 @@ def provider_dashboard_view(request):
 @login_required
 @admin_required
 def admin_dashboard_view(request):
-    return render(request, 'accounts/admin_dashboard.html')    
+    # Statistics come from the daily rollups, never from the appointments table
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        days = 30
+    if days not in DASHBOARD_PERIODS:
+        days = 30
+    end_date = timezone.localdate()
+    start_date = end_date - timedelta(days=days - 1)
+    return render(request, 'accounts/admin_dashboard.html', {
+        'stats': dashboard_stats(start_date, end_date),
+        'days': days,
+        'periods': DASHBOARD_PERIODS,
+        'start_date': start_date,
+        'end_date': end_date,
+    })    
               
             
\ No newline at end of file
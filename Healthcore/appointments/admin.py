@@ -1,15 +1,24 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Appointment
+from Healthcore.changelist import PrefixSearchMixin
+from .models import (
+    Appointment, AppointmentDailyStat, AppointmentSeries, OutboxMessage, ScheduledReminder, StatusTransition,
+    WaitlistEntry, WaitlistOffer,
+)
+from .transitions import transition_status
 
 @admin.register(Appointment)
-class AppointmentAdmin(admin.ModelAdmin):
+class AppointmentAdmin(PrefixSearchMixin, admin.ModelAdmin):
     list_display = ('patient_name', 'provider_name', 'appointment_datetime', 'appointment_type', 'status_badge')
-    list_filter = ('status', 'appointment_type', 'date', 'provider')
-    search_fields = ('patient__email', 'patient__first_name', 'patient__last_name',
-                    'provider__user__email', 'provider__user__first_name', 'provider__user__last_name')
-    date_hierarchy = 'date'
-    ordering = ('-date', '-time')
+    # start_at filters are index range scans (date_hierarchy aggregated distinct dates
+    # over the whole table); providers are found through search rather than a sidebar
+    # listing every provider
+    list_filter = ('status', 'appointment_type', 'start_at')
+    list_select_related = ('patient', 'provider__user')
+    # Email/name prefix of the patient or provider
+    prefix_search_users = ('patient', 'provider__user')
+    ordering = ('-start_at',)
+    raw_id_fields = ('series',)
 
     def patient_name(self, obj):
         return f"{obj.patient.get_full_name()} ({obj.patient.email})"
@@ -41,12 +50,12 @@ class AppointmentAdmin(admin.ModelAdmin):
     actions = ['mark_as_completed', 'mark_as_no_show']
 
     def mark_as_completed(self, request, queryset):
-        updated = queryset.update(status='COMPLETED')
+        updated = transition_status(queryset, 'COMPLETED', changed_by=request.user, source='admin')
         self.message_user(request, f'{updated} appointments marked as completed.')
     mark_as_completed.short_description = "Mark selected appointments as completed"
 
     def mark_as_no_show(self, request, queryset):
-        updated = queryset.update(status='NO_SHOW')
+        updated = transition_status(queryset, 'NO_SHOW', changed_by=request.user, source='admin')
         self.message_user(request, f'{updated} appointments marked as no-show.')
     mark_as_no_show.short_description = "Mark selected appointments as no-show"
 
@@ -54,3 +63,63 @@ class AppointmentAdmin(admin.ModelAdmin):
         css = {
             'all': ['admin/css/badges.css']
         }
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('appointment', 'event', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'event')
+    list_select_related = ('appointment__patient', 'appointment__provider__user')
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+    raw_id_fields = ('appointment',)
+
+
+@admin.register(StatusTransition)
+class StatusTransitionAdmin(admin.ModelAdmin):
+    list_display = ('appointment', 'from_status', 'to_status', 'changed_by', 'source', 'created_at')
+    list_filter = ('to_status', 'source')
+    list_select_related = ('appointment__patient', 'appointment__provider__user', 'changed_by')
+    raw_id_fields = ('appointment', 'changed_by')
+    readonly_fields = ('created_at',)
+
+
+@admin.register(AppointmentSeries)
+class AppointmentSeriesAdmin(admin.ModelAdmin):
+    list_display = ('patient', 'provider', 'start_date', 'time', 'interval_days', 'occurrences', 'created_at')
+    list_select_related = ('patient', 'provider__user')
+    raw_id_fields = ('patient', 'provider')
+    readonly_fields = ('created_at',)
+
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ('patient', 'specialization', 'provider', 'earliest_date', 'latest_date', 'status', 'created_at')
+    list_filter = ('status', 'specialization')
+    list_select_related = ('patient', 'provider__user')
+    raw_id_fields = ('patient', 'provider')
+    readonly_fields = ('created_at',)
+
+
+@admin.register(WaitlistOffer)
+class WaitlistOfferAdmin(admin.ModelAdmin):
+    list_display = ('entry', 'provider', 'date', 'time', 'status', 'expires_at', 'notified_at')
+    list_filter = ('status',)
+    list_select_related = ('entry__patient', 'provider__user')
+    raw_id_fields = ('entry', 'provider')
+    readonly_fields = ('created_at', 'notified_at')
+
+
+@admin.register(ScheduledReminder)
+class ScheduledReminderAdmin(admin.ModelAdmin):
+    list_display = ('appointment', 'offset_minutes', 'due_at', 'status', 'attempts', 'sent_at')
+    list_filter = ('status', 'offset_minutes')
+    raw_id_fields = ('appointment',)
+    readonly_fields = ('created_at', 'sent_at')
+
+
+@admin.register(AppointmentDailyStat)
+class AppointmentDailyStatAdmin(admin.ModelAdmin):
+    list_display = ('date', 'provider', 'specialization', 'status', 'appointment_type', 'count')
+    list_filter = ('status', 'appointment_type', 'date')
+    list_select_related = ('provider__user',)
+    raw_id_fields = ('provider',)
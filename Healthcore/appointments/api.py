@@ -0,0 +1,150 @@
+"""
+Read-only JSON API for machine clients (mobile app, kiosks), mounted at /api/v1/.
+
+Lists use cursor pagination, so deep pages cost the same as the first one.
+Every serializer reads from select_related rows, which keeps the query count
+per page fixed. All responses carry an ETag derived from the updated_at of
+the rows they contain. A matching If-None-Match is answered with 304 before
+anything is serialized.
+"""
+import hashlib
+from datetime import timedelta
+from django.db.models import Count, Max
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from accounts.models import ProviderProfile
+from .availability import SLOT_MINUTES, AvailabilityIndex, day_bounds, parse_slot_range
+from .models import Appointment
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from .serializers import AppointmentSerializer, ProviderSerializer
+
+
+class AppointmentCursorPagination(CursorPagination):
+    ordering = ('start_at', 'id')
+    page_size = DEFAULT_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_PAGE_SIZE
+
+
+class ProviderCursorPagination(AppointmentCursorPagination):
+    ordering = ('id',)
+
+
+class ConditionalGetMixin:
+    """ETag / If-None-Match handling for list and retrieve"""
+
+    def etag_parts(self, obj):
+        return (obj.pk, obj.updated_at)
+
+    def make_etag(self, objects=(), extra=()):
+        # The full path covers version, cursor, filters and ?fields=
+        digest = hashlib.md5(self.request.get_full_path().encode(), usedforsecurity=False)
+        for obj in objects:
+            digest.update(repr(self.etag_parts(obj)).encode())
+        digest.update(repr(extra).encode())
+        return quote_etag(digest.hexdigest())
+
+    def conditional_response(self, etag, build):
+        """Return 304 if the client already has etag, otherwise the response from build()"""
+        client_etags = parse_etags(self.request.headers.get('If-None-Match', ''))
+        if '*' in client_etags or etag in [tag.removeprefix('W/') for tag in client_etags]:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = build()
+        response['ETag'] = etag
+        # Responses are per user; clients and proxies must revalidate
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        return self.conditional_response(
+            self.make_etag(page),
+            lambda: self.get_paginated_response(self.get_serializer(page, many=True).data),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return self.conditional_response(
+            self.make_etag([instance]),
+            lambda: Response(self.get_serializer(instance).data),
+        )
+
+
+class AppointmentViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    The caller's appointments: as patient, or as provider for provider accounts.
+    Filters: ?status=SCHEDULED, ?upcoming=true|false.
+    """
+    serializer_class = AppointmentSerializer
+    pagination_class = AppointmentCursorPagination
+
+    def get_queryset(self):
+        role = self.request.role
+        if role.is_provider:
+            queryset = Appointment.objects.filter(provider=role.provider)
+        else:
+            queryset = Appointment.objects.filter(patient=role.user)
+
+        params = self.request.query_params
+        if params.get('status'):
+            queryset = queryset.filter(status=params['status'].upper())
+        if params.get('upcoming') in ('true', 'false'):
+            lookup = 'start_at__gte' if params['upcoming'] == 'true' else 'start_at__lt'
+            queryset = queryset.filter(**{lookup: timezone.now()})
+        return queryset.select_related('patient', 'provider__user').order_by('start_at', 'id')
+
+
+class ProviderViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    """Provider directory. Filter: ?specialization=Cardiology"""
+    serializer_class = ProviderSerializer
+    pagination_class = ProviderCursorPagination
+
+    def get_queryset(self):
+        queryset = ProviderProfile.objects.filter(user__is_active=True).select_related('user')
+        if self.request.query_params.get('specialization'):
+            queryset = queryset.filter(specialization__iexact=self.request.query_params['specialization'])
+        return queryset.order_by('id')
+
+    def etag_parts(self, obj):
+        # Names live on the user row
+        return (obj.pk, obj.updated_at, obj.user.updated_at)
+
+    @action(detail=True)
+    def slots(self, request, pk=None):
+        """Free slots between ?start_date and ?end_date (YYYY-MM-DD, a week from today by default)"""
+        provider = get_object_or_404(ProviderProfile, pk=pk, user__is_active=True)
+        try:
+            start_date, end_date = parse_slot_range(
+                request.query_params.get('start_date'), request.query_params.get('end_date')
+            )
+        except ValueError:
+            return Response({'error': 'Dates must be in YYYY-MM-DD format'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Slots change when the provider's hours or appointments in the range change,
+        # and when time moves past a slot
+        range_start, range_end = day_bounds(start_date, end_date)
+        longest = timedelta(minutes=max(Appointment.DURATIONS.values()))
+        booked = provider.provider_appointments.filter(
+            start_at__gt=range_start - longest, start_at__lt=range_end
+        ).aggregate(changed=Max('updated_at'), count=Count('id'))
+        current_slot = int(timezone.now().timestamp() // (SLOT_MINUTES * 60))
+        etag = self.make_etag(extra=(provider.updated_at, booked['changed'], booked['count'], current_slot))
+
+        def build():
+            slots = AvailabilityIndex(provider, start_date, end_date).free_slots()
+            return Response({
+                'provider': provider.pk,
+                'start_date': start_date.isoformat(),
+                'end_date': end_date.isoformat(),
+                'slots': {
+                    date.isoformat(): [slot.strftime('%H:%M') for slot in times]
+                    for date, times in slots.items()
+                },
+            })
+        return self.conditional_response(etag, build)
@@ -0,0 +1,10 @@
+from rest_framework.routers import SimpleRouter
+from . import api
+
+app_name = 'api_v1'
+
+router = SimpleRouter()
+router.register('appointments', api.AppointmentViewSet, basename='appointment')
+router.register('providers', api.ProviderViewSet, basename='provider')
+
+urlpatterns = router.urls
@@ -0,0 +1,222 @@
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from django.utils import timezone
+
+SLOT_MINUTES = 30
+# Longest range a single free-slot probe may cover
+MAX_SLOT_RANGE_DAYS = 31
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+# Used when a provider has not filled in availability_hours (legacy 9 AM - 5 PM, every day)
+DEFAULT_WORKING_HOURS = {day: [(9 * 60, 17 * 60)] for day in range(7)}
+
+
+def day_bounds(start_date, end_date=None):
+    """Aware [start, end) datetimes covering whole site-timezone days start_date..end_date"""
+    site_tz = timezone.get_default_timezone()
+    end_date = end_date or start_date
+    return (
+        timezone.make_aware(datetime.combine(start_date, datetime.min.time()), site_tz),
+        timezone.make_aware(datetime.combine(end_date + timedelta(days=1), datetime.min.time()), site_tz),
+    )
+
+
+def parse_slot_range(start_date=None, end_date=None):
+    """
+    Parse optional YYYY-MM-DD strings into a (start, end) date range for a slot probe:
+    today and the following week by default, capped at MAX_SLOT_RANGE_DAYS.
+    Raises ValueError on malformed dates.
+    """
+    start = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else timezone.localdate()
+    end = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else start + timedelta(days=6)
+    return start, min(end, start + timedelta(days=MAX_SLOT_RANGE_DAYS - 1))
+
+
+def _to_minutes(value):
+    """Convert 'HH:MM' strings or time objects to minutes since midnight"""
+    if isinstance(value, str):
+        hours, _, minutes = value.strip().partition(':')
+        return int(hours) * 60 + int(minutes or 0)
+    return value.hour * 60 + value.minute
+
+
+def _weekday_index(key):
+    key = str(key).strip().lower()
+    if key.isdigit():
+        return int(key) % 7
+    # Shorter keys would prefix-match several days ('' and 't' are not days)
+    if len(key) < 3:
+        return None
+    for index, name in enumerate(WEEKDAYS):
+        if name.startswith(key[:3]):
+            return index
+    return None
+
+
+def _parse_windows(value):
+    """
+    Parse the working windows of a single day. Accepted formats:
+        [["09:00", "12:00"], ["13:00", "17:00"]]
+        {"start": "09:00", "end": "17:00"}
+        "09:00-17:00"
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = [value.split('-', 1)]
+    elif isinstance(value, dict):
+        value = [(value.get('start'), value.get('end'))]
+    elif value and isinstance(value[0], str):
+        value = [value]
+
+    windows = []
+    for window in value:
+        if isinstance(window, str):
+            window = window.split('-', 1)
+        elif isinstance(window, dict):
+            window = (window.get('start'), window.get('end'))
+        start, end = _to_minutes(window[0]), _to_minutes(window[1])
+        if start < end:
+            windows.append((start, end))
+    return sorted(windows)
+
+
+def parse_availability_hours(availability_hours):
+    """
+    Normalise ProviderProfile.availability_hours into {weekday: [(start, end), ...]}
+    with weekday 0 = Monday and start/end in minutes since midnight.
+    Days missing from a non-empty schedule are treated as days off.
+    """
+    if not availability_hours:
+        return DEFAULT_WORKING_HOURS
+
+    schedule = {day: [] for day in range(7)}
+    for key, value in availability_hours.items():
+        day = _weekday_index(key)
+        if day is None:
+            continue
+        try:
+            schedule[day] = _parse_windows(value)
+        except (TypeError, ValueError, IndexError, AttributeError):
+            schedule[day] = []
+    return schedule
+
+
+class AvailabilityIndex:
+    """
+    In-memory interval index of a provider's working hours and booked slots
+    between start_date and end_date (inclusive).
+
+    Building the index costs one query; every probe afterwards is a binary
+    search over the booked intervals of that day.
+    """
+
+    def __init__(self, provider, start_date, end_date=None, slot_minutes=SLOT_MINUTES, exclude=None):
+        self.provider = provider
+        self.start_date = start_date
+        self.end_date = end_date or start_date
+        self.slot_minutes = slot_minutes
+        self.working_hours = parse_availability_hours(provider.availability_hours)
+
+        # Booked windows overlapping the range, as one indexed scan on (provider, start_at)
+        site_tz = timezone.get_default_timezone()
+        range_start, range_end = day_bounds(self.start_date, self.end_date)
+        appointments = provider.provider_appointments
+        # No appointment is longer than the longest type, which bounds the scan from below
+        longest = timedelta(minutes=max(appointments.model.DURATIONS.values()))
+        booked = appointments.filter(
+            start_at__gt=range_start - longest,
+            start_at__lt=range_end,
+            end_at__gt=range_start,
+            status='SCHEDULED'
+        )
+        if exclude is not None:
+            booked = booked.exclude(pk=exclude)
+
+        self._intervals = {}
+        for start_at, end_at in booked.values_list('start_at', 'end_at'):
+            local_start = timezone.localtime(start_at, site_tz)
+            local_end = timezone.localtime(end_at, site_tz)
+            day, start = local_start.date(), _to_minutes(local_start)
+            # Split appointments that run past midnight into per-day intervals
+            while day < local_end.date():
+                self._intervals.setdefault(day, []).append((start, 24 * 60))
+                day, start = day + timedelta(days=1), 0
+            end = _to_minutes(local_end)
+            if end > start:
+                self._intervals.setdefault(day, []).append((start, end))
+        self._booked = {date: self._compile(intervals) for date, intervals in self._intervals.items()}
+
+    @staticmethod
+    def _compile(intervals):
+        # Sorted starts plus a running maximum of ends lets an overlap probe
+        # find every interval starting before the probe end with one bisect
+        intervals.sort()
+        starts, max_ends, running = [], [], 0
+        for start, end in intervals:
+            running = max(running, end)
+            starts.append(start)
+            max_ends.append(running)
+        return starts, max_ends
+
+    def add(self, date, time, duration=None):
+        """Record a new booking without going back to the database"""
+        start = _to_minutes(time)
+        intervals = self._intervals.setdefault(date, [])
+        intervals.append((start, start + (duration or self.slot_minutes)))
+        self._booked[date] = self._compile(intervals)
+
+    def is_booked(self, date, time, duration=None):
+        """True if [time, time + duration) overlaps a scheduled appointment"""
+        start = _to_minutes(time)
+        end = start + (duration or self.slot_minutes)
+        starts, max_ends = self._booked.get(date, ([], []))
+        index = bisect_left(starts, end)
+        return index > 0 and max_ends[index - 1] > start
+
+    def is_within_hours(self, date, time, duration=None):
+        start = _to_minutes(time)
+        end = start + (duration or self.slot_minutes)
+        return any(
+            window_start <= start and end <= window_end
+            for window_start, window_end in self.working_hours.get(date.weekday(), [])
+        )
+
+    def is_past(self, date, time):
+        slot = timezone.make_aware(datetime.combine(date, time), timezone.get_default_timezone())
+        return slot <= timezone.now()
+
+    def is_free(self, date, time, duration=None):
+        return (
+            not self.is_past(date, time)
+            and self.is_within_hours(date, time, duration)
+            and not self.is_booked(date, time, duration)
+        )
+
+    def free_slots(self, duration=None):
+        """Return {date: [time, ...]} of every bookable slot in the range"""
+        duration = duration or self.slot_minutes
+        now = timezone.localtime()
+        slots = {}
+        date = self.start_date
+        while date <= self.end_date:
+            day_slots = []
+            for window_start, window_end in self.working_hours.get(date.weekday(), []):
+                start = window_start
+                while start + duration <= window_end:
+                    slot_time = (datetime.min + timedelta(minutes=start)).time()
+                    if not self.is_booked(date, slot_time, duration) and (
+                        date > now.date() or not self.is_past(date, slot_time)
+                    ):
+                        day_slots.append(slot_time)
+                    start += self.slot_minutes
+            if day_slots:
+                slots[date] = day_slots
+            date += timedelta(days=1)
+        return slots
+
+
+def get_free_slots(provider, start_date, end_date, slot_minutes=SLOT_MINUTES):
+    """All free slots for a provider between start_date and end_date in one query"""
+    return AvailabilityIndex(provider, start_date, end_date, slot_minutes).free_slots()
@@ -0,0 +1,250 @@
+import random
+import time as time_module
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from accounts.models import ProviderProfile
+from . import reminders, rollups
+from .availability import AvailabilityIndex
+from .events import event_payload, publish
+from .models import Appointment, OutboxMessage, SlotHold, WaitlistOffer
+from .utils import check_appointment_availability
+
+DEFAULT_HOLD_SECONDS = 5 * 60
+BOOKING_RETRIES = 10
+BOOKING_RETRY_DELAY = 0.05
+# Most occurrences a recurring series may book in one go
+MAX_SERIES_OCCURRENCES = 52
+
+
+class SlotUnavailable(Exception):
+    """The requested slot is booked, held by someone else, or outside working hours"""
+
+
+class SeriesConflict(SlotUnavailable):
+    """One or more occurrences of a recurring series cannot be booked"""
+
+    def __init__(self, conflicts):
+        # [(date, message), ...] for every occurrence that failed the check
+        self.conflicts = conflicts
+        super().__init__(f'{len(conflicts)} of the requested dates are not available')
+
+
+def hold_ttl():
+    return timedelta(seconds=getattr(settings, 'SLOT_HOLD_SECONDS', DEFAULT_HOLD_SECONDS))
+
+
+def _active_hold(provider, date, time):
+    return SlotHold.objects.filter(
+        provider=provider, date=date, time=time, expires_at__gt=timezone.now()
+    ).first()
+
+
+def hold_slot(provider, date, time, user):
+    """
+    Reserve a slot for user for the hold TTL, extending their own hold if they already have it.
+    Raises SlotUnavailable straight away if the slot is booked or held by someone else,
+    so contention surfaces while the form is being filled in rather than on submit.
+    A user holds one slot at a time: holding a new one releases the slot they held
+    before, other than slots reserved for them by a waitlist offer.
+    """
+    is_available, message = check_appointment_availability(provider, date, time)
+    if not is_available:
+        raise SlotUnavailable(message)
+
+    expires_at = timezone.now() + hold_ttl()
+    try:
+        with transaction.atomic():
+            # Expired holds do not block anyone (indexed range delete keeps the table small)
+            purge_expired_holds()
+            release_other_holds(provider, date, time, user)
+            hold, created = SlotHold.objects.get_or_create(
+                provider=provider, date=date, time=time,
+                defaults={'holder': user, 'expires_at': expires_at},
+            )
+    except IntegrityError:
+        raise SlotUnavailable('This time slot is being booked by someone else')
+
+    if not created:
+        if hold.holder_id != user.pk:
+            raise SlotUnavailable('This time slot is being booked by someone else')
+        hold.expires_at = expires_at
+        hold.save(update_fields=['expires_at'])
+    return hold
+
+
+def release_other_holds(provider, date, time, user):
+    """Drop user's holds on slots other than this one, keeping those backing a pending waitlist offer"""
+    offered = WaitlistOffer.objects.filter(
+        status='PENDING', entry__patient_id=OuterRef('holder_id'),
+        provider_id=OuterRef('provider_id'), date=OuterRef('date'), time=OuterRef('time'),
+    )
+    SlotHold.objects.filter(holder=user).exclude(provider=provider, date=date, time=time).exclude(
+        Exists(offered)
+    ).delete()
+
+
+def release_hold(provider, date, time, user):
+    SlotHold.objects.filter(provider=provider, date=date, time=time, holder=user).delete()
+
+
+def _book_slot_once(appointment, claim=None):
+    with transaction.atomic():
+        provider = ProviderProfile.objects.select_for_update().get(pk=appointment.provider_id)
+
+        hold = _active_hold(provider, appointment.date, appointment.time)
+        if hold and hold.holder_id != appointment.patient_id:
+            raise SlotUnavailable('This time slot is being booked by someone else')
+
+        is_available, message = check_appointment_availability(
+            provider, appointment.date, appointment.time, duration=appointment.duration
+        )
+        if not is_available:
+            raise SlotUnavailable(message)
+
+        if claim is not None:
+            claim()
+        appointment.save()
+        if hold:
+            hold.delete()
+
+
+def _with_retries(book_once, reset, retries):
+    # Shared retry loop of book_slot and book_series
+    for attempt in range(retries + 1):
+        try:
+            return book_once()
+        except IntegrityError:
+            raise SlotUnavailable('This time slot is already booked')
+        except OperationalError:
+            # Retrying is only safe when we own the whole transaction
+            if transaction.get_connection().in_atomic_block:
+                raise
+            reset()
+            if attempt == retries:
+                raise SlotUnavailable('Booking is busy right now, please try again')
+            time_module.sleep(BOOKING_RETRY_DELAY * (attempt + 1) * random.random())
+
+
+def book_slot(appointment, retries=BOOKING_RETRIES, claim=None):
+    """
+    Save a new appointment if its slot is free and not held by another patient.
+    The provider row is locked for the check-and-insert on backends that support
+    SELECT ... FOR UPDATE, and the partial unique constraint rejects any double
+    booking that still slips through. Transient lock errors (SQLite reports
+    contention instead of waiting) are retried with a short backoff.
+    claim, if given, runs in the same transaction just before the insert, so
+    whatever it uses up (a waitlist offer) is only used if the booking commits;
+    it raises SlotUnavailable to call the booking off.
+    Raises SlotUnavailable on conflict.
+    """
+    def reset():
+        appointment.pk = None
+        appointment._state.adding = True
+
+    def book_once():
+        _book_slot_once(appointment, claim)
+        return appointment
+
+    return _with_retries(book_once, reset, retries)
+
+
+def series_dates(start_date, interval_days, occurrences=None, end_date=None):
+    """
+    Dates of a series every interval_days from start_date, stopping after
+    occurrences dates or at end_date (inclusive), whichever comes first,
+    and never past MAX_SERIES_OCCURRENCES.
+    """
+    if interval_days < 1:
+        raise ValueError('interval_days must be at least 1')
+    if occurrences is None and end_date is None:
+        raise ValueError('Give the number of occurrences or an end date')
+    limit = min(occurrences or MAX_SERIES_OCCURRENCES, MAX_SERIES_OCCURRENCES)
+    dates = []
+    date = start_date
+    while len(dates) < limit and (end_date is None or date <= end_date):
+        dates.append(date)
+        date += timedelta(days=interval_days)
+    return dates
+
+
+def _book_series_once(series, dates):
+    duration = Appointment.duration_for(series.appointment_type)
+    with transaction.atomic():
+        provider = ProviderProfile.objects.select_for_update().get(pk=series.provider_id)
+
+        # One scan of the booked intervals and one of the holds covers every occurrence
+        index = AvailabilityIndex(provider, dates[0], dates[-1])
+        held = set(
+            SlotHold.objects.filter(
+                provider=provider, date__in=dates, time=series.time, expires_at__gt=timezone.now()
+            ).exclude(holder_id=series.patient_id).values_list('date', flat=True)
+        )
+        conflicts = []
+        for date in dates:
+            if date in held:
+                conflicts.append((date, 'This time slot is being booked by someone else'))
+                continue
+            is_available, message = check_appointment_availability(
+                provider, date, series.time, index=index, duration=duration
+            )
+            if not is_available:
+                conflicts.append((date, message))
+        if conflicts:
+            raise SeriesConflict(conflicts)
+
+        series.save()
+        appointments = []
+        for date in dates:
+            appointment = Appointment(
+                patient_id=series.patient_id, provider_id=series.provider_id, series=series,
+                appointment_type=series.appointment_type, reason=series.reason,
+                date=date, time=series.time,
+            )
+            appointment.sync_window()
+            appointments.append(appointment)
+        # bulk_create skips post_save, so the series gets one summary notification
+        # instead of a confirmation per occurrence
+        appointments = Appointment.objects.bulk_create(appointments)
+        SlotHold.objects.filter(
+            provider=provider, date__in=dates, time=series.time, holder_id=series.patient_id
+        ).delete()
+        rollups.record_created(appointments)
+        reminders.schedule_reminders(appointments)
+        # The appointments are brand new, so there is no earlier message to collapse into
+        OutboxMessage.objects.create(appointment=appointments[0], event='series_confirmation')
+        publish(
+            (appointment.patient_id, appointment.provider_id, event_payload(
+                'created', appointment.pk, appointment.status, appointment.start_at
+            ))
+            for appointment in appointments
+        )
+        return appointments
+
+
+def book_series(series, end_date=None, retries=BOOKING_RETRIES):
+    """
+    Book every occurrence of an unsaved AppointmentSeries, or none of them.
+    All dates are checked against the provider's booked intervals and other
+    patients' holds in one pass under the provider lock, then inserted with a
+    single bulk_create. Raises SeriesConflict listing every date that is not
+    free; series.occurrences is set to the number of dates booked.
+    """
+    dates = series_dates(series.start_date, series.interval_days, series.occurrences, end_date)
+    if not dates:
+        raise ValueError('The series ends before its first occurrence')
+    series.occurrences = len(dates)
+
+    def reset():
+        series.pk = None
+        series._state.adding = True
+
+    return _with_retries(lambda: _book_series_once(series, dates), reset, retries)
+
+
+def purge_expired_holds():
+    """Delete holds past their expiry; returns the number removed"""
+    deleted, _ = SlotHold.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
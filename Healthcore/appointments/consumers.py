@@ -0,0 +1,41 @@
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from accounts.roles import get_role
+from .events import patient_group, provider_group
+
+class AppointmentEventsConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Pushes appointment events (created, cancelled, status_changed, rescheduled)
+    to the connected user: their own appointments as a patient, or every
+    appointment on their schedule as a provider.
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+        self.groups = await self.groups_for(user)
+        for group in self.groups:
+            await self.channel_layer.group_add(group, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        for group in getattr(self, 'groups', []):
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        # Push only; clients have nothing to send
+        pass
+
+    async def appointment_event(self, event):
+        await self.send_json(event['payload'])
+
+    @database_sync_to_async
+    def groups_for(self, user):
+        groups = [patient_group(user.pk)]
+        # WebSocket scopes skip the HTTP middleware, so resolve the role here
+        role = get_role(user)
+        if role.is_provider:
+            groups.append(provider_group(role.provider.pk))
+        return groups
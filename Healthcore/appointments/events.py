@@ -0,0 +1,62 @@
+"""
+Live appointment events pushed to WebSocket subscribers (see consumers.py).
+
+Every appointment change is sent to two groups: the patient's and the
+provider's. Events are published after the surrounding transaction commits,
+so subscribers never hear about a change that was rolled back.
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+
+def patient_group(user_id):
+    return f'appointments.patient.{user_id}'
+
+
+def provider_group(provider_id):
+    return f'appointments.provider.{provider_id}'
+
+
+def event_payload(event, appointment_id, status, start_at, previous_status=None):
+    payload = {
+        'event': event,
+        'appointment': appointment_id,
+        'status': status,
+        'start_at': start_at.isoformat(),
+    }
+    if previous_status is not None:
+        payload['previous_status'] = previous_status
+    return payload
+
+
+def publish(events):
+    """
+    Queue events for delivery on commit. events is an iterable of
+    (patient_id, provider_id, payload) tuples.
+    """
+    events = list(events)
+    if events:
+        transaction.on_commit(lambda: _send(events))
+
+
+def publish_appointment(appointment, event, previous_status=None):
+    publish([(
+        appointment.patient_id, appointment.provider_id,
+        event_payload(event, appointment.pk, appointment.status, appointment.start_at, previous_status),
+    )])
+
+
+def status_event(status):
+    return 'cancelled' if status == 'CANCELLED' else 'status_changed'
+
+
+def _send(events):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    group_send = async_to_sync(channel_layer.group_send)
+    for patient_id, provider_id, payload in events:
+        message = {'type': 'appointment.event', 'payload': payload}
+        group_send(patient_group(patient_id), message)
+        group_send(provider_group(provider_id), message)
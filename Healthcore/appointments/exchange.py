@@ -0,0 +1,288 @@
+"""
+Bulk appointment export and import (CSV or NDJSON).
+
+Exports walk the table with a server-side iterator over flat value rows, with
+patient and provider names joined in, so memory stays flat however many
+appointments go out. Imports read the file as a stream, validate it in
+batches, resolve patients by email and providers by licence number through
+lookup dicts filled with one query per batch, check scheduled rows for
+overlaps under the providers' booking locks, and insert each batch with
+bulk_create. bulk_create skips Appointment.save, so imported rows send no
+emails and publish no live events; the reporting rollups and the reminder queue
+are updated directly.
+"""
+import csv
+import json
+from datetime import datetime
+from typing import NamedTuple
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from accounts.models import ProviderProfile
+from . import reminders, rollups
+from .availability import AvailabilityIndex, day_bounds
+from .models import Appointment
+
+FORMATS = ('csv', 'ndjson')
+EXPORT_CHUNK_SIZE = 2000
+IMPORT_BATCH_SIZE = 1000
+
+# (column, values() path)
+EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('patient_email', 'patient__email'),
+    ('patient_first_name', 'patient__first_name'),
+    ('patient_last_name', 'patient__last_name'),
+    ('provider_license', 'provider__license_number'),
+    ('provider_email', 'provider__user__email'),
+    ('provider_first_name', 'provider__user__first_name'),
+    ('provider_last_name', 'provider__user__last_name'),
+    ('date', 'date'),
+    ('time', 'time'),
+    ('start_at', 'start_at'),
+    ('end_at', 'end_at'),
+    ('status', 'status'),
+    ('appointment_type', 'appointment_type'),
+    ('reason', 'reason'),
+    ('notes', 'notes'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+)
+EXPORT_HEADER = [column for column, _ in EXPORT_COLUMNS]
+
+
+class ImportResult(NamedTuple):
+    created: int
+    # [(line number, message), ...] for every row that was skipped
+    errors: list
+
+
+def filter_export(queryset, start_date=None, end_date=None, status=None, provider_id=None):
+    """Narrow an export to appointments starting between two dates, with a status, for a provider"""
+    if start_date:
+        queryset = queryset.filter(start_at__gte=day_bounds(start_date)[0])
+    if end_date:
+        queryset = queryset.filter(start_at__lt=day_bounds(end_date)[1])
+    if status:
+        queryset = queryset.filter(status=status.upper())
+    if provider_id:
+        queryset = queryset.filter(provider_id=provider_id)
+    return queryset
+
+
+def export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield one dict per appointment in queryset, in (start_at, id) order"""
+    rows = (
+        queryset.order_by('start_at', 'id')
+        .values_list(*(path for _, path in EXPORT_COLUMNS))
+        .iterator(chunk_size=chunk_size)
+    )
+    for row in rows:
+        yield dict(zip(EXPORT_HEADER, row))
+
+
+class _Echo:
+    # csv.writer target that hands each line back instead of buffering it
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_HEADER)
+    for row in rows:
+        yield writer.writerow([row[column] for column in EXPORT_HEADER])
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def export_lines(queryset, format='csv', chunk_size=EXPORT_CHUNK_SIZE):
+    """Lines of a CSV or NDJSON export of queryset, produced lazily"""
+    rows = export_rows(queryset, chunk_size)
+    return csv_lines(rows) if format == 'csv' else ndjson_lines(rows)
+
+
+def read_rows(stream, format='csv'):
+    """Yield (line number, dict) for each record of a CSV or NDJSON text stream"""
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            row = {'_error': f'Invalid JSON: {e}'}
+        if not isinstance(row, dict):
+            row = {'_error': 'Each line must be a JSON object'}
+        yield line_number, row
+
+
+def _parse_date(value):
+    return datetime.strptime(value.strip(), '%Y-%m-%d').date()
+
+
+def _parse_time(value):
+    value = value.strip()
+    return datetime.strptime(value, '%H:%M:%S' if value.count(':') == 2 else '%H:%M').time()
+
+
+class AppointmentImporter:
+    """
+    Validates and inserts appointment records batch by batch. Patients and
+    providers are looked up in dicts; each batch adds the emails it has not
+    seen yet with one query, so lookups never go row by row.
+    """
+    statuses = {value for value, _ in Appointment.STATUS_CHOICES}
+    types = {value for value, _ in Appointment.APPOINTMENT_TYPES}
+
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.patients = {}
+        # The provider table is small enough to load up front
+        self.providers = {
+            license_number.lower(): pk
+            for pk, license_number in ProviderProfile.objects.values_list('pk', 'license_number')
+        }
+        self.providers_by_email = {
+            email.lower(): pk for pk, email in ProviderProfile.objects.values_list('pk', 'user__email')
+        }
+
+    def run(self, rows):
+        """Import (line number, dict) records; returns an ImportResult"""
+        created, errors, batch = 0, [], []
+        for record in rows:
+            batch.append(record)
+            if len(batch) == self.batch_size:
+                created += self.import_batch(batch, errors)
+                batch = []
+        if batch:
+            created += self.import_batch(batch, errors)
+        return ImportResult(created, errors)
+
+    def _load_patients(self, batch):
+        emails = {(row.get('patient_email') or '').strip() for _, row in batch} - {''}
+        emails = {
+            variant for email in emails if email.lower() not in self.patients
+            # Stored addresses keep the case of their local part
+            for variant in (email, email.lower())
+        }
+        if emails:
+            self.patients.update(
+                (email.lower(), pk) for pk, email in
+                get_user_model().objects.filter(email__in=emails).values_list('pk', 'email')
+            )
+
+    def build(self, row):
+        """Unsaved Appointment for a record, or raise ValueError describing what is wrong"""
+        if '_error' in row:
+            raise ValueError(row['_error'])
+        patient_email = (row.get('patient_email') or '').strip().lower()
+        patient_id = self.patients.get(patient_email)
+        if patient_id is None:
+            raise ValueError(f'Unknown patient {patient_email!r}')
+        provider_id = self.providers.get((row.get('provider_license') or '').strip().lower())
+        if provider_id is None:
+            provider_id = self.providers_by_email.get((row.get('provider_email') or '').strip().lower())
+        if provider_id is None:
+            raise ValueError('Unknown provider')
+        status = (row.get('status') or 'SCHEDULED').strip().upper()
+        if status not in self.statuses:
+            raise ValueError(f'Invalid status {status!r}')
+        appointment_type = (row.get('appointment_type') or 'CONSULTATION').strip().upper()
+        if appointment_type not in self.types:
+            raise ValueError(f'Invalid appointment type {appointment_type!r}')
+        reason = (row.get('reason') or '').strip()
+        if not reason:
+            raise ValueError('Reason is required')
+        try:
+            date, time = _parse_date(row.get('date') or ''), _parse_time(row.get('time') or '')
+        except ValueError:
+            raise ValueError('Date must be YYYY-MM-DD and time HH:MM')
+
+        appointment = Appointment(
+            patient_id=patient_id, provider_id=provider_id, date=date, time=time,
+            status=status, appointment_type=appointment_type, reason=reason[:500],
+            notes=row.get('notes') or None,
+        )
+        appointment.sync_window()
+        return appointment
+
+    def import_batch(self, batch, errors):
+        self._load_patients(batch)
+        built, rejected = [], []
+        for line_number, row in batch:
+            try:
+                built.append((line_number, self.build(row)))
+            except ValueError as e:
+                rejected.append((line_number, str(e)))
+
+        if self.dry_run:
+            accepted = self._check_overlaps(built, rejected)
+        else:
+            with transaction.atomic():
+                # Same provider locks as booking, so nothing is booked between the check and the insert
+                accepted = self._insert(self._check_overlaps(built, rejected, lock=True), rejected)
+                appointments = [appointment for _, appointment in accepted]
+                rollups.record_created(appointments)
+                reminders.schedule_reminders(appointments)
+        errors.extend(sorted(rejected))
+        return len(accepted)
+
+    def _check_overlaps(self, built, rejected, lock=False):
+        """
+        Drop scheduled rows that overlap a scheduled appointment, in the database or
+        earlier in the file, using one AvailabilityIndex per provider over the
+        batch's days. Returns the remaining (line number, appointment) pairs.
+        """
+        scheduled = [appointment for _, appointment in built if appointment.status == 'SCHEDULED']
+        if not scheduled:
+            return built
+        providers = ProviderProfile.objects.filter(pk__in={appointment.provider_id for appointment in scheduled})
+        if lock:
+            providers = providers.select_for_update()
+        indexes = {}
+        for provider in providers.order_by('pk'):
+            dates = [appointment.date for appointment in scheduled if appointment.provider_id == provider.pk]
+            indexes[provider.pk] = AvailabilityIndex(provider, min(dates), max(dates))
+
+        accepted = []
+        for line_number, appointment in built:
+            if appointment.status == 'SCHEDULED':
+                index = indexes[appointment.provider_id]
+                if index.is_booked(appointment.date, appointment.time, appointment.duration):
+                    rejected.append((line_number, 'This time slot is already booked'))
+                    continue
+                index.add(appointment.date, appointment.time, appointment.duration)
+            accepted.append((line_number, appointment))
+        return accepted
+
+    def _insert(self, accepted, rejected):
+        """
+        bulk_create the batch; if the database still refuses it (a writer that does not
+        take the provider lock got in first), insert row by row to find the clashing lines.
+        """
+        try:
+            with transaction.atomic():
+                Appointment.objects.bulk_create([appointment for _, appointment in accepted])
+            return accepted
+        except IntegrityError:
+            pass
+        inserted = []
+        for line_number, appointment in accepted:
+            appointment.pk, appointment._state.adding = None, True
+            try:
+                with transaction.atomic():
+                    Appointment.objects.bulk_create([appointment])
+            except IntegrityError:
+                rejected.append((line_number, 'This time slot is already booked'))
+                continue
+            inserted.append((line_number, appointment))
+        return inserted
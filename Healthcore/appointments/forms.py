@@ -1,5 +1,6 @@
 from django import forms
-from .models import Appointment
+from .booking import MAX_SERIES_OCCURRENCES
+from .models import Appointment, AppointmentSeries, WaitlistEntry
 
 class AppointmentForm(forms.ModelForm):
     class Meta:
@@ -15,3 +16,77 @@ class AppointmentForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         for field in self.fields:
             self.fields[field].widget.attrs.update({'class': 'form-control'})
+
+
+class AppointmentSeriesForm(forms.ModelForm):
+    """Books the same slot every interval_days, for a number of occurrences or until end_date"""
+    interval_days = forms.IntegerField(min_value=1, initial=7, help_text='7 for weekly, 14 for every other week')
+    occurrences = forms.IntegerField(min_value=1, max_value=MAX_SERIES_OCCURRENCES, required=False)
+    end_date = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+
+    class Meta:
+        model = AppointmentSeries
+        fields = ['provider', 'start_date', 'time', 'interval_days', 'occurrences', 'appointment_type', 'reason']
+        widgets = {
+            'start_date': forms.DateInput(attrs={'type': 'date'}),
+            'time': forms.TimeInput(attrs={'type': 'time'}),
+            'reason': forms.Textarea(attrs={'rows': 4}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for field in self.fields:
+            self.fields[field].widget.attrs.update({'class': 'form-control'})
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start_date, end_date = cleaned_data.get('start_date'), cleaned_data.get('end_date')
+        if not cleaned_data.get('occurrences') and not end_date:
+            raise forms.ValidationError('Enter the number of appointments or an end date.')
+        if start_date and end_date and end_date < start_date:
+            self.add_error('end_date', 'The end date must not be before the start date.')
+        return cleaned_data
+
+
+class WaitlistEntryForm(forms.ModelForm):
+    """Join the waitlist for one provider, or for anyone in a specialization"""
+    specialization = forms.CharField(max_length=100, required=False)
+
+    class Meta:
+        model = WaitlistEntry
+        fields = [
+            'provider', 'specialization', 'earliest_date', 'latest_date',
+            'earliest_time', 'latest_time', 'appointment_type', 'reason',
+        ]
+        widgets = {
+            'earliest_date': forms.DateInput(attrs={'type': 'date'}),
+            'latest_date': forms.DateInput(attrs={'type': 'date'}),
+            'earliest_time': forms.TimeInput(attrs={'type': 'time'}),
+            'latest_time': forms.TimeInput(attrs={'type': 'time'}),
+            'reason': forms.Textarea(attrs={'rows': 4}),
+        }
+        help_texts = {
+            'provider': 'Leave blank to take the first opening with any provider in the specialization',
+            'earliest_time': 'Leave the times blank if any time of day suits you',
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['provider'].queryset = self.fields['provider'].queryset.select_related('user')
+        for field in self.fields:
+            self.fields[field].widget.attrs.update({'class': 'form-control'})
+
+    def clean(self):
+        cleaned_data = super().clean()
+        provider = cleaned_data.get('provider')
+        if provider is not None:
+            cleaned_data['specialization'] = provider.specialization
+        elif not cleaned_data.get('specialization'):
+            raise forms.ValidationError('Choose a provider or enter a specialization.')
+        earliest_date, latest_date = cleaned_data.get('earliest_date'), cleaned_data.get('latest_date')
+        if earliest_date and latest_date and latest_date < earliest_date:
+            self.add_error('latest_date', 'The latest date must not be before the earliest date.')
+        earliest_time, latest_time = cleaned_data.get('earliest_time'), cleaned_data.get('latest_time')
+        if earliest_time and latest_time and latest_time < earliest_time:
+            self.add_error('latest_time', 'The latest time must not be before the earliest time.')
+        return cleaned_data
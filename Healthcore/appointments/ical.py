@@ -0,0 +1,79 @@
+"""
+iCalendar (RFC 5545) rendering for appointments.
+
+calendar_lines() yields a VCALENDAR line by line, so feeds with many events
+can be streamed. Times are written in UTC from the stored start_at/end_at.
+"""
+from datetime import timezone as dt_timezone
+from django.utils import timezone
+
+PRODID = '-//MediConnect//Appointments//EN'
+# Longest line in octets before it is folded onto a continuation line
+MAX_LINE_OCTETS = 75
+
+
+def _escape(text):
+    return (
+        str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def _fold(line):
+    # Continuation lines start with a space, which counts towards their length
+    encoded = line.encode()
+    if len(encoded) <= MAX_LINE_OCTETS:
+        return line + '\r\n'
+    parts, current, limit = [], b'', MAX_LINE_OCTETS
+    for char in line:
+        octets = char.encode()
+        if len(current) + len(octets) > limit:
+            parts.append(current.decode())
+            current, limit = b'', MAX_LINE_OCTETS - 1
+        current += octets
+    parts.append(current.decode())
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _utc(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def event_lines(appointment):
+    """VEVENT lines for one appointment; patient and provider must be loaded"""
+    type_display = appointment.get_appointment_type_display()
+    description = (
+        f'Appointment Type: {type_display}\n'
+        f'Reason: {appointment.reason}\n'
+        f'Provider: {appointment.provider.user.get_full_name()}'
+    )
+    # Unsaved appointments have no updated_at yet
+    stamp = _utc(appointment.updated_at or timezone.now())
+    yield 'BEGIN:VEVENT'
+    yield f'UID:appointment-{appointment.pk}@mediconnect'
+    yield f'DTSTAMP:{stamp}'
+    yield f'LAST-MODIFIED:{stamp}'
+    yield f'DTSTART:{_utc(appointment.start_at)}'
+    yield f'DTEND:{_utc(appointment.end_at)}'
+    yield f'SUMMARY:{_escape(f"Medical Appointment - {type_display}")}'
+    yield f'DESCRIPTION:{_escape(description)}'
+    yield f'LOCATION:{_escape(appointment.provider.hospital_affiliation or "TBD")}'
+    yield f'STATUS:{"CANCELLED" if appointment.status == "CANCELLED" else "CONFIRMED"}'
+    yield 'END:VEVENT'
+
+
+def calendar_lines(appointments, name=None):
+    """Folded, CRLF-terminated lines of a calendar holding appointments (any iterable)"""
+    header = ['BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODID}', 'CALSCALE:GREGORIAN', 'METHOD:PUBLISH']
+    if name:
+        header.append(f'X-WR-CALNAME:{_escape(name)}')
+    for line in header:
+        yield _fold(line)
+    for appointment in appointments:
+        for line in event_lines(appointment):
+            yield _fold(line)
+    yield _fold('END:VCALENDAR')
+
+
+def render_calendar(appointments, name=None):
+    return ''.join(calendar_lines(appointments, name))
@@ -0,0 +1,38 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from appointments.availability import day_bounds
+from appointments.models import Appointment
+from appointments.transitions import DEFAULT_CHUNK_SIZE, transition_status
+
+class Command(BaseCommand):
+    help = 'End-of-day closing: move scheduled appointments that have ended to a final status, across all providers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Close appointments up to the end of this day (YYYY-MM-DD); defaults to today')
+        parser.add_argument('--status', choices=('COMPLETED', 'NO_SHOW'), default='COMPLETED')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options['date']:
+            try:
+                target_date = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--date must be in YYYY-MM-DD format')
+        else:
+            target_date = timezone.localdate()
+
+        _, day_end = day_bounds(target_date)
+        # Only appointments that are over; later ones today stay open
+        queryset = Appointment.objects.filter(
+            status='SCHEDULED', start_at__lt=day_end, end_at__lte=timezone.now()
+        )
+        closed = transition_status(
+            queryset, options['status'], source='command', chunk_size=options['chunk_size']
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Closed {closed} appointments through {target_date} as {options["status"]}'
+            )
+        )
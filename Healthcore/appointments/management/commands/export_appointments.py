@@ -0,0 +1,35 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from appointments.exchange import EXPORT_CHUNK_SIZE, FORMATS, export_lines, filter_export
+from appointments.models import Appointment
+
+class Command(BaseCommand):
+    help = 'Stream appointments to a CSV or NDJSON file (or stdout) in constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--output', help='File to write; defaults to stdout')
+        parser.add_argument('--start', help='First day to export (YYYY-MM-DD)')
+        parser.add_argument('--end', help='Last day to export (YYYY-MM-DD)')
+        parser.add_argument('--status')
+        parser.add_argument('--provider', type=int, help='Provider profile id')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            start, end = (
+                datetime.strptime(options[name], '%Y-%m-%d').date() if options[name] else None
+                for name in ('start', 'end')
+            )
+        except ValueError:
+            raise CommandError('--start and --end must be in YYYY-MM-DD format')
+
+        queryset = filter_export(Appointment.objects.all(), start, end, options['status'], options['provider'])
+        lines = export_lines(queryset, options['format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(lines)
+            self.stdout.write(self.style.SUCCESS(f'Exported appointments to {options["output"]}'))
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,40 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from appointments.exchange import FORMATS, IMPORT_BATCH_SIZE, AppointmentImporter, read_rows
+
+# Skipped rows listed individually before the rest are only counted
+MAX_REPORTED_ERRORS = 50
+
+class Command(BaseCommand):
+    help = (
+        'Load appointments from a CSV or NDJSON file in validated bulk batches. '
+        'Imported appointments send no notifications.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Validate only; nothing is written')
+
+    def handle(self, *args, **options):
+        import_format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if import_format not in FORMATS:
+            raise CommandError(f'Cannot tell the format of {options["path"]}; pass --format')
+        try:
+            source = open(options['path'], newline='', encoding='utf-8')
+        except OSError as e:
+            raise CommandError(str(e))
+
+        importer = AppointmentImporter(options['batch_size'], options['dry_run'])
+        with source:
+            result = importer.run(read_rows(source, import_format))
+
+        for line_number, message in result.errors[:MAX_REPORTED_ERRORS]:
+            self.stderr.write(f'Line {line_number}: {message}')
+        if len(result.errors) > MAX_REPORTED_ERRORS:
+            self.stderr.write(f'... and {len(result.errors) - MAX_REPORTED_ERRORS} more')
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        self.stdout.write(
+            self.style.SUCCESS(f'{verb} {result.created} appointments, skipped {len(result.errors)} rows')
+        )
@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand
+from appointments.outbox import deliver_pending, DEFAULT_BATCH_SIZE, DEFAULT_MAX_ATTEMPTS
+
+class Command(BaseCommand):
+    help = 'Deliver queued appointment notifications from the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS)
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox instead of exiting when it is drained')
+        parser.add_argument('--sleep', type=float, default=5.0, help='Seconds to wait between polls in --loop mode')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = deliver_pending(options['batch_size'], options['max_attempts'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f'Batch delivered: {sent} sent, {failed} failed')
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Outbox drained: {total_sent} sent, {total_failed} failed'
+            )
+        )
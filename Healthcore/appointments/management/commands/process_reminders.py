@@ -0,0 +1,42 @@
+import time
+from django.core.management.base import BaseCommand
+from appointments.reminders import DEFAULT_BATCH_SIZE, schedule_upcoming, send_due_reminders
+from appointments.outbox import DEFAULT_MAX_ATTEMPTS
+
+class Command(BaseCommand):
+    help = (
+        'Send appointment reminders as they fall due (see REMINDER_OFFSETS). Several '
+        'workers can run side by side: each skips the rows another one has locked.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS)
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting when nothing is due')
+        parser.add_argument('--sleep', type=float, default=30.0, help='Seconds to wait between polls in --loop mode')
+        parser.add_argument(
+            '--backfill', action='store_true',
+            help='First queue reminders for upcoming appointments booked before the queue existed',
+        )
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            seen = schedule_upcoming()
+            self.stdout.write(f'Reminders queued for {seen} upcoming appointments')
+
+        total_sent = total_skipped = total_failed = 0
+        while True:
+            sent, skipped, failed = send_due_reminders(options['batch_size'], options['max_attempts'])
+            total_sent += sent
+            total_skipped += skipped
+            total_failed += failed
+            if sent or skipped or failed:
+                self.stdout.write(f'Batch processed: {sent} sent, {skipped} skipped, {failed} failed')
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Reminders processed: {total_sent} sent, {total_skipped} skipped, {total_failed} failed')
+        )
@@ -0,0 +1,35 @@
+import time
+from django.core.management.base import BaseCommand
+from appointments.waitlist import DEFAULT_BATCH_SIZE, expire_offers, notify_offers, retire_stale_entries
+
+class Command(BaseCommand):
+    help = 'Email new waitlist offers, expire lapsed ones and offer their slots to the next patient in line'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting when there is nothing to do')
+        parser.add_argument('--sleep', type=float, default=5.0, help='Seconds to wait between polls in --loop mode')
+
+    def handle(self, *args, **options):
+        retired = retire_stale_entries()
+        total_expired = total_reoffered = total_notified = 0
+        while True:
+            expired, reoffered = expire_offers(options['batch_size'])
+            # Cascaded offers are emailed in the same pass
+            notified = notify_offers(options['batch_size'])
+            total_expired += expired
+            total_reoffered += reoffered
+            total_notified += notified
+            if expired or notified:
+                self.stdout.write(f'Batch processed: {expired} expired, {reoffered} re-offered, {notified} notified')
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Waitlist processed: {total_expired} offers expired, {total_reoffered} re-offered, '
+                f'{total_notified} notified, {retired} stale entries retired'
+            )
+        )
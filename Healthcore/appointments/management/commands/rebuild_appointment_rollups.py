@@ -0,0 +1,35 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+from appointments.models import Appointment
+from appointments.rollups import REBUILD_CHUNK_DAYS, rebuild
+
+class Command(BaseCommand):
+    help = 'Recompute the daily appointment rollups behind the admin dashboard from the appointments table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD); defaults to the earliest appointment')
+        parser.add_argument('--end', help='Last day to rebuild (YYYY-MM-DD); defaults to the latest appointment')
+        parser.add_argument('--chunk-days', type=int, default=REBUILD_CHUNK_DAYS)
+
+    def handle(self, *args, **options):
+        # Both ends of the date range come straight off the start_at index
+        bounds = Appointment.objects.aggregate(first=Min('start_at'), last=Max('start_at'))
+        if bounds['first'] is None and not (options['start'] and options['end']):
+            self.stdout.write('No appointments to roll up')
+            return
+        try:
+            start = (
+                datetime.strptime(options['start'], '%Y-%m-%d').date() if options['start']
+                else timezone.localdate(bounds['first'])
+            )
+            end = (
+                datetime.strptime(options['end'], '%Y-%m-%d').date() if options['end']
+                else timezone.localdate(bounds['last'])
+            )
+        except ValueError:
+            raise CommandError('--start and --end must be in YYYY-MM-DD format')
+
+        written = rebuild(start, end, options['chunk_days'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rollups for {start} to {end}: {written} rows'))
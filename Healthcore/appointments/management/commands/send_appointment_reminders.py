@@ -1,39 +1,54 @@
-from django.core.management.base import BaseCommand
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
-from appointments.models import Appointment
-from appointments.utils import send_appointment_notification
-from datetime import timedelta
+from appointments.reminders import dispatch_reminders, DEFAULT_CHUNK_SIZE, SHARD_BY_CHOICES
 
 class Command(BaseCommand):
-    help = 'Send appointment reminders for upcoming appointments'
+    help = (
+        'Send appointment reminders for a whole day of appointments. process_reminders '
+        'sends them as they fall due; this sweep is kept for catch-up runs. Runs are '
+        'resumable: appointments whose reminder was already delivered are skipped. Start '
+        'N processes with --shards N --shard 0..N-1 to split the work.'
+    )
 
-    def handle(self, *args, **options):
-        # Get tomorrow's appointments
-        tomorrow = timezone.now().date() + timedelta(days=1)
-        upcoming_appointments = Appointment.objects.filter(
-            date=tomorrow,
-            status='SCHEDULED'
-        )
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Appointment date (YYYY-MM-DD), defaults to tomorrow')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--shards', type=int, default=1, help='Total number of worker processes')
+        parser.add_argument('--shard', type=int, default=0, help='Index of this worker, 0-based')
+        parser.add_argument('--shard-by', choices=SHARD_BY_CHOICES, default='id')
 
-        reminders_sent = 0
-        for appointment in upcoming_appointments:
+    def handle(self, *args, **options):
+        if options['date']:
             try:
-                send_appointment_notification(appointment, 'reminder')
-                reminders_sent += 1
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f'Successfully sent reminder for appointment {appointment.id}'
-                    )
-                )
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(
-                        f'Failed to send reminder for appointment {appointment.id}: {str(e)}'
-                    )
+                target_date = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--date must be in YYYY-MM-DD format')
+        else:
+            # Get tomorrow's appointments
+            target_date = timezone.now().date() + timedelta(days=1)
+
+        if not 0 <= options['shard'] < options['shards']:
+            raise CommandError('--shard must be between 0 and --shards - 1')
+
+        def report_error(appointment, error):
+            self.stdout.write(
+                self.style.ERROR(
+                    f'Failed to send reminder for appointment {appointment.id}: {str(error)}'
                 )
+            )
+
+        reminders_sent, reminders_failed = dispatch_reminders(
+            target_date,
+            shard=options['shard'],
+            shards=options['shards'],
+            shard_by=options['shard_by'],
+            chunk_size=options['chunk_size'],
+            on_error=report_error,
+        )
 
         self.stdout.write(
             self.style.SUCCESS(
-                f'Successfully sent {reminders_sent} reminders'
+                f'Successfully sent {reminders_sent} reminders ({reminders_failed} failed)'
             )
         )
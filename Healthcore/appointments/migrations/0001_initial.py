@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2025-08-04 10:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('accounts', '0002_alter_providerprofile_consultation_fee'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Appointment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('time', models.TimeField()),
+                ('status', models.CharField(choices=[('SCHEDULED', 'Scheduled'), ('COMPLETED', 'Completed'), ('CANCELLED', 'Cancelled'), ('NO_SHOW', 'No Show')], default='SCHEDULED', max_length=20)),
+                ('appointment_type', models.CharField(choices=[('ROUTINE', 'Routine Checkup'), ('FOLLOW_UP', 'Follow-up'), ('CONSULTATION', 'Consultation'), ('EMERGENCY', 'Emergency')], default='CONSULTATION', max_length=20)),
+                ('reason', models.TextField(max_length=500)),
+                ('notes', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='patient_appointments', to=settings.AUTH_USER_MODEL)),
+                ('provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='provider_appointments', to='accounts.providerprofile')),
+            ],
+            options={
+                'ordering': ['-date', '-time'],
+            },
+        ),
+    ]
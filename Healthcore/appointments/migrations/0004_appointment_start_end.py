@@ -0,0 +1,68 @@
+# Hand-written: the schema operations are what makemigrations produces, with a
+# RunPython step between them that backfills start_at/end_at for existing rows.
+
+from datetime import datetime, timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+# Frozen copy of Appointment.DURATIONS at the time of this migration
+DURATIONS = {
+    'ROUTINE': 30,
+    'FOLLOW_UP': 15,
+    'CONSULTATION': 30,
+    'EMERGENCY': 60,
+}
+
+
+def populate_window(apps, schema_editor):
+    Appointment = apps.get_model('appointments', 'Appointment')
+    site_tz = timezone.get_default_timezone()
+    batch = []
+    for appointment in Appointment.objects.only('id', 'date', 'time', 'appointment_type').iterator(chunk_size=2000):
+        appointment.start_at = timezone.make_aware(datetime.combine(appointment.date, appointment.time), site_tz)
+        appointment.end_at = appointment.start_at + timedelta(minutes=DURATIONS.get(appointment.appointment_type, 30))
+        batch.append(appointment)
+        if len(batch) >= 2000:
+            Appointment.objects.bulk_update(batch, ['start_at', 'end_at'])
+            batch = []
+    Appointment.objects.bulk_update(batch, ['start_at', 'end_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0003_slot_constraints_and_holds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='start_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='end_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(populate_window, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='appointment',
+            name='start_at',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='end_at',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['start_at'], name='appointment_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['provider', 'start_at'], name='appointment_provider_start_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_providerprofile_updated_at'),
+        ('appointments', '0006_statustransition'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboxmessage',
+            name='event',
+            field=models.CharField(choices=[('confirmation', 'Confirmation'), ('reminder', 'Reminder'), ('cancellation', 'Cancellation'), ('rescheduled', 'Rescheduled'), ('status_update', 'Status Update'), ('series_confirmation', 'Series Confirmation')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='AppointmentSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appointment_type', models.CharField(choices=[('ROUTINE', 'Routine Checkup'), ('FOLLOW_UP', 'Follow-up'), ('CONSULTATION', 'Consultation'), ('EMERGENCY', 'Emergency')], default='FOLLOW_UP', max_length=20)),
+                ('reason', models.TextField(max_length=500)),
+                ('start_date', models.DateField()),
+                ('time', models.TimeField()),
+                ('interval_days', models.PositiveSmallIntegerField(default=7)),
+                ('occurrences', models.PositiveSmallIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='appointment_series', to=settings.AUTH_USER_MODEL)),
+                ('provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='appointment_series', to='accounts.providerprofile')),
+            ],
+            options={
+                'verbose_name_plural': 'appointment series',
+            },
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='series',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='appointments', to='appointments.appointmentseries'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_providerprofile_updated_at'),
+        ('appointments', '0007_appointmentseries'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('specialization', models.CharField(max_length=100)),
+                ('appointment_type', models.CharField(choices=[('ROUTINE', 'Routine Checkup'), ('FOLLOW_UP', 'Follow-up'), ('CONSULTATION', 'Consultation'), ('EMERGENCY', 'Emergency')], default='CONSULTATION', max_length=20)),
+                ('reason', models.TextField(max_length=500)),
+                ('earliest_date', models.DateField()),
+                ('latest_date', models.DateField()),
+                ('earliest_time', models.TimeField(blank=True, null=True)),
+                ('latest_time', models.TimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('WAITING', 'Waiting'), ('OFFERED', 'Offered'), ('BOOKED', 'Booked'), ('WITHDRAWN', 'Withdrawn'), ('EXPIRED', 'Expired')], default='WAITING', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to=settings.AUTH_USER_MODEL)),
+                ('provider', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='accounts.providerprofile')),
+            ],
+            options={
+                'verbose_name_plural': 'waitlist entries',
+            },
+        ),
+        migrations.CreateModel(
+            name='WaitlistOffer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('time', models.TimeField()),
+                ('duration', models.PositiveSmallIntegerField()),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('ACCEPTED', 'Accepted'), ('DECLINED', 'Declined'), ('EXPIRED', 'Expired')], default='PENDING', max_length=20)),
+                ('expires_at', models.DateTimeField()),
+                ('notified_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='offers', to='appointments.waitlistentry')),
+                ('provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_offers', to='accounts.providerprofile')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='waitlistentry',
+            index=models.Index(condition=models.Q(('status', 'WAITING')), fields=['specialization', 'created_at', 'id'], name='waitlist_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='waitlistentry',
+            index=models.Index(fields=['patient', 'status'], name='waitlist_patient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='waitlistoffer',
+            index=models.Index(fields=['provider', 'date', 'time'], name='waitlist_offer_slot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='waitlistoffer',
+            index=models.Index(condition=models.Q(('status', 'PENDING')), fields=['expires_at'], name='waitlist_offer_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_providerprofile_updated_at'),
+        ('appointments', '0008_waitlist'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('specialization', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('SCHEDULED', 'Scheduled'), ('COMPLETED', 'Completed'), ('CANCELLED', 'Cancelled'), ('NO_SHOW', 'No Show')], max_length=20)),
+                ('appointment_type', models.CharField(choices=[('ROUTINE', 'Routine Checkup'), ('FOLLOW_UP', 'Follow-up'), ('CONSULTATION', 'Consultation'), ('EMERGENCY', 'Emergency')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='accounts.providerprofile')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'provider', 'status', 'appointment_type'), name='unique_daily_stat')],
+            },
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Hand-written: database-level backstop against overlapping scheduled
+# appointments, which a UniqueConstraint cannot express. PostgreSQL gets an
+# exclusion constraint over the [start_at, end_at) range, SQLite a pair of
+# triggers; other backends rely on the booking service's provider lock alone.
+# SQLite drops triggers with their table, so a later migration that makes it
+# rebuild appointments_appointment has to create them again.
+
+from django.db import migrations
+
+SQLITE_OVERLAP = """
+    NEW.status = 'SCHEDULED' AND EXISTS (
+        SELECT 1 FROM appointments_appointment
+        WHERE provider_id = NEW.provider_id AND status = 'SCHEDULED'
+          AND start_at < NEW.end_at AND end_at > NEW.start_at {extra}
+    )
+"""
+
+SQLITE_FORWARD = [
+    f"""
+    CREATE TRIGGER appointment_no_overlap_insert
+    BEFORE INSERT ON appointments_appointment
+    WHEN {SQLITE_OVERLAP.format(extra='')}
+    BEGIN SELECT RAISE(ABORT, 'appointment_no_overlap'); END
+    """,
+    f"""
+    CREATE TRIGGER appointment_no_overlap_update
+    BEFORE UPDATE OF provider_id, status, start_at, end_at ON appointments_appointment
+    WHEN {SQLITE_OVERLAP.format(extra='AND id != NEW.id')}
+    BEGIN SELECT RAISE(ABORT, 'appointment_no_overlap'); END
+    """,
+]
+
+SQLITE_REVERSE = [
+    'DROP TRIGGER IF EXISTS appointment_no_overlap_insert',
+    'DROP TRIGGER IF EXISTS appointment_no_overlap_update',
+]
+
+POSTGRESQL_FORWARD = [
+    # Lets the gist index compare provider_id with =
+    'CREATE EXTENSION IF NOT EXISTS btree_gist',
+    """
+    ALTER TABLE appointments_appointment ADD CONSTRAINT appointment_no_overlap
+    EXCLUDE USING gist (provider_id WITH =, tstzrange(start_at, end_at) WITH &&)
+    WHERE (status = 'SCHEDULED')
+    """,
+]
+
+POSTGRESQL_REVERSE = [
+    'ALTER TABLE appointments_appointment DROP CONSTRAINT IF EXISTS appointment_no_overlap',
+]
+
+
+def _run(schema_editor, statements):
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def add_overlap_guard(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD})
+
+
+def remove_overlap_guard(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRESQL_REVERSE})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0011_scheduledreminder'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_overlap_guard, remove_overlap_guard),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0012_appointment_no_overlap'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='waitlistoffer',
+            name='notify_claimed_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
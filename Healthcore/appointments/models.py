@@ -1,12 +1,14 @@
-from django.db import models
+import secrets
+from django.db import models, transaction
 from django.conf import settings
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils import timezone
+from datetime import datetime, timedelta
 from accounts.models import ProviderProfile
+from Healthcore.tracking import FieldTrackerMixin
+from .utils import generate_ical_event
 
-class Appointment(models.Model):
+class Appointment(FieldTrackerMixin, models.Model):
     STATUS_CHOICES = [
         ('SCHEDULED', 'Scheduled'),
         ('COMPLETED', 'Completed'),
@@ -21,6 +23,15 @@ class Appointment(models.Model):
         ('EMERGENCY', 'Emergency'),
     ]
 
+    # Length of each appointment type in minutes
+    DURATIONS = {
+        'ROUTINE': 30,
+        'FOLLOW_UP': 15,
+        'CONSULTATION': 30,
+        'EMERGENCY': 60,
+    }
+    DEFAULT_DURATION = 30
+
     patient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='patient_appointments')
     provider = models.ForeignKey(ProviderProfile, on_delete=models.CASCADE, related_name='provider_appointments')
     date = models.DateField()
@@ -29,105 +40,84 @@ class Appointment(models.Model):
     appointment_type = models.CharField(max_length=20, choices=APPOINTMENT_TYPES, default='CONSULTATION')
     reason = models.TextField(max_length=500)
     notes = models.TextField(blank=True, null=True)
+    # Set for occurrences booked together as a recurring series
+    series = models.ForeignKey(
+        'AppointmentSeries', on_delete=models.SET_NULL, null=True, blank=True, related_name='appointments'
+    )
+    # Timezone-aware window derived from date/time and appointment_type on save
+    start_at = models.DateTimeField(editable=False)
+    end_at = models.DateTimeField(editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        ordering = ['-date', '-time']
+        # No default ordering: every hot query orders on an indexed (..., start_at, id)
+        # prefix itself, and a Meta.ordering would add a sort to every other queryset
+        indexes = [
+            models.Index(fields=['start_at'], name='appointment_start_idx'),
+            # Provider's past list (any status)
+            models.Index(fields=['provider', 'start_at'], name='appointment_provider_start_idx'),
+            # Provider schedule, availability and the provider's upcoming list
+            models.Index(fields=['provider', 'status', 'start_at'], name='appointment_prov_status_idx'),
+            # Patient's past and upcoming lists
+            models.Index(fields=['patient', 'start_at'], name='appointment_patient_start_idx'),
+            models.Index(fields=['patient', 'status', 'start_at'], name='appointment_pat_status_idx'),
+            # Reminder selection and other scheduled-only range scans
+            models.Index(fields=['status', 'start_at'], name='appointment_status_start_idx'),
+        ]
+        constraints = [
+            # Backstop for the booking service: two scheduled appointments can
+            # never claim the same provider slot, whatever races the app layer loses.
+            # It only covers identical start times; overlapping windows (09:00 for
+            # 60 minutes and 09:30) are rejected by the appointment_no_overlap
+            # exclusion constraint (PostgreSQL) or triggers (SQLite) of migration 0012.
+            models.UniqueConstraint(
+                fields=['provider', 'date', 'time'],
+                condition=models.Q(status='SCHEDULED'),
+                name='unique_scheduled_provider_slot',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.patient.username} - {self.provider.user.username} - {self.date} {self.time}"
 
-    def save(self, *args, **kwargs):
-        # Check if this is a new appointment or status has changed
-        is_new = not self.pk
-        if not is_new:
-            old_instance = Appointment.objects.get(pk=self.pk)
-            status_changed = old_instance.status != self.status
-        else:
-            status_changed = False
-
-        # Save the instance
-        super().save(*args, **kwargs)
-
-        # Send notifications
-        if is_new:
-            self.send_confirmation_emails()
-        elif status_changed:
-            self.send_status_update_emails()
-
-    def send_confirmation_emails(self):
-        # Send to patient
-        subject = 'Appointment Confirmation'
-        patient_message = render_to_string('appointments/email/patient_confirmation.html', {
-            'appointment': self,
-            'calendar_link': self.get_calendar_link()
-        })
-        send_mail(
-            subject,
-            patient_message,
-            settings.DEFAULT_FROM_EMAIL,
-            [self.patient.email],
-            fail_silently=True,
-        )
+    @classmethod
+    def duration_for(cls, appointment_type):
+        return cls.DURATIONS.get(appointment_type, cls.DEFAULT_DURATION)
 
-        # Send to provider
-        provider_message = render_to_string('appointments/email/provider_confirmation.html', {
-            'appointment': self,
-            'calendar_link': self.get_calendar_link()
-        })
-        send_mail(
-            subject,
-            provider_message,
-            settings.DEFAULT_FROM_EMAIL,
-            [self.provider.user.email],
-            fail_silently=True,
-        )
+    @property
+    def duration(self):
+        return self.duration_for(self.appointment_type)
 
-    def send_status_update_emails(self):
-        subject = f'Appointment Status Update: {self.get_status_display()}'
-        message = render_to_string('appointments/email/status_update.html', {
-            'appointment': self,
-        })
-        # Send to both patient and provider
-        recipients = [self.patient.email, self.provider.user.email]
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            recipients,
-            fail_silently=True,
+    def sync_window(self):
+        """
+        Derive start_at/end_at from date, time and appointment type. date/time are
+        wall-clock values in the site timezone (settings.TIME_ZONE). Called by save();
+        call it yourself before bulk_create.
+        """
+        self.start_at = timezone.make_aware(
+            datetime.combine(self.date, self.time), timezone.get_default_timezone()
         )
+        self.end_at = self.start_at + timedelta(minutes=self.duration)
+
+    def save(self, *args, **kwargs):
+        self.sync_window()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'date', 'time', 'appointment_type'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'start_at', 'end_at'}
+
+        # The post_save receiver reads the changed fields to queue notifications
+        # in the outbox, so the appointment change and its notifications commit together
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def get_calendar_link(self):
-        """Generate iCalendar link for the appointment"""
-        datetime_start = timezone.make_aware(
-            timezone.datetime.combine(self.date, self.time)
-        )
-        datetime_end = datetime_start + timezone.timedelta(minutes=30)
-        
-        # Basic iCal format
-        ical_data = f"""
-BEGIN:VCALENDAR
-VERSION:2.0
-BEGIN:VEVENT
-DTSTART:{datetime_start.strftime('%Y%m%dT%H%M%SZ')}
-DTEND:{datetime_end.strftime('%Y%m%dT%H%M%SZ')}
-SUMMARY:Medical Appointment with {self.provider.user.get_full_name()}
-DESCRIPTION:{self.reason}
-LOCATION:{self.provider.office_address}
-END:VEVENT
-END:VCALENDAR
-"""
-        return ical_data
+        """Generate iCalendar data for the appointment"""
+        return generate_ical_event(self)
 
     def is_upcoming(self):
         """Check if the appointment is upcoming"""
-        now = timezone.now()
-        appointment_datetime = timezone.make_aware(
-            timezone.datetime.combine(self.date, self.time)
-        )
-        return appointment_datetime > now
+        return self.start_at > timezone.now()
 
     def can_be_cancelled(self):
         """Check if the appointment can be cancelled"""
@@ -136,3 +126,312 @@ END:VCALENDAR
     def get_absolute_url(self):
         """Get the absolute URL for this appointment"""
         return reverse('appointments:appointment_detail', kwargs={'pk': self.pk})
+
+
+class AppointmentSeries(models.Model):
+    """A recurring booking: the same slot every interval_days, created in one go"""
+    patient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='appointment_series')
+    provider = models.ForeignKey(ProviderProfile, on_delete=models.CASCADE, related_name='appointment_series')
+    appointment_type = models.CharField(max_length=20, choices=Appointment.APPOINTMENT_TYPES, default='FOLLOW_UP')
+    reason = models.TextField(max_length=500)
+    start_date = models.DateField()
+    time = models.TimeField()
+    interval_days = models.PositiveSmallIntegerField(default=7)
+    occurrences = models.PositiveSmallIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'appointment series'
+
+    def __str__(self):
+        return f"{self.patient.username} - {self.provider.user.username} every {self.interval_days} days from {self.start_date}"
+
+
+class WaitlistEntry(models.Model):
+    """
+    A patient waiting for a slot to free up: with one provider or anyone in a
+    specialization, between two dates and optionally within a time-of-day window.
+    Entries are offered freed slots first come, first served.
+    """
+    STATUS_CHOICES = [
+        ('WAITING', 'Waiting'),
+        ('OFFERED', 'Offered'),
+        ('BOOKED', 'Booked'),
+        ('WITHDRAWN', 'Withdrawn'),
+        ('EXPIRED', 'Expired'),
+    ]
+
+    patient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='waitlist_entries')
+    specialization = models.CharField(max_length=100)
+    # Blank for any provider in the specialization
+    provider = models.ForeignKey(
+        ProviderProfile, on_delete=models.CASCADE, null=True, blank=True, related_name='waitlist_entries'
+    )
+    appointment_type = models.CharField(max_length=20, choices=Appointment.APPOINTMENT_TYPES, default='CONSULTATION')
+    reason = models.TextField(max_length=500)
+    earliest_date = models.DateField()
+    latest_date = models.DateField()
+    # Start times the patient can make; blank for any time
+    earliest_time = models.TimeField(null=True, blank=True)
+    latest_time = models.TimeField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='WAITING')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'waitlist entries'
+        indexes = [
+            # Matching walks the waiting entries of one specialization in queue order
+            models.Index(
+                fields=['specialization', 'created_at', 'id'], name='waitlist_queue_idx',
+                condition=models.Q(status='WAITING'),
+            ),
+            models.Index(fields=['patient', 'status'], name='waitlist_patient_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.patient.username} waiting for {self.provider or self.specialization} {self.earliest_date} - {self.latest_date}"
+
+
+class WaitlistOffer(models.Model):
+    """A freed slot offered to a waitlist entry, reserved for it by a SlotHold until expires_at"""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('ACCEPTED', 'Accepted'),
+        ('DECLINED', 'Declined'),
+        ('EXPIRED', 'Expired'),
+    ]
+
+    entry = models.ForeignKey(WaitlistEntry, on_delete=models.CASCADE, related_name='offers')
+    provider = models.ForeignKey(ProviderProfile, on_delete=models.CASCADE, related_name='waitlist_offers')
+    date = models.DateField()
+    time = models.TimeField()
+    # Length of the freed gap, in minutes
+    duration = models.PositiveSmallIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    expires_at = models.DateTimeField()
+    notified_at = models.DateTimeField(null=True, blank=True)
+    # Set while a process_waitlist worker is mailing the offer; other workers skip it until then
+    notify_claimed_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Everyone already offered a slot is skipped when it cascades
+            models.Index(fields=['provider', 'date', 'time'], name='waitlist_offer_slot_idx'),
+            models.Index(
+                fields=['expires_at'], name='waitlist_offer_pending_idx', condition=models.Q(status='PENDING'),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} {self.date} {self.time} offered to {self.entry.patient_id} until {self.expires_at}"
+
+    @property
+    def is_open(self):
+        return self.status == 'PENDING' and self.expires_at > timezone.now()
+
+
+class AppointmentDailyStat(models.Model):
+    """
+    Number of appointments per day, provider, status and type, kept current by
+    appointments.rollups as appointments change, so reports never aggregate the
+    Appointment table itself. specialization is the provider's at the time the
+    row was first written.
+    """
+    date = models.DateField()
+    provider = models.ForeignKey(ProviderProfile, on_delete=models.CASCADE, related_name='daily_stats')
+    specialization = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, choices=Appointment.STATUS_CHOICES)
+    appointment_type = models.CharField(max_length=20, choices=Appointment.APPOINTMENT_TYPES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'provider', 'status', 'appointment_type'], name='unique_daily_stat',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.provider_id} {self.status} {self.appointment_type}: {self.count}"
+
+
+def new_feed_token():
+    return secrets.token_urlsafe(32)
+
+
+class CalendarFeed(models.Model):
+    """
+    Secret-URL .ics subscription to a user's upcoming appointments, either as
+    patient or, for provider accounts, on their schedule. Resetting the token
+    cuts off every calendar subscribed with the old URL.
+    """
+    KIND_CHOICES = [
+        ('patient', 'Patient'),
+        ('provider', 'Provider'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='calendar_feeds')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    token = models.CharField(max_length=64, unique=True, default=new_feed_token)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind'], name='unique_calendar_feed'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} {self.kind} feed"
+
+    def get_absolute_url(self):
+        return reverse('appointments:calendar_feed', kwargs={'token': self.token})
+
+    def appointments(self):
+        """Upcoming appointments in the feed, of every status"""
+        appointments = Appointment.objects.filter(start_at__gte=timezone.now())
+        if self.kind == 'provider':
+            return appointments.filter(provider__user_id=self.user_id)
+        return appointments.filter(patient_id=self.user_id)
+
+    def reset_token(self):
+        self.token = new_feed_token()
+        self.save(update_fields=['token'])
+
+
+class SlotHold(models.Model):
+    """Short-lived reservation of a provider slot while a patient fills in the booking form"""
+    provider = models.ForeignKey(ProviderProfile, on_delete=models.CASCADE, related_name='slot_holds')
+    date = models.DateField()
+    time = models.TimeField()
+    holder = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='slot_holds')
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'date', 'time'], name='unique_slot_hold'),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} {self.date} {self.time} held by {self.holder_id} until {self.expires_at}"
+
+    @property
+    def is_active(self):
+        return self.expires_at > timezone.now()
+
+class OutboxMessage(models.Model):
+    """Pending appointment notification, written in the same transaction as the change that caused it"""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+    ]
+
+    EVENT_CHOICES = [
+        ('confirmation', 'Confirmation'),
+        ('reminder', 'Reminder'),
+        ('cancellation', 'Cancellation'),
+        ('rescheduled', 'Rescheduled'),
+        ('status_update', 'Status Update'),
+        ('series_confirmation', 'Series Confirmation'),
+    ]
+
+    # Events that may legitimately happen more than once for an appointment
+    REPEATABLE_EVENTS = ('rescheduled', 'status_update')
+
+    appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name='outbox_messages')
+    event = models.CharField(max_length=20, choices=EVENT_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['appointment', 'event'], name='unique_outbox_appointment_event'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_event_display()} for appointment {self.appointment_id} ({self.status})"
+
+    @classmethod
+    def queue(cls, appointment, event):
+        """
+        Queue a notification, collapsing duplicates per (appointment, event).
+        Delivered repeatable events are re-armed; anything else is left as is.
+        """
+        message, created = cls.objects.get_or_create(appointment=appointment, event=event)
+        if not created and message.status != 'PENDING' and event in cls.REPEATABLE_EVENTS:
+            message.status = 'PENDING'
+            message.attempts = 0
+            message.next_attempt_at = timezone.now()
+            message.last_error = ''
+            message.save(update_fields=['status', 'attempts', 'next_attempt_at', 'last_error'])
+        return message
+
+    @classmethod
+    def queue_many(cls, appointment_ids, event):
+        """Bulk version of queue(): one insert plus, for repeatable events, one re-arm update"""
+        appointment_ids = list(appointment_ids)
+        cls.objects.bulk_create(
+            [cls(appointment_id=pk, event=event) for pk in appointment_ids],
+            ignore_conflicts=True,
+        )
+        if event in cls.REPEATABLE_EVENTS:
+            cls.objects.filter(appointment_id__in=appointment_ids, event=event).exclude(status='PENDING').update(
+                status='PENDING', attempts=0, next_attempt_at=timezone.now(), last_error=''
+            )
+
+
+class ScheduledReminder(models.Model):
+    """A reminder email due at a fixed offset before an appointment starts"""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+        ('SKIPPED', 'Skipped'),
+    ]
+
+    appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name='scheduled_reminders')
+    # Minutes before start_at
+    offset_minutes = models.PositiveIntegerField()
+    due_at = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['appointment', 'offset_minutes'], name='unique_reminder_offset'),
+        ]
+        indexes = [
+            # The worker's queue: only pending rows, in due order
+            models.Index(fields=['due_at'], name='reminder_due_idx', condition=models.Q(status='PENDING')),
+        ]
+
+    def __str__(self):
+        return f"Reminder {self.offset_minutes} min before appointment {self.appointment_id} ({self.status})"
+
+
+class StatusTransition(models.Model):
+    """Audit record of an appointment status change"""
+    appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name='status_transitions')
+    from_status = models.CharField(max_length=20, choices=Appointment.STATUS_CHOICES)
+    to_status = models.CharField(max_length=20, choices=Appointment.STATUS_CHOICES)
+    changed_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    # Where the change came from: admin, web, command, ...
+    source = models.CharField(max_length=20, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Appointment {self.appointment_id}: {self.from_status} -> {self.to_status}"
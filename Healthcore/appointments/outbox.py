@@ -0,0 +1,77 @@
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from Healthcore.mail import dispatch
+from .models import OutboxMessage
+from .utils import build_appointment_messages
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 60 * 60
+# How long a claimed batch has to be sent and recorded before other workers may retry it
+SEND_LEASE = timedelta(minutes=10)
+
+
+def backoff_delay(attempts):
+    """Exponential backoff between delivery attempts, capped at an hour"""
+    return timedelta(seconds=min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS))
+
+
+def deliver_pending(batch_size=DEFAULT_BATCH_SIZE, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Deliver one batch of due outbox messages over the pooled mail connection.
+    The batch is claimed in a short transaction (skipping rows another worker
+    holds) by moving next_attempt_at out by SEND_LEASE, and mailed after the
+    lock is released, so a failed commit cannot send it twice; a claim that is
+    never recorded because the worker died lapses and the messages are retried.
+    Returns (sent, failed) counts; failed messages are rescheduled with backoff until
+    max_attempts is reached.
+    """
+    sent = failed = 0
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(status='PENDING', next_attempt_at__lte=now)
+            .select_related('appointment__patient', 'appointment__provider__user')
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if not batch:
+            return sent, failed
+        for message in batch:
+            message.attempts += 1
+            message.next_attempt_at = now + SEND_LEASE
+        OutboxMessage.objects.bulk_update(batch, ['attempts', 'next_attempt_at'])
+
+    # Render every email of the batch, then send them all over the pooled connection
+    errors, outgoing, owners = {}, [], []
+    for message in batch:
+        try:
+            emails = build_appointment_messages(message.appointment, message.event)
+        except Exception as e:
+            errors[message.pk] = e
+            continue
+        outgoing.extend(emails)
+        owners.extend([message] * len(emails))
+    for owner, result in zip(owners, dispatch(outgoing)):
+        if result.error is not None:
+            errors.setdefault(owner.pk, result.error)
+
+    for message in batch:
+        error = errors.get(message.pk)
+        if error is not None:
+            failed += 1
+            message.last_error = str(error)
+            if message.attempts >= max_attempts:
+                message.status = 'FAILED'
+            else:
+                message.next_attempt_at = timezone.now() + backoff_delay(message.attempts)
+        else:
+            sent += 1
+            message.status = 'SENT'
+            message.sent_at = timezone.now()
+            message.last_error = ''
+
+    OutboxMessage.objects.bulk_update(batch, ['status', 'next_attempt_at', 'last_error', 'sent_at'])
+    return sent, failed
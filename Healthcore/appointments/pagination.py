@@ -0,0 +1,52 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(appointment):
+    """Opaque cursor for the (start_at, id) position of an appointment"""
+    raw = f'{appointment.start_at.isoformat()}|{appointment.pk}'
+    return urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (start_at, id) or None if the cursor is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        raw = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        start_at, pk = raw.split('|')
+        return datetime.fromisoformat(start_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def get_page_size(value, default=DEFAULT_PAGE_SIZE):
+    try:
+        return min(max(int(value), 1), MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return default
+
+
+def keyset_page(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE, descending=False):
+    """
+    Return (rows, next_cursor) for the page of appointments following cursor,
+    ordered on (start_at, id). Seeks straight to the cursor position instead
+    of OFFSET scanning, so deep pages cost the same as the first one.
+    """
+    position = decode_cursor(cursor)
+    if position:
+        start_at, pk = position
+        op = 'lt' if descending else 'gt'
+        queryset = queryset.filter(
+            Q(**{f'start_at__{op}': start_at})
+            | Q(start_at=start_at, **{f'id__{op}': pk})
+        )
+
+    ordering = ('-start_at', '-id') if descending else ('start_at', 'id')
+    rows = list(queryset.order_by(*ordering)[:page_size + 1])
+    next_cursor = encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
@@ -0,0 +1,274 @@
+"""
+Appointment reminders.
+
+Reminders are queued as ScheduledReminder rows, one per offset in
+settings.REMINDER_OFFSETS (minutes before start_at), whenever an appointment is
+booked or moved, and dropped when it is cancelled or closed. The
+process_reminders worker pops due rows with send_due_reminders(): a range read
+on the partial index of pending rows ordered by due_at, so a tick costs the
+same whether the table holds a day of appointments or a year.
+
+dispatch_reminders() is the older day-at-a-time sweep behind
+send_appointment_reminders, kept for catch-up runs. An appointment reminded by
+either path is skipped by the other.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, Max, Min, OuterRef
+from django.db.models.functions import Mod
+from django.utils import timezone
+from Healthcore.mail import dispatch
+from .availability import day_bounds
+from .models import Appointment, OutboxMessage, ScheduledReminder
+from .outbox import DEFAULT_MAX_ATTEMPTS, SEND_LEASE, backoff_delay
+from .pagination import keyset_page
+from .utils import build_appointment_messages
+
+DEFAULT_CHUNK_SIZE = 200
+DEFAULT_BATCH_SIZE = 50
+SHARD_BY_CHOICES = ('id', 'provider')
+# 24 hours and 1 hour before the appointment
+DEFAULT_OFFSETS = (24 * 60, 60)
+
+
+def reminder_offsets():
+    """Configured reminder offsets in minutes, earliest reminder first"""
+    return sorted(set(getattr(settings, 'REMINDER_OFFSETS', DEFAULT_OFFSETS)), reverse=True)
+
+
+def build_reminders(appointments, now=None):
+    """Unsaved ScheduledReminder rows for every offset of the scheduled appointments that is still ahead"""
+    now = now or timezone.now()
+    offsets = reminder_offsets()
+    reminders = []
+    for appointment in appointments:
+        if appointment.status != 'SCHEDULED':
+            continue
+        for offset in offsets:
+            due_at = appointment.start_at - timedelta(minutes=offset)
+            # A booking made less than `offset` ahead only gets the later reminders
+            if due_at > now:
+                reminders.append(
+                    ScheduledReminder(appointment_id=appointment.pk, offset_minutes=offset, due_at=due_at)
+                )
+    return reminders
+
+
+def schedule_reminders(appointments):
+    """Queue reminders for saved appointments; offsets already queued are left alone"""
+    ScheduledReminder.objects.bulk_create(build_reminders(appointments), ignore_conflicts=True)
+
+
+def reschedule_reminders(appointment):
+    """Replace an appointment's reminders after it moved (or was reopened)"""
+    ScheduledReminder.objects.filter(appointment_id=appointment.pk).delete()
+    schedule_reminders([appointment])
+
+
+def cancel_reminders(appointment_ids):
+    """Drop the pending reminders of appointments that are no longer scheduled"""
+    ScheduledReminder.objects.filter(appointment_id__in=appointment_ids, status='PENDING').update(status='SKIPPED')
+
+
+def schedule_upcoming(chunk_size=DEFAULT_CHUNK_SIZE):
+    """Queue reminders for every upcoming scheduled appointment; returns the number of appointments seen"""
+    seen = 0
+    queryset = Appointment.objects.filter(status='SCHEDULED', start_at__gt=timezone.now()).only(
+        'id', 'status', 'start_at'
+    )
+    for chunk in iter_chunks(queryset, chunk_size, related=False):
+        schedule_reminders(chunk)
+        seen += len(chunk)
+    return seen
+
+
+def send_due_reminders(batch_size=DEFAULT_BATCH_SIZE, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Send one batch of due reminders over the pooled mail connection.
+    The batch is claimed in a short transaction (skipping rows another worker
+    holds) by moving due_at out past the send, and mailed after the lock is
+    released, as the outbox worker does; a claim that is never recorded because
+    the worker died lapses after SEND_LEASE and the reminder is retried.
+    Reminders of appointments that have started, are no longer scheduled or were
+    already reminded by the send_appointment_reminders sweep are skipped, as are
+    earlier offsets whose later offset is due too (after the worker was down).
+    Failed sends are pushed back with backoff until max_attempts is reached.
+    Returns (sent, skipped, failed).
+    """
+    sent = skipped = failed = 0
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            ScheduledReminder.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(status='PENDING', due_at__lte=now)
+            .annotate(swept=Exists(
+                OutboxMessage.objects.filter(appointment=OuterRef('appointment_id'), event='reminder', status='SENT')
+            ))
+            .select_related('appointment__patient', 'appointment__provider__user')
+            .order_by('due_at')[:batch_size]
+        )
+        if not batch:
+            return sent, skipped, failed
+
+        offsets = reminder_offsets()
+        claimed = []
+        for reminder in batch:
+            appointment = reminder.appointment
+            # A later reminder that is also due already supersedes this one
+            superseded = any(
+                offset < reminder.offset_minutes and appointment.start_at - timedelta(minutes=offset) <= now
+                for offset in offsets
+            )
+            if superseded or reminder.swept or appointment.status != 'SCHEDULED' or appointment.start_at <= now:
+                reminder.status = 'SKIPPED'
+                skipped += 1
+                continue
+            reminder.attempts += 1
+            reminder.due_at = now + SEND_LEASE
+            claimed.append(reminder)
+        ScheduledReminder.objects.bulk_update(batch, ['status', 'attempts', 'due_at'])
+
+    # No row locks are held while talking to the mail server
+    errors, outgoing, owners = {}, [], []
+    for reminder in claimed:
+        try:
+            emails = build_appointment_messages(reminder.appointment, 'reminder')
+        except Exception as e:
+            errors[reminder.pk] = e
+            continue
+        outgoing.extend(emails)
+        owners.extend([reminder] * len(emails))
+    for owner, result in zip(owners, dispatch(outgoing)):
+        if result.error is not None:
+            errors.setdefault(owner.pk, result.error)
+
+    for reminder in claimed:
+        error = errors.get(reminder.pk)
+        if error is not None:
+            failed += 1
+            reminder.last_error = str(error)
+            if reminder.attempts >= max_attempts:
+                reminder.status = 'FAILED'
+            else:
+                # Moving due_at keeps retries on the same index range
+                reminder.due_at = timezone.now() + backoff_delay(reminder.attempts)
+        else:
+            sent += 1
+            reminder.status = 'SENT'
+            reminder.sent_at = timezone.now()
+            reminder.last_error = ''
+    ScheduledReminder.objects.bulk_update(claimed, ['status', 'due_at', 'last_error', 'sent_at'])
+    return sent, skipped, failed
+
+
+def reminder_queryset(target_date, shard=0, shards=1, shard_by='id'):
+    """
+    Scheduled appointments on target_date whose reminder has not been delivered yet,
+    restricted to one of `shards` disjoint slices: contiguous id ranges, or
+    provider_id modulo shards so each provider is handled by a single worker.
+    """
+    day_start, day_end = day_bounds(target_date)
+    queryset = Appointment.objects.filter(
+        start_at__gte=day_start, start_at__lt=day_end, status='SCHEDULED'
+    ).filter(
+        ~Exists(OutboxMessage.objects.filter(appointment=OuterRef('pk'), event='reminder', status='SENT'))
+    ).filter(
+        # Already reminded by the process_reminders worker
+        ~Exists(ScheduledReminder.objects.filter(appointment=OuterRef('pk'), status='SENT'))
+    )
+    if shards <= 1:
+        return queryset
+
+    if shard_by == 'provider':
+        return queryset.alias(shard_key=Mod('provider_id', shards)).filter(shard_key=shard)
+
+    # Bounds come from the whole day so every worker computes the same ranges
+    # while the others are marking reminders as sent
+    bounds = Appointment.objects.filter(
+        start_at__gte=day_start, start_at__lt=day_end
+    ).aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return queryset.none()
+    span = (bounds['high'] - bounds['low']) // shards + 1
+    start = bounds['low'] + shard * span
+    return queryset.filter(id__gte=start, id__lt=start + span)
+
+
+def iter_chunks(queryset, chunk_size=DEFAULT_CHUNK_SIZE, related=True):
+    """
+    Stream the queryset in (start_at, id) order, one chunk per query, with related
+    rows joined. Keyset order follows the (status, start_at) index, so each chunk
+    is an index range read rather than a sort of the whole day.
+    """
+    if related:
+        queryset = queryset.select_related('patient', 'provider__user')
+    cursor = None
+    while True:
+        chunk, cursor = keyset_page(queryset, cursor, chunk_size)
+        if chunk:
+            yield chunk
+        if cursor is None:
+            return
+
+
+def record_reminders(outcomes):
+    """
+    Persist reminder delivery state for a chunk: outcomes maps each appointment
+    to None on success or the delivery error on failure.
+    """
+    now = timezone.now()
+    existing = {
+        message.appointment_id: message
+        for message in OutboxMessage.objects.filter(appointment__in=list(outcomes), event='reminder')
+    }
+    to_create, to_update = [], []
+    for appointment, error in outcomes.items():
+        message = existing.get(appointment.id)
+        if message is None:
+            message = OutboxMessage(appointment=appointment, event='reminder')
+            to_create.append(message)
+        else:
+            to_update.append(message)
+        message.attempts += 1
+        message.status = 'FAILED' if error else 'SENT'
+        message.last_error = str(error) if error else ''
+        message.sent_at = None if error else now
+        message.next_attempt_at = now
+
+    OutboxMessage.objects.bulk_create(to_create)
+    OutboxMessage.objects.bulk_update(to_update, ['attempts', 'status', 'last_error', 'sent_at', 'next_attempt_at'])
+
+
+def dispatch_reminders(target_date, shard=0, shards=1, shard_by='id', chunk_size=DEFAULT_CHUNK_SIZE, on_error=None):
+    """
+    Send reminders for target_date chunk by chunk over the pooled mail connection,
+    recording each delivery so a rerun only picks up appointments that were missed.
+    Returns (sent, failed).
+    """
+    sent = failed = 0
+    queryset = reminder_queryset(target_date, shard, shards, shard_by)
+    for chunk in iter_chunks(queryset, chunk_size):
+        outcomes, outgoing, owners = {}, [], []
+        for appointment in chunk:
+            try:
+                emails = build_appointment_messages(appointment, 'reminder')
+            except Exception as e:
+                outcomes[appointment] = e
+                continue
+            outcomes[appointment] = None
+            outgoing.extend(emails)
+            owners.extend([appointment] * len(emails))
+        for owner, result in zip(owners, dispatch(outgoing)):
+            if result.error is not None and outcomes[owner] is None:
+                outcomes[owner] = result.error
+
+        for appointment, error in outcomes.items():
+            if error is None:
+                sent += 1
+            else:
+                failed += 1
+                if on_error:
+                    on_error(appointment, error)
+        record_reminders(outcomes)
+    return sent, failed
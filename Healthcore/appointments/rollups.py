@@ -0,0 +1,188 @@
+"""
+Daily appointment rollups for reporting.
+
+AppointmentDailyStat holds appointment counts per (date, provider, status,
+appointment_type). Every write path that creates, moves or deletes
+appointments hands its changes to apply() as +/- deltas in the same
+transaction: single saves through the signals, bulk status changes through
+transitions.transition_status, and series through booking.book_series.
+rebuild() recomputes a date range from the Appointment table for the
+initial backfill, or after data was changed behind the ORM's back.
+
+Reports read only the rollups, so their cost depends on the date range and
+the number of providers, not on how much history has piled up.
+"""
+from collections import Counter
+from datetime import timedelta
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Count, F, Q, Sum
+from accounts.models import ProviderProfile
+from .availability import day_bounds
+from .models import Appointment, AppointmentDailyStat
+
+# Days of appointments aggregated per query when rebuilding
+REBUILD_CHUNK_DAYS = 31
+
+KEY_FIELDS = ('date', 'provider', 'status', 'appointment_type')
+
+
+def appointment_key(appointment):
+    return (appointment.date, appointment.provider_id, appointment.status, appointment.appointment_type)
+
+
+def apply(deltas):
+    """Add {(date, provider_id, status, appointment_type): n} to the rollups, creating rows as needed"""
+    deltas = {key: n for key, n in deltas.items() if n}
+    if not deltas:
+        return
+    specializations = dict(
+        ProviderProfile.objects.filter(pk__in={key[1] for key in deltas}).values_list('pk', 'specialization')
+    )
+    connection = connections[router.db_for_write(AppointmentDailyStat)]
+    if connection.vendor in ('postgresql', 'sqlite'):
+        _upsert(connection, deltas, specializations)
+        return
+
+    for (date, provider_id, status, appointment_type), n in deltas.items():
+        lookup = {'date': date, 'provider_id': provider_id, 'status': status, 'appointment_type': appointment_type}
+        if AppointmentDailyStat.objects.filter(**lookup).update(count=F('count') + n):
+            continue
+        try:
+            with transaction.atomic():
+                AppointmentDailyStat.objects.create(
+                    specialization=specializations.get(provider_id, ''), count=n, **lookup
+                )
+        except IntegrityError:
+            # Another transaction created the row first
+            AppointmentDailyStat.objects.filter(**lookup).update(count=F('count') + n)
+
+
+def _upsert(connection, deltas, specializations):
+    # One INSERT ... ON CONFLICT DO UPDATE for every key, however many days a change spans
+    quote = connection.ops.quote_name
+    table = quote(AppointmentDailyStat._meta.db_table)
+    key_columns = ', '.join(quote(column) for column in ('date', 'provider_id', 'status', 'appointment_type'))
+    columns = ', '.join(
+        quote(column) for column in ('date', 'provider_id', 'status', 'appointment_type', 'specialization', 'count')
+    )
+    params = []
+    for (date, provider_id, status, appointment_type), n in deltas.items():
+        params += [
+            connection.ops.adapt_datefield_value(date), provider_id, status, appointment_type,
+            specializations.get(provider_id, ''), n,
+        ]
+    values = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(deltas))
+    count = quote('count')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) VALUES {values} '
+            f'ON CONFLICT ({key_columns}) DO UPDATE SET {count} = {table}.{count} + EXCLUDED.{count}',
+            params,
+        )
+
+
+def record_save(appointment, created, changed):
+    """Count a saved appointment; changed is its get_changed_fields() from before the save"""
+    deltas = Counter()
+    if not created:
+        if not any(name in changed for name in KEY_FIELDS):
+            return
+        old = tuple(
+            changed[name][0] if name in changed else value
+            for name, value in zip(KEY_FIELDS, appointment_key(appointment))
+        )
+        # Untracked instances have no old values to take the count from
+        if None in old:
+            return
+        deltas[old] -= 1
+    deltas[appointment_key(appointment)] += 1
+    apply(deltas)
+
+
+def record_delete(appointment):
+    apply({appointment_key(appointment): -1})
+
+
+def record_created(appointments):
+    """Deltas for appointments inserted with bulk_create"""
+    apply(Counter(appointment_key(appointment) for appointment in appointments))
+
+
+def rebuild(start_date, end_date, chunk_days=REBUILD_CHUNK_DAYS):
+    """
+    Recompute the rollups for start_date..end_date (inclusive) from the Appointment
+    table, chunk_days at a time. Each chunk is replaced in one transaction; run it
+    while writes to those days are quiet, or re-run it, as a concurrent change can
+    land between the aggregate and the insert. Returns the number of rows written.
+    """
+    written = 0
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end_date)
+        range_start, range_end = day_bounds(chunk_start, chunk_end)
+        with transaction.atomic():
+            # start_at range first so the scan stays on the start_at index
+            counts = (
+                Appointment.objects.filter(start_at__gte=range_start, start_at__lt=range_end)
+                .filter(date__gte=chunk_start, date__lte=chunk_end)
+                .values('date', 'provider_id', 'provider__specialization', 'status', 'appointment_type')
+                .annotate(count=Count('id'))
+                .order_by()
+            )
+            rows = [
+                AppointmentDailyStat(
+                    date=row['date'], provider_id=row['provider_id'], specialization=row['provider__specialization'],
+                    status=row['status'], appointment_type=row['appointment_type'], count=row['count'],
+                )
+                for row in counts
+            ]
+            AppointmentDailyStat.objects.filter(date__gte=chunk_start, date__lte=chunk_end).delete()
+            AppointmentDailyStat.objects.bulk_create(rows)
+        written += len(rows)
+        chunk_start = chunk_end + timedelta(days=1)
+    return written
+
+
+def _counts():
+    # total plus one sum per status: scheduled, completed, cancelled, no_show
+    sums = {'total': Sum('count')}
+    sums.update(
+        (status.lower(), Sum('count', filter=Q(status=status))) for status, _ in Appointment.STATUS_CHOICES
+    )
+    return sums
+
+
+def _zero_filled(row):
+    # Sum over no rows is None
+    return {key: 0 if value is None else value for key, value in row.items()}
+
+
+def dashboard_stats(start_date, end_date, top_providers=10):
+    """
+    Appointment statistics for start_date..end_date, read from the rollups alone:
+    totals, a per-day series, breakdowns by type and specialization, and the
+    busiest providers with their completion and no-show rates.
+    """
+    stats = AppointmentDailyStat.objects.filter(date__gte=start_date, date__lte=end_date).order_by()
+    providers = [
+        _zero_filled(row) for row in
+        stats.values('provider_id', 'provider__user__first_name', 'provider__user__last_name', 'provider__specialization')
+        .annotate(**_counts()).order_by('-total', 'provider_id')[:top_providers]
+    ]
+    type_labels = dict(Appointment.APPOINTMENT_TYPES)
+    by_type = list(stats.values('appointment_type').annotate(total=Sum('count')).order_by('-total'))
+    for row in by_type:
+        row['label'] = type_labels.get(row['appointment_type'], row['appointment_type'])
+    for row in providers:
+        attended = row['completed'] + row['no_show']
+        row['completion_rate'] = round(100 * row['completed'] / attended) if attended else None
+        row['no_show_rate'] = round(100 * row['no_show'] / attended) if attended else None
+    return {
+        'totals': _zero_filled(stats.aggregate(**_counts())),
+        'daily': [_zero_filled(row) for row in stats.values('date').annotate(**_counts()).order_by('date')],
+        'by_type': by_type,
+        'by_specialization': [
+            _zero_filled(row) for row in stats.values('specialization').annotate(**_counts()).order_by('-total')
+        ],
+        'providers': providers,
+    }
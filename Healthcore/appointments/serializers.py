@@ -0,0 +1,57 @@
+from rest_framework import serializers
+from accounts.models import ProviderProfile
+from .models import Appointment
+
+
+class SparseFieldsMixin:
+    """
+    Lets clients ask for a subset of fields with ?fields=id,start_at,status.
+    Unknown names are ignored; no or an empty list returns every field.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        requested = request.query_params.get('fields') if request is not None else None
+        if requested:
+            wanted = {name.strip() for name in requested.split(',')}
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
+class ProviderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    name = serializers.SerializerMethodField()
+    email = serializers.EmailField(source='user.email', read_only=True)
+
+    class Meta:
+        model = ProviderProfile
+        fields = (
+            'id', 'name', 'email', 'specialization', 'years_of_experience',
+            'hospital_affiliation', 'consultation_fee', 'availability_hours', 'updated_at',
+        )
+
+    def get_name(self, obj):
+        return obj.user.get_full_name()
+
+
+class AppointmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    patient = serializers.SerializerMethodField()
+    provider = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Appointment
+        fields = (
+            'id', 'status', 'appointment_type', 'date', 'time', 'start_at', 'end_at',
+            'reason', 'notes', 'patient', 'provider', 'created_at', 'updated_at',
+        )
+
+    # Flat summaries read from the select_related rows, no extra queries
+    def get_patient(self, obj):
+        return {'id': obj.patient_id, 'name': obj.patient.get_full_name()}
+
+    def get_provider(self, obj):
+        return {
+            'id': obj.provider_id,
+            'name': obj.provider.user.get_full_name(),
+            'specialization': obj.provider.specialization,
+        }
@@ -1,24 +1,62 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from .models import Appointment
-from .utils import send_appointment_notification
+from .models import Appointment, OutboxMessage, StatusTransition
+from .events import publish_appointment, status_event
+from . import reminders, rollups, waitlist
+from .transitions import notification_event
 
 @receiver(post_save, sender=Appointment)
 def appointment_notification(sender, instance, created, **kwargs):
     """
-    Send notifications when an appointment is created or its status changes
+    Queue notifications when an appointment is created or its status changes.
+    Delivery happens out of the request in the process_notification_outbox command.
+    Live WebSocket events are published once the save commits.
     """
     if created:
         # New appointment
-        send_appointment_notification(instance, 'confirmation')
-    else:
-        # Get the old instance from the database
-        try:
-            old_instance = Appointment.objects.get(pk=instance.pk)
-            if old_instance.status != instance.status:
-                if instance.status == 'CANCELLED':
-                    send_appointment_notification(instance, 'cancellation')
-                elif instance.status == 'RESCHEDULED':
-                    send_appointment_notification(instance, 'rescheduled')
-        except Appointment.DoesNotExist:
-            pass
+        OutboxMessage.queue(instance, 'confirmation')
+        publish_appointment(instance, 'created')
+        return
+
+    # The tracker snapshot still holds the pre-save values here
+    changed = instance.get_changed_fields()
+    if 'status' in changed:
+        # Saves are the single-object path; bulk changes go through transitions.transition_status
+        old_status, new_status = changed['status']
+        StatusTransition.objects.create(appointment=instance, from_status=old_status, to_status=new_status)
+        OutboxMessage.queue(instance, notification_event(new_status))
+        publish_appointment(instance, status_event(new_status), previous_status=old_status)
+    elif instance.status == 'SCHEDULED' and ('date' in changed or 'time' in changed):
+        OutboxMessage.queue(instance, 'rescheduled')
+        publish_appointment(instance, 'rescheduled')
+
+@receiver(post_save, sender=Appointment)
+def appointment_rollups(sender, instance, created, **kwargs):
+    """Keep the daily reporting rollups in step with single-object saves"""
+    rollups.record_save(instance, created, instance.get_changed_fields())
+
+@receiver(post_save, sender=Appointment)
+def appointment_reminders(sender, instance, created, **kwargs):
+    """Queue, move or drop the appointment's reminders"""
+    if created:
+        reminders.schedule_reminders([instance])
+        return
+    changed = instance.get_changed_fields()
+    if 'status' in changed:
+        if instance.status == 'SCHEDULED':
+            reminders.reschedule_reminders(instance)
+        else:
+            reminders.cancel_reminders([instance.pk])
+    elif instance.status == 'SCHEDULED' and ('date' in changed or 'time' in changed):
+        reminders.reschedule_reminders(instance)
+
+@receiver(post_save, sender=Appointment)
+def appointment_waitlist(sender, instance, created, **kwargs):
+    """Offer the slot of an appointment cancelled by a save to the waitlist once it commits"""
+    if not created and instance.status == 'CANCELLED' and 'status' in instance.get_changed_fields():
+        transaction.on_commit(lambda: waitlist.offer_freed_slot(instance))
+
+@receiver(post_delete, sender=Appointment)
+def appointment_rollups_delete(sender, instance, **kwargs):
+    rollups.record_delete(instance)
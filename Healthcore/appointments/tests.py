@@ -1,3 +1,1608 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import re
+import tempfile
+import threading
+from datetime import time, timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.core.mail.backends import locmem
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from accounts.models import User, ProviderProfile
+from accounts.roles import get_role
+from Healthcore.asgi import application
+from Healthcore.changelist import EstimatedCountPaginator, estimated_count
+from Healthcore.mail import ConnectionPool, dispatch
+from Healthcore.smtp_sink import SMTPSink
+from .consumers import AppointmentEventsConsumer
+from .booking import (
+    MAX_SERIES_OCCURRENCES, SeriesConflict, SlotUnavailable, book_series, book_slot, hold_slot, series_dates,
+)
+from .availability import AvailabilityIndex, parse_availability_hours, get_free_slots
+from .models import (
+    Appointment, AppointmentDailyStat, AppointmentSeries, CalendarFeed, OutboxMessage, ScheduledReminder, SlotHold,
+    StatusTransition, WaitlistEntry, WaitlistOffer,
+)
+from .exchange import AppointmentImporter, read_rows
+from .outbox import deliver_pending
+from .rollups import rebuild
+from .reminders import (
+    SHARD_BY_CHOICES, dispatch_reminders, reminder_queryset, schedule_upcoming, send_due_reminders,
+)
+from .pagination import keyset_page
+from .transitions import InvalidTransition, transition_status
+from .waitlist import accept_offer, decline_offer, matching_entries, notify_offers, offer_slot
+from .utils import build_appointment_messages, check_appointment_availability, build_schedule_grid
 
-# Create your tests here.
+
+class AppointmentTestMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = User.objects.create_user(
+            'patient@example.com', 'pass1234', username='patient',
+            first_name='Pat', last_name='Ient', user_type='patient'
+        )
+        cls.provider_user = User.objects.create_user(
+            'doctor@example.com', 'pass1234', username='doctor',
+            first_name='Doc', last_name='Tor', user_type='provider'
+        )
+        cls.provider = ProviderProfile.objects.create(
+            user=cls.provider_user, license_number='LIC-1', specialization='Cardiology'
+        )
+        # A Monday far enough ahead to never be in the past
+        today = timezone.now().date()
+        cls.monday = today + timedelta(days=7 - today.weekday() + 7)
+
+    def book(self, day, at, **kwargs):
+        # bulk_create skips Appointment.save and its notifications
+        fields = {
+            'patient': self.patient, 'provider': self.provider,
+            'date': day, 'time': at, 'reason': 'Checkup',
+        }
+        fields.update(kwargs)
+        appointment = Appointment(**fields)
+        appointment.sync_window()
+        return Appointment.objects.bulk_create([appointment])[0]
+
+
+class AvailabilityTests(AppointmentTestMixin, TestCase):
+    def test_parse_availability_hours_formats(self):
+        schedule = parse_availability_hours({
+            'monday': [['09:00', '12:00'], ['13:00', '17:00']],
+            'tue': {'start': '10:00', 'end': '14:00'},
+            'wednesday': '08:30-11:00',
+        })
+        self.assertEqual(schedule[0], [(540, 720), (780, 1020)])
+        self.assertEqual(schedule[1], [(600, 840)])
+        self.assertEqual(schedule[2], [(510, 660)])
+        self.assertEqual(schedule[3], [])
+
+    def test_short_day_keys_are_ignored(self):
+        schedule = parse_availability_hours({'': '09:00-17:00', 't': '10:00-12:00', 'fri': '08:00-09:00'})
+        self.assertEqual(schedule[0], [])
+        self.assertEqual(schedule[1], [])
+        self.assertEqual(schedule[4], [(480, 540)])
+
+    def test_empty_schedule_defaults_to_nine_to_five(self):
+        self.assertEqual(parse_availability_hours({})[6], [(540, 1020)])
+
+    def test_overlapping_booking_is_detected(self):
+        self.book(self.monday, time(10, 15))
+        index = AvailabilityIndex(self.provider, self.monday)
+        self.assertTrue(index.is_booked(self.monday, time(10, 0)))
+        self.assertTrue(index.is_booked(self.monday, time(10, 30)))
+        self.assertFalse(index.is_booked(self.monday, time(10, 45)))
+        self.assertFalse(index.is_booked(self.monday, time(9, 45)))
+
+    def test_cancelled_appointments_do_not_block(self):
+        self.book(self.monday, time(10, 0), status='CANCELLED')
+        available, _ = check_appointment_availability(self.provider, self.monday, time(10, 0))
+        self.assertTrue(available)
+
+    def test_working_hours_come_from_profile(self):
+        self.provider.availability_hours = {'monday': '13:00-15:00'}
+        self.provider.save()
+        self.assertFalse(check_appointment_availability(self.provider, self.monday, time(9, 0))[0])
+        self.assertTrue(check_appointment_availability(self.provider, self.monday, time(13, 0))[0])
+        self.assertFalse(check_appointment_availability(self.provider, self.monday, time(14, 45))[0])
+
+    def test_free_slots_in_one_query(self):
+        self.provider.availability_hours = {'monday': '09:00-11:00', 'tuesday': '09:00-10:00'}
+        self.provider.save()
+        self.book(self.monday, time(9, 30))
+        with self.assertNumQueries(1):
+            slots = get_free_slots(self.provider, self.monday, self.monday + timedelta(days=6))
+        self.assertEqual(slots[self.monday], [time(9, 0), time(10, 0), time(10, 30)])
+        self.assertEqual(slots[self.monday + timedelta(days=1)], [time(9, 0), time(9, 30)])
+        self.assertEqual(len(slots), 2)
+
+    def test_available_slots_view(self):
+        self.provider.availability_hours = {'monday': '09:00-10:00'}
+        self.provider.save()
+        self.client.force_login(self.patient)
+        response = self.client.get(reverse('appointments:available_slots'), {
+            'provider': self.provider.pk,
+            'start_date': self.monday.isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['slots'], {self.monday.isoformat(): ['09:00', '09:30']})
+        response = self.client.get(reverse('appointments:available_slots'), {'provider': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ProviderScheduleTests(AppointmentTestMixin, TestCase):
+    def test_grid_buckets_by_day_and_slot(self):
+        first = self.book(self.monday, time(9, 15))
+        second = self.book(self.monday + timedelta(days=2), time(18, 0))
+        days, rows = build_schedule_grid([first, second], self.monday, days=3, slot_minutes=30)
+        self.assertEqual(len(days), 3)
+        self.assertEqual(rows[0]['time'], time(9, 0))
+        self.assertEqual(rows[0]['cells'], [[first], [], []])
+        # Grid stretches past working hours to show late bookings
+        self.assertEqual(rows[-1]['time'], time(18, 0))
+        self.assertEqual(rows[-1]['cells'], [[], [], [second]])
+
+    def test_schedule_view_query_count_is_independent_of_bookings(self):
+        self.client.force_login(self.provider_user)
+        url = reverse('appointments:provider_schedule')
+        params = {'start_date': self.monday.isoformat(), 'slot': 30}
+        self.book(self.monday, time(9, 0))
+        self.client.get(url, params)
+        with self.assertNumQueries(4):
+            response = self.client.get(url, params)
+        for hour in range(10, 16):
+            self.book(self.monday + timedelta(days=hour % 5), time(hour, 30))
+        with self.assertNumQueries(4):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Pat Ient', count=7)
+
+
+class AppointmentListTests(AppointmentTestMixin, TestCase):
+    def test_keyset_pages_cover_every_row_once(self):
+        past = timezone.now().date() - timedelta(days=30)
+        # Repeated (date, time) pairs exercise the id tie-breaker
+        booked = [self.book(past + timedelta(days=n % 3), time(9 + n % 2, 0), status='COMPLETED') for n in range(7)]
+        seen, cursor = [], None
+        while True:
+            rows, cursor = keyset_page(Appointment.objects.all(), cursor, page_size=3, descending=True)
+            seen.extend(row.pk for row in rows)
+            if cursor is None:
+                break
+        self.assertEqual(sorted(seen), sorted(a.pk for a in booked))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        past = timezone.now().date() - timedelta(days=10)
+        for n in range(12):
+            self.book(past + timedelta(days=n % 5), time(9 + n, 0))
+            self.book(self.monday + timedelta(days=n % 5), time(9 + n, 0))
+        self.client.force_login(self.patient)
+        url = reverse('appointments:appointment_list')
+        self.client.get(url)
+        # Session, user and one query per list; patients need no provider lookup
+        with self.assertNumQueries(4):
+            small = self.client.get(url, {'page_size': 2})
+        with self.assertNumQueries(4):
+            large = self.client.get(url, {'page_size': 50})
+        self.assertContains(small, 'Doc Tor', count=4)
+        self.assertContains(large, 'Doc Tor', count=24)
+        self.assertContains(small, 'Older appointments')
+        self.assertNotContains(large, 'Older appointments')
+
+
+class RoleMiddlewareTests(AppointmentTestMixin, TestCase):
+    """Each view resolves the user's role once per request, and not at all for patients"""
+
+    def setUp(self):
+        self.appointment = Appointment.objects.create(
+            patient=self.patient, provider=self.provider, date=self.monday, time=time(10, 0), reason='Checkup'
+        )
+
+    def test_role_is_resolved_once(self):
+        self.client.force_login(self.provider_user)
+        with mock.patch('accounts.roles.get_role', wraps=get_role) as resolve:
+            response = self.client.get(reverse('appointments:appointment_detail', args=[self.appointment.pk]))
+        self.assertEqual(response.status_code, 200)
+        resolve.assert_called_once()
+        self.assertEqual(response.context['role'].provider, self.provider)
+
+    def test_detail_and_cancel_query_counts(self):
+        for user, provider_lookup in ((self.patient, 0), (self.provider_user, 1)):
+            self.client.force_login(user)
+            for name in ('appointment_detail', 'cancel_appointment'):
+                with self.subTest(user=user.username, view=name):
+                    # Session, user, the appointment with both participants joined in, plus the
+                    # provider lookup for providers: the access check compares ids only
+                    with self.assertNumQueries(3 + provider_lookup):
+                        response = self.client.get(reverse(f'appointments:{name}', args=[self.appointment.pk]))
+                    self.assertEqual(response.status_code, 200)
+
+    def test_other_users_are_turned_away_without_loading_participants(self):
+        other = User.objects.create_user('other@example.com', None, username='other', user_type='patient')
+        self.client.force_login(other)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('appointments:appointment_detail', args=[self.appointment.pk]))
+        self.assertRedirects(response, reverse('appointments:appointment_list'), fetch_redirect_response=False)
+
+    def test_provider_only_views(self):
+        self.client.force_login(self.patient)
+        # Session and user; the patient is turned away without a provider lookup
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('appointments:provider_schedule'))
+        self.assertRedirects(response, reverse('appointments:appointment_list'), fetch_redirect_response=False)
+
+        self.client.force_login(self.provider_user)
+        # Session, user, provider lookup and the week's appointments
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('appointments:provider_schedule'), {'start_date': self.monday})
+        self.assertEqual(response.status_code, 200)
+
+
+class NotificationOutboxTests(AppointmentTestMixin, TestCase):
+    def create_appointment(self):
+        return Appointment.objects.create(
+            patient=self.patient, provider=self.provider,
+            date=self.monday, time=time(10, 0), reason='Checkup'
+        )
+
+    def test_booking_queues_instead_of_sending(self):
+        appointment = self.create_appointment()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            list(appointment.outbox_messages.values_list('event', 'status')),
+            [('confirmation', 'PENDING')]
+        )
+
+    def test_worker_delivers_and_marks_sent(self):
+        self.create_appointment()
+        self.assertEqual(deliver_pending(), (1, 0))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(OutboxMessage.objects.get().status, 'SENT')
+        self.assertEqual(deliver_pending(), (0, 0))
+
+    def test_duplicate_events_collapse(self):
+        appointment = self.create_appointment()
+        appointment.status = 'CANCELLED'
+        appointment.save()
+        OutboxMessage.queue(appointment, 'cancellation')
+        self.assertEqual(
+            sorted(appointment.outbox_messages.values_list('event', flat=True)),
+            ['cancellation', 'confirmation']
+        )
+
+    def test_failures_back_off_then_give_up(self):
+        self.create_appointment()
+        with mock.patch.object(locmem.EmailBackend, 'send_messages', side_effect=OSError('smtp down')):
+            self.assertEqual(deliver_pending(max_attempts=2), (0, 1))
+            message = OutboxMessage.objects.get()
+            self.assertEqual(message.attempts, 1)
+            self.assertGreater(message.next_attempt_at, timezone.now())
+            # Not due yet
+            self.assertEqual(deliver_pending(max_attempts=2), (0, 0))
+            OutboxMessage.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(deliver_pending(max_attempts=2), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.last_error), ('FAILED', 'smtp down'))
+
+    def test_batch_is_claimed_before_mail_goes_out(self):
+        self.create_appointment()
+        depth = len(connection.atomic_blocks)
+        seen = {}
+
+        def send(messages):
+            seen['depth'] = len(connection.atomic_blocks)
+            seen['next_attempt_at'] = OutboxMessage.objects.get().next_attempt_at
+            return dispatch(messages)
+
+        with mock.patch('appointments.outbox.dispatch', side_effect=send):
+            self.assertEqual(deliver_pending(), (1, 0))
+        self.assertEqual(seen['depth'], depth)
+        self.assertGreater(seen['next_attempt_at'], timezone.now())
+        self.assertEqual(OutboxMessage.objects.get().status, 'SENT')
+
+
+class ReminderDispatchTests(AppointmentTestMixin, TestCase):
+    def setUp(self):
+        self.appointments = [self.book(self.monday, time(9 + n, 0)) for n in range(5)]
+
+    def test_reminders_are_recorded_and_not_resent(self):
+        self.assertEqual(dispatch_reminders(self.monday, chunk_size=2), (5, 0))
+        self.assertEqual(len(mail.outbox), 10)
+        self.assertEqual(OutboxMessage.objects.filter(event='reminder', status='SENT').count(), 5)
+        self.assertEqual(dispatch_reminders(self.monday), (0, 0))
+        self.assertEqual(len(mail.outbox), 10)
+
+    def test_failed_run_resumes_with_only_missing_reminders(self):
+        calls = []
+
+        def flaky(backend, messages):
+            for message in messages:
+                calls.append(message)
+                if len(calls) == 5:
+                    raise OSError('connection reset')
+                mail.outbox.append(message)
+            return len(messages)
+
+        with mock.patch.object(locmem.EmailBackend, 'send_messages', flaky):
+            self.assertEqual(dispatch_reminders(self.monday), (4, 1))
+        self.assertEqual(len(mail.outbox), 9)
+        self.assertEqual(dispatch_reminders(self.monday), (1, 0))
+        self.assertEqual(len(mail.outbox), 11)
+        self.assertEqual(OutboxMessage.objects.get(appointment=self.appointments[2]).attempts, 2)
+
+    def test_command_rejects_a_bad_date(self):
+        with self.assertRaisesMessage(CommandError, '--date must be in YYYY-MM-DD format'):
+            call_command('send_appointment_reminders', '--date', '18/10/2026', stdout=StringIO())
+
+    def test_shards_partition_the_day(self):
+        for shard_by in ('id', 'provider'):
+            seen = []
+            for shard in range(3):
+                seen.extend(reminder_queryset(self.monday, shard, 3, shard_by).values_list('id', flat=True))
+            self.assertEqual(sorted(seen), [a.pk for a in self.appointments])
+
+    def test_chunks_load_related_rows_up_front(self):
+        # One query per chunk for appointments (which also detects the end of
+        # the stream), one for existing reminder state and one bulk insert
+        with self.assertNumQueries(3):
+            dispatch_reminders(self.monday, chunk_size=10)
+
+
+@override_settings(REMINDER_OFFSETS=(24 * 60, 60))
+class ScheduledReminderTests(AppointmentTestMixin, TestCase):
+    def create(self, start_at, **kwargs):
+        # Appointment.save runs the signals that queue reminders
+        start_at = timezone.localtime(start_at)
+        return Appointment.objects.create(
+            patient=self.patient, provider=self.provider, reason='Checkup',
+            date=start_at.date(), time=start_at.time().replace(second=0, microsecond=0), **kwargs
+        )
+
+    def offsets(self, appointment, status='PENDING'):
+        return sorted(
+            ScheduledReminder.objects.filter(appointment=appointment, status=status)
+            .values_list('offset_minutes', flat=True)
+        )
+
+    def make_due(self, appointment):
+        ScheduledReminder.objects.filter(appointment=appointment).update(due_at=timezone.now() - timedelta(minutes=1))
+
+    def test_booking_queues_every_offset_still_ahead(self):
+        self.assertEqual(self.offsets(self.create(timezone.now() + timedelta(days=3))), [60, 1440])
+        # A same-day booking still gets the 1h reminder
+        self.assertEqual(self.offsets(self.create(timezone.now() + timedelta(hours=3))), [60])
+        self.assertEqual(self.offsets(self.create(timezone.now() + timedelta(minutes=30))), [])
+
+    def test_due_reminder_is_sent_once(self):
+        appointment = self.create(timezone.now() + timedelta(hours=3))
+        self.assertEqual(send_due_reminders(), (0, 0, 0))
+        self.make_due(appointment)
+        self.assertEqual(send_due_reminders(), (1, 0, 0))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[0].subject, 'Appointment Reminder')
+        self.assertEqual(send_due_reminders(), (0, 0, 0))
+        self.assertEqual(self.offsets(appointment, 'SENT'), [60])
+        # The day-at-a-time sweep does not remind again
+        self.assertFalse(reminder_queryset(appointment.date).filter(pk=appointment.pk).exists())
+
+    def test_sweep_and_worker_do_not_both_remind(self):
+        swept = self.create(timezone.now() + timedelta(hours=3))
+        OutboxMessage.objects.create(appointment=swept, event='reminder', status='SENT', sent_at=timezone.now())
+        self.make_due(swept)
+        self.assertEqual(send_due_reminders(), (0, 1, 0))
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(self.offsets(swept, 'SKIPPED'), [60])
+
+    def test_batch_is_claimed_before_mail_goes_out(self):
+        appointment = self.create(timezone.now() + timedelta(hours=3))
+        self.make_due(appointment)
+        depth = len(connection.atomic_blocks)
+        seen = {}
+
+        def send(messages):
+            seen['depth'] = len(connection.atomic_blocks)
+            seen['due_at'] = ScheduledReminder.objects.get(appointment=appointment).due_at
+            return dispatch(messages)
+
+        with mock.patch('appointments.reminders.dispatch', side_effect=send):
+            self.assertEqual(send_due_reminders(), (1, 0, 0))
+        # Outside the claiming transaction, with the row already moved out of the due range
+        self.assertEqual(seen['depth'], depth)
+        self.assertGreater(seen['due_at'], timezone.now())
+        self.assertEqual(self.offsets(appointment, 'SENT'), [60])
+
+    def test_reschedule_moves_and_cancel_drops_reminders(self):
+        appointment = self.create(timezone.now() + timedelta(days=3))
+        appointment.date += timedelta(days=2)
+        appointment.save()
+        reminder = ScheduledReminder.objects.get(appointment=appointment, offset_minutes=60)
+        self.assertEqual(reminder.due_at, appointment.start_at - timedelta(hours=1))
+
+        transition_status(Appointment.objects.filter(pk=appointment.pk), 'CANCELLED')
+        self.assertEqual(self.offsets(appointment), [])
+        self.assertEqual(self.offsets(appointment, 'SKIPPED'), [60, 1440])
+
+    def test_stale_reminders_are_skipped(self):
+        appointment = self.create(timezone.now() + timedelta(hours=3))
+        self.make_due(appointment)
+        Appointment.objects.filter(pk=appointment.pk).update(status='CANCELLED')
+        self.assertEqual(send_due_reminders(), (0, 1, 0))
+
+        # After an outage only the latest due reminder goes out
+        soon = self.create(timezone.now() + timedelta(minutes=30))
+        now = timezone.now()
+        ScheduledReminder.objects.bulk_create([
+            ScheduledReminder(appointment=soon, offset_minutes=offset, due_at=now - timedelta(minutes=offset))
+            for offset in (60, 1440)
+        ])
+        self.assertEqual(send_due_reminders(), (1, 1, 0))
+        self.assertEqual(self.offsets(soon, 'SENT'), [60])
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_failed_reminder_backs_off(self):
+        appointment = self.create(timezone.now() + timedelta(hours=3))
+        self.make_due(appointment)
+        with mock.patch.object(locmem.EmailBackend, 'send_messages', side_effect=OSError('connection reset')):
+            self.assertEqual(send_due_reminders(), (0, 0, 1))
+        reminder = ScheduledReminder.objects.get(appointment=appointment)
+        self.assertEqual((reminder.status, reminder.attempts), ('PENDING', 1))
+        self.assertGreater(reminder.due_at, timezone.now())
+        self.assertEqual(send_due_reminders(), (0, 0, 0))
+
+    def test_series_and_backfill_queue_reminders(self):
+        series = AppointmentSeries(
+            patient=self.patient, provider=self.provider, reason='Physio',
+            start_date=self.monday, time=time(9, 0), interval_days=7, occurrences=3,
+        )
+        appointments = book_series(series)
+        self.assertEqual(ScheduledReminder.objects.filter(appointment__in=appointments).count(), 6)
+
+        booked = self.book(self.monday, time(11, 0))
+        self.assertEqual(self.offsets(booked), [])
+        schedule_upcoming()
+        self.assertEqual(self.offsets(booked), [60, 1440])
+        self.assertEqual(ScheduledReminder.objects.count(), 8)
+
+
+class MailDispatchTests(TestCase):
+    def test_pool_reuses_one_smtp_session_and_reports_each_message(self):
+        sink = SMTPSink().start()
+        self.addCleanup(sink.stop)
+        messages = [
+            mail.EmailMessage(f'Message {n}', 'body', 'from@example.com', ['to@example.com'])
+            for n in range(10)
+        ]
+        with override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=sink.port, EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='',
+        ):
+            pool = ConnectionPool(max_messages=6)
+            results = dispatch(messages, batch_size=4, connection_pool=pool)
+            pool.close()
+        self.assertTrue(all(result.sent for result in results))
+        self.assertEqual(sink.messages, 10)
+        # Recycled once after max_messages
+        self.assertEqual(sink.connections, 2)
+
+    def test_each_batch_is_one_backend_call(self):
+        messages = [
+            mail.EmailMessage(f'Message {n}', 'body', 'from@example.com', ['to@example.com'])
+            for n in range(10)
+        ]
+        with mock.patch.object(
+            locmem.EmailBackend, 'send_messages', autospec=True, side_effect=lambda backend, batch: len(batch)
+        ) as send:
+            results = dispatch(messages, batch_size=4, connection_pool=ConnectionPool())
+        self.assertEqual(send.call_count, 3)
+        self.assertTrue(all(result.sent for result in results))
+
+    def test_failures_are_reported_per_message(self):
+        messages = [mail.EmailMessage('Hi', 'body', 'from@example.com', ['to@example.com']) for n in range(4)]
+        calls = []
+
+        def reject_second(backend, batch):
+            calls.append(len(batch))
+            for message in batch:
+                if message is messages[1]:
+                    raise OSError('rejected')
+                mail.outbox.append(message)
+            return len(batch)
+
+        with mock.patch.object(locmem.EmailBackend, 'send_messages', reject_second):
+            results = dispatch(messages, connection_pool=ConnectionPool())
+        self.assertEqual([result.sent for result in results], [True, False, True, True])
+        self.assertEqual(str(results[1].error), 'rejected')
+        # The messages ahead of the failure are not sent twice
+        self.assertEqual(calls, [4, 2])
+        self.assertEqual(len(mail.outbox), 3)
+
+
+    def test_unreachable_server_fails_the_batch_after_one_attempt(self):
+        messages = [mail.EmailMessage('Hi', 'body', 'from@example.com', ['to@example.com']) for n in range(10)]
+        with mock.patch.object(
+            locmem.EmailBackend, 'open', autospec=True, side_effect=ConnectionRefusedError('refused')
+        ) as open_connection:
+            results = dispatch(messages, batch_size=5, connection_pool=ConnectionPool())
+        # One attempt per batch, not per message
+        self.assertEqual(open_connection.call_count, 2)
+        self.assertFalse(any(result.sent for result in results))
+        self.assertEqual({str(result.error) for result in results}, {'refused'})
+
+    def test_fresh_session_dropping_fails_the_rest_of_the_batch(self):
+        messages = [mail.EmailMessage('Hi', 'body', 'from@example.com', ['to@example.com']) for n in range(4)]
+        with mock.patch.object(
+            locmem.EmailBackend, 'send_messages', autospec=True, side_effect=ConnectionResetError('reset')
+        ) as send:
+            results = dispatch(messages, connection_pool=ConnectionPool())
+        self.assertEqual(send.call_count, 1)
+        self.assertEqual([result.sent for result in results], [False] * 4)
+
+
+class DirtyFieldTrackingTests(AppointmentTestMixin, TestCase):
+    def test_status_update_needs_no_pre_save_select(self):
+        appointment = Appointment.objects.get(pk=self.book(self.monday, time(9, 0)).pk)
+        appointment.status = 'COMPLETED'
+        with CaptureQueriesContext(connection) as queries:
+            appointment.save()
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT "appointments_appointment"')])
+        self.assertEqual(appointment.outbox_messages.get().event, 'status_update')
+        self.assertEqual(appointment.get_changed_fields(), {})
+
+    def test_changed_fields_and_previous_values(self):
+        appointment = Appointment.objects.get(pk=self.book(self.monday, time(9, 0)).pk)
+        self.assertEqual(appointment.get_changed_fields(), {})
+        appointment.time = time(11, 0)
+        self.assertEqual(appointment.get_changed_fields(), {'time': (time(9, 0), time(11, 0))})
+        self.assertEqual(appointment.previous_value('time'), time(9, 0))
+
+    def test_reschedule_and_cancel_queue_the_right_event(self):
+        appointment = Appointment.objects.get(pk=self.book(self.monday, time(9, 0)).pk)
+        appointment.time = time(11, 0)
+        appointment.save()
+        appointment.status = 'CANCELLED'
+        appointment.save()
+        self.assertEqual(
+            sorted(appointment.outbox_messages.values_list('event', flat=True)),
+            ['cancellation', 'rescheduled']
+        )
+
+    def test_save_changed_writes_only_dirty_columns(self):
+        appointment = Appointment.objects.get(pk=self.book(self.monday, time(9, 0)).pk)
+        self.assertFalse(appointment.save_changed())
+        appointment.notes = 'Bring results'
+        with self.captureOnCommitCallbacks(), self.assertNumQueries(3):
+            self.assertTrue(appointment.save_changed())
+
+
+class SlotHoldTests(AppointmentTestMixin, TestCase):
+    def setUp(self):
+        self.other = User.objects.create_user(
+            'other@example.com', 'pass1234', username='other', user_type='patient'
+        )
+
+    def test_held_slot_fails_fast_for_others(self):
+        hold_slot(self.provider, self.monday, time(10, 0), self.patient)
+        # Re-holding your own slot just extends it
+        hold_slot(self.provider, self.monday, time(10, 0), self.patient)
+        with self.assertRaises(SlotUnavailable):
+            hold_slot(self.provider, self.monday, time(10, 0), self.other)
+        with self.assertRaises(SlotUnavailable):
+            book_slot(Appointment(
+                patient=self.other, provider=self.provider,
+                date=self.monday, time=time(10, 0), reason='Checkup'
+            ))
+
+    def test_holder_books_and_hold_is_released(self):
+        hold = hold_slot(self.provider, self.monday, time(10, 0), self.patient)
+        book_slot(Appointment(
+            patient=self.patient, provider=self.provider,
+            date=self.monday, time=time(10, 0), reason='Checkup'
+        ))
+        self.assertFalse(type(hold).objects.exists())
+        with self.assertRaises(SlotUnavailable):
+            hold_slot(self.provider, self.monday, time(10, 0), self.other)
+
+    def test_expired_hold_does_not_block(self):
+        hold = hold_slot(self.provider, self.monday, time(10, 0), self.patient)
+        type(hold).objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(hold_slot(self.provider, self.monday, time(10, 0), self.other).holder, self.other)
+
+    def test_new_hold_releases_the_previous_one(self):
+        hold_slot(self.provider, self.monday, time(10, 0), self.patient)
+        hold_slot(self.provider, self.monday, time(11, 0), self.patient)
+        self.assertEqual(list(SlotHold.objects.values_list('time', flat=True)), [time(11, 0)])
+        self.assertEqual(hold_slot(self.provider, self.monday, time(10, 0), self.other).holder, self.other)
+
+    def test_new_hold_keeps_a_waitlist_offer(self):
+        WaitlistEntry.objects.create(
+            patient=self.patient, specialization='Cardiology', appointment_type='FOLLOW_UP', reason='Sooner please',
+            earliest_date=self.monday, latest_date=self.monday,
+        )
+        self.assertIsNotNone(offer_slot(self.provider, self.monday, time(14, 0), 30))
+        hold_slot(self.provider, self.monday, time(10, 0), self.patient)
+        hold_slot(self.provider, self.monday, time(11, 0), self.patient)
+        self.assertEqual(
+            sorted(SlotHold.objects.filter(holder=self.patient).values_list('time', flat=True)), [time(11, 0), time(14, 0)]
+        )
+
+    def test_hold_view(self):
+        self.client.force_login(self.patient)
+        url = reverse('appointments:hold_appointment_slot')
+        data = {'provider': self.provider.pk, 'date': self.monday.isoformat(), 'time': '10:00'}
+        self.assertTrue(self.client.post(url, data).json()['held'])
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.post(url, data).status_code, 409)
+        self.assertEqual(self.client.post(url, dict(data, provider='abc')).status_code, 400)
+
+
+class ConcurrentBookingTests(AppointmentTestMixin, TransactionTestCase):
+    THREADS = 16
+
+    def setUp(self):
+        self.setUpTestData()
+
+    def test_many_threads_one_slot(self):
+        patients = [
+            User.objects.create_user(f'p{n}@example.com', None, username=f'p{n}', user_type='patient')
+            for n in range(self.THREADS)
+        ]
+        barrier = threading.Barrier(self.THREADS)
+        outcomes = []
+
+        def attempt(patient):
+            barrier.wait()
+            try:
+                book_slot(Appointment(
+                    patient=patient, provider=self.provider,
+                    date=self.monday, time=time(10, 0), reason='Checkup'
+                ))
+                outcomes.append('booked')
+            except SlotUnavailable:
+                outcomes.append('rejected')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=attempt, args=(patient,)) for patient in patients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(outcomes), ['booked'] + ['rejected'] * (self.THREADS - 1))
+        self.assertEqual(Appointment.objects.filter(status='SCHEDULED').count(), 1)
+
+
+class OverlapConstraintTests(AppointmentTestMixin, TestCase):
+    def test_database_rejects_overlapping_scheduled_appointments(self):
+        self.book(self.monday, time(10, 0), appointment_type='EMERGENCY')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.book(self.monday, time(10, 30), appointment_type='ROUTINE')
+        # Back to back, cancelled, or with another provider is fine
+        self.book(self.monday, time(11, 0))
+        cancelled = self.book(self.monday, time(10, 30), status='CANCELLED')
+        other = ProviderProfile.objects.create(
+            user=User.objects.create_user('d2@example.com', None, username='d2', user_type='provider'),
+            license_number='LIC-2', specialization='Cardiology',
+        )
+        self.book(self.monday, time(10, 30), provider=other)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Appointment.objects.filter(pk=cancelled.pk).update(status='SCHEDULED')
+
+
+class AppointmentWindowTests(AppointmentTestMixin, TestCase):
+    def test_window_follows_type_duration(self):
+        appointment = self.book(self.monday, time(10, 0), appointment_type='EMERGENCY')
+        self.assertTrue(timezone.is_aware(appointment.start_at))
+        self.assertEqual(appointment.end_at - appointment.start_at, timedelta(minutes=60))
+        self.assertTrue(appointment.is_upcoming())
+        ical = appointment.get_calendar_link()
+        self.assertIn(f"DTSTART:{self.monday:%Y%m%d}T100000Z", ical)
+        self.assertIn(f"DTEND:{self.monday:%Y%m%d}T110000Z", ical)
+
+    def test_long_appointments_block_following_slots(self):
+        self.book(self.monday, time(10, 0), appointment_type='EMERGENCY')
+        index = AvailabilityIndex(self.provider, self.monday)
+        self.assertTrue(index.is_booked(self.monday, time(10, 30)))
+        self.assertFalse(index.is_booked(self.monday, time(11, 0)))
+        # A 60 minute request at 09:30 runs into the emergency slot
+        self.assertTrue(index.is_booked(self.monday, time(9, 30), duration=60))
+        self.assertFalse(index.is_booked(self.monday, time(9, 30), duration=30))
+
+    def test_rescheduling_moves_the_window(self):
+        appointment = Appointment.objects.get(pk=self.book(self.monday, time(10, 0)).pk)
+        appointment.time = time(14, 0)
+        appointment.save(update_fields=['time'])
+        appointment.refresh_from_db()
+        self.assertEqual(timezone.localtime(appointment.start_at).time(), time(14, 0))
+
+
+class AppointmentSeriesTests(AppointmentTestMixin, TestCase):
+    def series(self, **kwargs):
+        fields = {
+            'patient': self.patient, 'provider': self.provider, 'start_date': self.monday,
+            'time': time(10, 0), 'interval_days': 7, 'occurrences': 4, 'reason': 'Physio',
+        }
+        fields.update(kwargs)
+        return AppointmentSeries(**fields)
+
+    def test_series_dates(self):
+        self.assertEqual(
+            series_dates(self.monday, 14, occurrences=3),
+            [self.monday, self.monday + timedelta(days=14), self.monday + timedelta(days=28)],
+        )
+        # The end date is inclusive and wins over a larger count
+        self.assertEqual(len(series_dates(self.monday, 7, occurrences=10, end_date=self.monday + timedelta(days=14))), 3)
+        self.assertEqual(len(series_dates(self.monday, 1, end_date=self.monday + timedelta(days=400))), MAX_SERIES_OCCURRENCES)
+
+    def test_books_all_occurrences_with_one_summary(self):
+        with CaptureQueriesContext(connection) as short:
+            book_series(self.series(occurrences=2, time=time(14, 0)))
+        OutboxMessage.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            appointments = book_series(self.series(occurrences=12))
+        # One availability check and one insert for the whole series, not one per date
+        self.assertEqual(len(queries), len(short))
+        self.assertEqual(len(appointments), 12)
+        series = AppointmentSeries.objects.get(time=time(10, 0))
+        self.assertEqual(series.appointments.count(), 12)
+        self.assertEqual(
+            list(OutboxMessage.objects.values_list('appointment_id', 'event')),
+            [(appointments[0].pk, 'series_confirmation')],
+        )
+
+        messages = build_appointment_messages(appointments[0], 'series_confirmation')
+        self.assertEqual(len(messages), 2)
+        body = messages[0].alternatives[0][0]
+        self.assertIn((self.monday + timedelta(days=77)).strftime('%B %d, %Y'), body)
+
+    def test_conflict_rejects_whole_series(self):
+        taken = self.monday + timedelta(days=14)
+        self.book(taken, time(10, 0))
+        with self.assertRaises(SeriesConflict) as raised:
+            book_series(self.series())
+        self.assertEqual([date for date, _ in raised.exception.conflicts], [taken])
+        self.assertFalse(AppointmentSeries.objects.exists())
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_other_patients_hold_conflicts(self):
+        other = User.objects.create_user('other@example.com', 'pass1234', username='other', user_type='patient')
+        hold_slot(self.provider, self.monday + timedelta(days=7), time(10, 0), other)
+        with self.assertRaises(SeriesConflict):
+            book_series(self.series())
+        # The patient's own hold is consumed by the booking
+        hold_slot(self.provider, self.monday + timedelta(days=35), time(10, 0), self.patient)
+        book_series(self.series(start_date=self.monday + timedelta(days=35), occurrences=2))
+        self.assertFalse(SlotHold.objects.filter(holder=self.patient).exists())
+
+    def test_view_shows_conflicts(self):
+        self.book(self.monday + timedelta(days=7), time(10, 0))
+        self.client.force_login(self.patient)
+        data = {
+            'provider': self.provider.pk, 'start_date': self.monday.isoformat(), 'time': '10:00',
+            'interval_days': 7, 'occurrences': 3, 'appointment_type': 'FOLLOW_UP', 'reason': 'Physio',
+        }
+        response = self.client.post(reverse('appointments:book_appointment_series'), data)
+        self.assertContains(response, (self.monday + timedelta(days=7)).strftime('%B %d, %Y'))
+        self.assertEqual(Appointment.objects.count(), 1)
+
+        data['start_date'] = (self.monday + timedelta(days=14)).isoformat()
+        response = self.client.post(reverse('appointments:book_appointment_series'), data)
+        self.assertRedirects(response, reverse('appointments:appointment_list'))
+        self.assertEqual(Appointment.objects.filter(series__isnull=False).count(), 3)
+
+    def test_view_rejects_non_positive_interval(self):
+        self.client.force_login(self.patient)
+        url = reverse('appointments:book_appointment_series')
+        data = {
+            'provider': self.provider.pk, 'start_date': self.monday.isoformat(), 'time': '10:00',
+            'occurrences': 3, 'appointment_type': 'FOLLOW_UP', 'reason': 'Physio',
+        }
+        for interval_days in (0, -7):
+            with self.subTest(interval_days=interval_days):
+                response = self.client.post(url, dict(data, interval_days=interval_days))
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.context['form'].has_error('interval_days'))
+        # Anything book_series still rejects is shown on the form rather than failing the request
+        with mock.patch('appointments.views.book_series', side_effect=ValueError('Give the number of occurrences')):
+            response = self.client.post(url, dict(data, interval_days=7))
+        self.assertEqual(response.context['form'].non_field_errors(), ['Give the number of occurrences'])
+        self.assertFalse(Appointment.objects.exists())
+
+
+class WaitlistTests(AppointmentTestMixin, TestCase):
+    def setUp(self):
+        self.waiting = [
+            User.objects.create_user(f'w{n}@example.com', 'pass1234', username=f'w{n}', user_type='patient')
+            for n in range(3)
+        ]
+
+    def join(self, patient, **kwargs):
+        fields = {
+            'patient': patient, 'specialization': 'Cardiology', 'appointment_type': 'FOLLOW_UP',
+            'reason': 'Sooner please', 'earliest_date': self.monday, 'latest_date': self.monday + timedelta(days=6),
+        }
+        fields.update(kwargs)
+        return WaitlistEntry.objects.create(**fields)
+
+    def test_matching_respects_queue_and_window(self):
+        other_provider = ProviderProfile.objects.create(
+            user=User.objects.create_user('d2@example.com', None, username='d2', user_type='provider'),
+            license_number='LIC-2', specialization='Cardiology',
+        )
+        self.join(self.waiting[0], provider=other_provider)
+        self.join(self.waiting[1], earliest_time=time(13, 0))
+        self.join(self.waiting[2], appointment_type='EMERGENCY')
+        first_fit = self.join(self.patient)
+        self.join(self.waiting[0])
+        # Wrong provider, too early in the day, and a 60 minute visit in a 30 minute gap are skipped
+        self.assertEqual(matching_entries(self.provider, self.monday, time(10, 0), 30).first(), first_fit)
+
+    def test_cancellation_offers_slot_and_holds_it(self):
+        entry = self.join(self.waiting[0])
+        appointment = self.book(self.monday, time(10, 0))
+        self.client.force_login(self.patient)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('appointments:cancel_appointment', args=[appointment.pk]))
+
+        offer = WaitlistOffer.objects.get()
+        self.assertEqual((offer.entry, offer.date, offer.time, offer.duration), (entry, self.monday, time(10, 0), 30))
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'OFFERED')
+        # Nobody else can grab the slot while the offer is open
+        with self.assertRaises(SlotUnavailable):
+            hold_slot(self.provider, self.monday, time(10, 0), self.waiting[1])
+
+        self.client.force_login(self.waiting[0])
+        response = self.client.post(reverse('appointments:respond_waitlist_offer', args=[offer.pk]), {'action': 'accept'})
+        booked = Appointment.objects.get(patient=self.waiting[0])
+        self.assertRedirects(response, booked.get_absolute_url())
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'BOOKED')
+
+    def test_declined_and_expired_offers_cascade(self):
+        entries = [self.join(patient) for patient in self.waiting]
+        offer = offer_slot(self.provider, self.monday, time(10, 0), 30)
+        self.assertEqual(offer.entry, entries[0])
+
+        second = decline_offer(offer)
+        self.assertEqual(second.entry, entries[1])
+        entries[0].refresh_from_db()
+        self.assertEqual(entries[0].status, 'WAITING')
+
+        WaitlistOffer.objects.filter(pk=second.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        out = StringIO()
+        call_command('process_waitlist', stdout=out)
+        self.assertIn('1 offers expired, 1 re-offered, 1 notified', out.getvalue())
+        third = WaitlistOffer.objects.get(status='PENDING')
+        self.assertEqual(third.entry, entries[2])
+        self.assertEqual(mail.outbox[0].to, [self.waiting[2].email])
+        self.assertEqual(SlotHold.objects.get().holder, self.waiting[2])
+
+        # The queue is exhausted for this slot; the hold goes and the slot is free again
+        self.assertIsNone(decline_offer(third))
+        self.assertFalse(SlotHold.objects.exists())
+
+    def test_expired_offer_cannot_be_accepted(self):
+        self.join(self.waiting[0])
+        offer = offer_slot(self.provider, self.monday, time(10, 0), 30)
+        WaitlistOffer.objects.filter(pk=offer.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        offer.refresh_from_db()
+        with self.assertRaises(SlotUnavailable):
+            accept_offer(offer)
+
+    def test_every_cancellation_path_offers_the_slot(self):
+        self.join(self.waiting[0])
+        self.join(self.waiting[1])
+        bulk, saved = self.book(self.monday, time(10, 0)), self.book(self.monday, time(11, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            transition_status(Appointment.objects.filter(pk=bulk.pk), 'CANCELLED', source='admin')
+        # A status edit on the admin change form is a plain save
+        saved = Appointment.objects.get(pk=saved.pk)
+        saved.status = 'CANCELLED'
+        with self.captureOnCommitCallbacks(execute=True):
+            saved.save()
+        self.assertEqual(
+            sorted(WaitlistOffer.objects.values_list('time', 'entry__patient')),
+            [(time(10, 0), self.waiting[0].pk), (time(11, 0), self.waiting[1].pk)],
+        )
+
+    def test_closed_offer_is_not_offered_back_to_the_same_patient(self):
+        first = self.join(self.waiting[0])
+        self.join(self.waiting[0], appointment_type='ROUTINE')
+        next_patient = self.join(self.waiting[1])
+        offer = offer_slot(self.provider, self.monday, time(10, 0), 30)
+        self.assertEqual(offer.entry, first)
+        self.assertEqual(decline_offer(offer).entry, next_patient)
+
+    def test_offer_closed_while_accepting_books_nothing(self):
+        entry = self.join(self.waiting[0])
+        offer = offer_slot(self.provider, self.monday, time(10, 0), 30)
+        # The expiry sweep closes the offer after the patient loaded it
+        WaitlistOffer.objects.filter(pk=offer.pk).update(status='EXPIRED')
+        with self.assertRaises(SlotUnavailable):
+            accept_offer(offer)
+        self.assertFalse(Appointment.objects.exists())
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'OFFERED')
+        self.assertEqual(WaitlistOffer.objects.get().status, 'EXPIRED')
+
+    def test_rebooked_slot_is_not_offered(self):
+        self.join(self.waiting[0])
+        self.book(self.monday, time(10, 0))
+        self.assertIsNone(offer_slot(self.provider, self.monday, time(10, 0), 30))
+
+    def test_offers_are_claimed_before_mail_goes_out(self):
+        self.join(self.waiting[0])
+        offer = offer_slot(self.provider, self.monday, time(10, 0), 30)
+        depth = len(connection.atomic_blocks)
+        seen = {}
+
+        def send(messages):
+            seen['depth'] = len(connection.atomic_blocks)
+            seen['claimed_until'] = WaitlistOffer.objects.get().notify_claimed_until
+            # A second worker running meanwhile leaves the claimed offer alone
+            seen['second_worker'] = notify_offers()
+            return dispatch(messages)
+
+        with mock.patch('appointments.waitlist.dispatch', side_effect=send):
+            self.assertEqual(notify_offers(), 1)
+        self.assertEqual(seen['depth'], depth)
+        self.assertGreater(seen['claimed_until'], timezone.now())
+        self.assertEqual(seen['second_worker'], 0)
+        offer.refresh_from_db()
+        self.assertIsNotNone(offer.notified_at)
+        self.assertIsNone(offer.notify_claimed_until)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failed_offer_mail_is_released_for_the_next_run(self):
+        self.join(self.waiting[0])
+        offer = offer_slot(self.provider, self.monday, time(10, 0), 30)
+        with mock.patch.object(locmem.EmailBackend, 'send_messages', side_effect=OSError('smtp down')):
+            self.assertEqual(notify_offers(), 0)
+        offer.refresh_from_db()
+        self.assertEqual((offer.notified_at, offer.notify_claimed_until), (None, None))
+        self.assertEqual(notify_offers(), 1)
+
+
+class AppointmentRollupTests(AppointmentTestMixin, TestCase):
+    def counts(self):
+        return {
+            (stat.date, stat.status, stat.appointment_type): stat.count
+            for stat in AppointmentDailyStat.objects.filter(provider=self.provider).exclude(count=0)
+        }
+
+    def test_every_write_path_keeps_rollups_current(self):
+        first = book_slot(Appointment(
+            patient=self.patient, provider=self.provider, date=self.monday, time=time(9, 0), reason='Checkup',
+        ))
+        second = book_slot(Appointment(
+            patient=self.patient, provider=self.provider, date=self.monday, time=time(10, 0), reason='Checkup',
+        ))
+        book_series(AppointmentSeries(
+            patient=self.patient, provider=self.provider, start_date=self.monday, time=time(14, 0),
+            interval_days=7, occurrences=2, reason='Physio',
+        ))
+        transition_status(Appointment.objects.filter(pk=first.pk), 'CANCELLED')
+        second.date += timedelta(days=1)
+        second.save()
+        Appointment.objects.filter(series__isnull=False, date__gt=self.monday).delete()
+
+        expected = {
+            (self.monday, 'CANCELLED', 'CONSULTATION'): 1,
+            (self.monday + timedelta(days=1), 'SCHEDULED', 'CONSULTATION'): 1,
+            (self.monday, 'SCHEDULED', 'FOLLOW_UP'): 1,
+        }
+        self.assertEqual(self.counts(), expected)
+        self.assertEqual(AppointmentDailyStat.objects.get(date=self.monday, status='CANCELLED').specialization, 'Cardiology')
+
+        # A rebuild from the appointments table agrees with the incremental counts
+        AppointmentDailyStat.objects.all().delete()
+        self.book(self.monday + timedelta(days=3), time(9, 0))
+        out = StringIO()
+        call_command('rebuild_appointment_rollups', stdout=out)
+        self.assertIn('4 rows', out.getvalue())
+        expected[self.monday + timedelta(days=3), 'SCHEDULED', 'CONSULTATION'] = 1
+        self.assertEqual(self.counts(), expected)
+
+    def test_dashboard_reads_rollups_in_constant_queries(self):
+        admin_user = User.objects.create_user('admin@example.com', 'pass1234', username='admin', user_type='admin')
+        self.client.force_login(admin_user)
+        url = reverse('accounts:admin_dashboard')
+        today = timezone.localdate()
+
+        def seed(days):
+            for offset in days:
+                self.book(today - timedelta(days=offset), time(9, 0), status='COMPLETED')
+                self.book(today - timedelta(days=offset), time(10, 0), status='NO_SHOW')
+            rebuild(today - timedelta(days=max(days)), today)
+
+        seed(range(3))
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+        seed(range(3, 60))
+        with self.assertNumQueries(len(small)):
+            response = self.client.get(url, {'days': 90})
+        stats = response.context['stats']
+        self.assertEqual(stats['totals']['total'], 120)
+        self.assertEqual(stats['providers'][0]['completion_rate'], 50)
+        self.assertEqual(stats['by_specialization'][0]['specialization'], 'Cardiology')
+
+
+class AppointmentExchangeTests(AppointmentTestMixin, TestCase):
+    def setUp(self):
+        for day in range(5):
+            for hour in (9, 10):
+                self.book(self.monday + timedelta(days=day), time(hour, 0), reason='Checkup, "annual"')
+        self.staff = User.objects.create_user(
+            'staff@example.com', 'pass1234', username='staff', user_type='admin', is_staff=True
+        )
+
+    def export_file(self, export_format):
+        handle, path = tempfile.mkstemp(suffix=f'.{export_format}')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        call_command('export_appointments', format=export_format, output=path, stdout=StringIO())
+        return path
+
+    def test_streaming_export_view(self):
+        self.client.force_login(self.patient)
+        url = reverse('appointments:export_appointments')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(url, {'start_date': self.monday + timedelta(days=1), 'end_date': self.monday + timedelta(days=2)})
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(line.decode() for line in response.streaming_content))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0]['patient_email'], 'patient@example.com')
+        self.assertEqual(rows[0]['provider_license'], 'LIC-1')
+        self.assertEqual(rows[0]['reason'], 'Checkup, "annual"')
+
+        response = self.client.get(url, {'format': 'ndjson', 'status': 'scheduled'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 10)
+        self.assertEqual(json.loads(lines[0])['provider_first_name'], 'Doc')
+        self.assertEqual(self.client.get(url, {'format': 'xml'}).status_code, 400)
+
+    def test_round_trip_without_notifications(self):
+        for export_format in ('csv', 'ndjson'):
+            with self.subTest(format=export_format):
+                path = self.export_file(export_format)
+                Appointment.objects.all().delete()
+                AppointmentDailyStat.objects.all().delete()
+                out = StringIO()
+                call_command('import_appointments', path, stdout=out, stderr=StringIO())
+                self.assertIn('Imported 10 appointments, skipped 0 rows', out.getvalue())
+                self.assertEqual(Appointment.objects.filter(reason='Checkup, "annual"').count(), 10)
+                self.assertFalse(OutboxMessage.objects.exists())
+                self.assertEqual(len(mail.outbox), 0)
+                self.assertEqual(sum(AppointmentDailyStat.objects.values_list('count', flat=True)), 10)
+
+    def test_invalid_and_conflicting_rows_are_skipped(self):
+        records = [
+            {'patient_email': 'PATIENT@example.com', 'provider_license': 'lic-1', 'date': self.monday.isoformat(),
+             'time': '14:00', 'reason': 'New', 'appointment_type': 'routine'},
+            # Already booked in the database, then twice in the file
+            {'patient_email': 'patient@example.com', 'provider_license': 'LIC-1', 'date': self.monday.isoformat(),
+             'time': '09:00', 'reason': 'Clash'},
+            {'patient_email': 'patient@example.com', 'provider_email': 'doctor@example.com',
+             'date': self.monday.isoformat(), 'time': '14:00', 'reason': 'Clash'},
+            # Overlapping without starting at the same time, in the database and in the file
+            {'patient_email': 'patient@example.com', 'provider_license': 'LIC-1', 'date': self.monday.isoformat(),
+             'time': '10:15', 'reason': 'Overlap', 'appointment_type': 'FOLLOW_UP'},
+            {'patient_email': 'patient@example.com', 'provider_license': 'LIC-1', 'date': self.monday.isoformat(),
+             'time': '13:45', 'reason': 'Overlap', 'appointment_type': 'EMERGENCY'},
+            {'patient_email': 'nobody@example.com', 'provider_license': 'LIC-1', 'date': self.monday.isoformat(),
+             'time': '15:00', 'reason': 'Unknown'},
+            {'patient_email': 'patient@example.com', 'provider_license': 'LIC-1', 'date': 'soon',
+             'time': '15:00', 'reason': 'Bad date'},
+            {'patient_email': 'patient@example.com', 'provider_license': 'LIC-1', 'date': self.monday.isoformat(),
+             'time': '16:00', 'reason': 'Old', 'status': 'COMPLETED'},
+        ]
+        stream = StringIO('\n'.join(json.dumps(record) for record in records) + '\n[]\n')
+        with CaptureQueriesContext(connection) as queries:
+            result = AppointmentImporter(batch_size=100).run(read_rows(stream, 'ndjson'))
+        self.assertEqual(result.created, 2)
+        self.assertEqual([line for line, _ in result.errors], [2, 3, 4, 5, 6, 7, 9])
+        # Providers, patients, provider lock, booked slots, then the insert; nothing per row
+        self.assertLess(len(queries), 14)
+        self.assertEqual(Appointment.objects.get(reason='New').appointment_type, 'ROUTINE')
+
+    def test_rows_the_database_refuses_are_reported_per_line(self):
+        records = [
+            {'patient_email': 'patient@example.com', 'provider_license': 'LIC-1', 'date': self.monday.isoformat(),
+             'time': time, 'reason': reason}
+            for time, reason in (('14:00', 'New'), ('09:15', 'Clash'), ('15:00', 'New'))
+        ]
+        stream = StringIO('\n'.join(json.dumps(record) for record in records) + '\n')
+        # As if a writer that skips the provider lock booked 09:00 after the overlap check
+        with mock.patch.object(AppointmentImporter, '_check_overlaps', lambda self, built, rejected, lock=False: built):
+            result = AppointmentImporter(batch_size=100).run(read_rows(stream, 'ndjson'))
+        self.assertEqual(result.created, 2)
+        self.assertEqual(result.errors, [(2, 'This time slot is already booked')])
+        self.assertEqual(Appointment.objects.filter(reason='New').count(), 2)
+        self.assertEqual(ScheduledReminder.objects.filter(appointment__reason='New').values('appointment').distinct().count(), 2)
+
+
+class CalendarFeedTests(AppointmentTestMixin, TestCase):
+    def setUp(self):
+        self.upcoming = self.book(self.monday, time(10, 0), reason='Knee, left; ' + 'very ' * 30 + 'sore')
+        self.later = self.book(self.monday + timedelta(days=1), time(11, 0))
+        self.book(timezone.localdate() - timedelta(days=3), time(9, 0), status='COMPLETED')
+        self.feed = CalendarFeed.objects.create(user=self.patient, kind='patient')
+        self.url = self.feed.get_absolute_url()
+
+    def fetch(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        body = b''.join(response.streaming_content).decode() if response.status_code == 200 else ''
+        return response, body
+
+    def test_feed_lists_upcoming_events(self):
+        response, body = self.fetch()
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertEqual(body.count('BEGIN:VEVENT'), 2)
+        self.assertIn(f'UID:appointment-{self.upcoming.pk}@mediconnect', body)
+        self.assertIn(r'Knee\, left\; very', body)
+        self.assertTrue(all(len(line.encode()) <= 75 for line in body.split('\r\n')))
+
+        provider_feed = CalendarFeed.objects.create(user=self.provider_user, kind='provider')
+        body = b''.join(self.client.get(provider_feed.get_absolute_url()).streaming_content).decode()
+        self.assertEqual(body.count('BEGIN:VEVENT'), 2)
+        self.assertIn('X-WR-CALNAME:MediConnect Schedule', body)
+
+    def test_unchanged_polls_get_304(self):
+        response, _ = self.fetch()
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        # Token lookup plus one aggregate over the upcoming range
+        with self.assertNumQueries(2):
+            response, _ = self.fetch(if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.fetch(if_modified_since=last_modified)[0].status_code, 304)
+
+        transition_status(Appointment.objects.filter(pk=self.later.pk), 'CANCELLED')
+        response, body = self.fetch(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(body.count('BEGIN:VEVENT'), 1)
+
+    def test_reset_token_revokes_old_url(self):
+        self.client.force_login(self.patient)
+        self.client.post(reverse('appointments:calendar_feeds'), {'kind': 'patient'})
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.feed.refresh_from_db()
+        self.assertEqual(self.client.get(self.feed.get_absolute_url()).status_code, 200)
+
+
+class StatusTransitionTests(AppointmentTestMixin, TestCase):
+    def book_day(self, day, count, **kwargs):
+        # 15 minute visits every 15 minutes
+        kwargs.setdefault('appointment_type', 'FOLLOW_UP')
+        return [self.book(day, time(9 + n // 4, 15 * (n % 4)), **kwargs) for n in range(count)]
+
+    def test_bulk_transition_records_and_queues_in_batches(self):
+        booked = self.book_day(self.monday, 6)
+        cancelled = self.book(self.monday, time(16, 0), status='CANCELLED')
+        changed = transition_status(
+            Appointment.objects.filter(date=self.monday), 'COMPLETED',
+            changed_by=self.provider_user, source='admin', chunk_size=4,
+        )
+        self.assertEqual(changed, 6)
+        self.assertEqual(Appointment.objects.filter(status='COMPLETED').count(), 6)
+        self.assertEqual(Appointment.objects.get(pk=cancelled.pk).status, 'CANCELLED')
+        transitions = StatusTransition.objects.filter(to_status='COMPLETED')
+        self.assertEqual(sorted(transitions.values_list('appointment_id', flat=True)), [a.pk for a in booked])
+        self.assertTrue(all(t.from_status == 'SCHEDULED' and t.changed_by == self.provider_user for t in transitions))
+        self.assertEqual(OutboxMessage.objects.filter(event='status_update', status='PENDING').count(), 6)
+        # Running it again has nothing left to move
+        self.assertEqual(transition_status(Appointment.objects.all(), 'COMPLETED'), 0)
+
+    def test_query_count_does_not_grow_with_chunk_size(self):
+        self.book_day(self.monday, 2)
+        with CaptureQueriesContext(connection) as small:
+            transition_status(Appointment.objects.filter(date=self.monday), 'NO_SHOW')
+        self.book_day(self.monday + timedelta(days=1), 20)
+        with CaptureQueriesContext(connection) as large:
+            transition_status(Appointment.objects.filter(date=self.monday + timedelta(days=1)), 'NO_SHOW')
+        self.assertEqual(len(small), len(large))
+
+    def test_redelivers_status_update_for_a_second_change(self):
+        appointment = self.book(self.monday, time(10, 0))
+        transition_status(Appointment.objects.filter(pk=appointment.pk), 'NO_SHOW')
+        OutboxMessage.objects.update(status='SENT')
+        transition_status(Appointment.objects.filter(pk=appointment.pk), 'COMPLETED')
+        message = OutboxMessage.objects.get(appointment=appointment)
+        self.assertEqual((message.event, message.status), ('status_update', 'PENDING'))
+        self.assertEqual(appointment.status_transitions.count(), 2)
+
+    def test_unknown_target_status_is_rejected(self):
+        with self.assertRaises(InvalidTransition):
+            transition_status(Appointment.objects.all(), 'SCHEDULED')
+
+    def test_admin_action_uses_the_service(self):
+        booked = self.book_day(self.monday, 3)
+        admin_user = User.objects.create_superuser('admin@example.com', 'pass1234', username='admin')
+        self.client.force_login(admin_user)
+        self.client.post(reverse('admin:appointments_appointment_changelist'), {
+            'action': 'mark_as_no_show', '_selected_action': [a.pk for a in booked],
+        })
+        self.assertEqual(Appointment.objects.filter(status='NO_SHOW').count(), 3)
+        self.assertEqual(StatusTransition.objects.filter(source='admin', changed_by=admin_user).count(), 3)
+
+    def test_cancel_view_records_who_cancelled(self):
+        appointment = self.book(self.monday, time(10, 0))
+        self.client.force_login(self.patient)
+        self.client.post(reverse('appointments:cancel_appointment', args=[appointment.pk]))
+        transition = appointment.status_transitions.get()
+        self.assertEqual((transition.to_status, transition.changed_by, transition.source), ('CANCELLED', self.patient, 'web'))
+        self.assertTrue(OutboxMessage.objects.filter(appointment=appointment, event='cancellation').exists())
+
+    def test_close_appointments_covers_every_provider(self):
+        other_user = User.objects.create_user('nurse@example.com', None, username='nurse', user_type='provider')
+        other = ProviderProfile.objects.create(user=other_user, license_number='LIC-2', specialization='Dermatology')
+        yesterday = timezone.localdate() - timedelta(days=1)
+        ended = [self.book(yesterday, time(10, 0)), self.book(yesterday, time(10, 0), provider=other)]
+        upcoming = self.book(self.monday, time(10, 0))
+        call_command('close_appointments', '--status', 'NO_SHOW', stdout=StringIO())
+        self.assertEqual(
+            sorted(Appointment.objects.filter(status='NO_SHOW').values_list('pk', flat=True)),
+            sorted(a.pk for a in ended),
+        )
+        self.assertEqual(Appointment.objects.get(pk=upcoming.pk).status, 'SCHEDULED')
+
+
+class AppointmentAdminTests(AppointmentTestMixin, TestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser('admin@example.com', None, username='admin')
+        self.client.force_login(self.admin_user)
+        self.url = reverse('admin:appointments_appointment_changelist')
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        self.book(self.monday, time(9, 0), appointment_type='FOLLOW_UP')
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(self.url)
+        for n in range(1, 20):
+            self.book(self.monday, time(9 + n // 4, 15 * (n % 4)), appointment_type='FOLLOW_UP')
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Doc Tor', count=20)
+        self.assertEqual(len(few), len(many))
+
+    def test_search_matches_patient_or_provider_prefix(self):
+        mine = self.book(self.monday, time(9, 0))
+        other = User.objects.create_user(
+            'zed@example.com', None, username='zed', first_name='Zed', last_name='Smith', user_type='patient'
+        )
+        theirs = self.book(self.monday, time(10, 0), patient=other)
+        for term, expected in (
+            ('patient@', [mine]), ('zed', [theirs]), ('Doc', [mine, theirs]), ('atient', []),
+            # Every word has to match, on either side of the appointment
+            ('Zed Smith', [theirs]), ('smith zed', [theirs]), ('doc  zed', [theirs]), ('zed patient@', []),
+        ):
+            with self.subTest(term=term):
+                response = self.client.get(self.url, {'q': term})
+                self.assertEqual(
+                    sorted(a.pk for a in response.context['cl'].result_list),
+                    sorted(a.pk for a in expected),
+                )
+
+    def test_large_tables_use_estimated_counts(self):
+        self.book(self.monday, time(9, 0))
+        self.book(self.monday, time(10, 0))
+        with mock.patch.object(EstimatedCountPaginator, 'threshold', 1), \
+                mock.patch('Healthcore.changelist.estimated_count', return_value=5000):
+            unfiltered = self.client.get(self.url)
+            filtered = self.client.get(self.url, {'q': 'patient@'})
+        self.assertEqual(unfiltered.context['cl'].result_count, 5000)
+        # Filtered querysets are counted exactly
+        self.assertEqual(filtered.context['cl'].result_count, 2)
+        self.assertEqual(estimated_count(Appointment), Appointment.objects.latest('id').id)
+
+
+class AppointmentAPITests(AppointmentTestMixin, TestCase):
+    def setUp(self):
+        self.client.force_login(self.patient)
+        self.url = reverse('api_v1:appointment-list')
+
+    def test_requires_authentication(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_cursor_pages_with_fixed_query_count(self):
+        booked = [self.book(self.monday, time(9 + n // 2, 30 * (n % 2))) for n in range(12)]
+        other = User.objects.create_user('other@example.com', None, username='other', user_type='patient')
+        self.book(self.monday, time(16, 0), patient=other)
+
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(self.url, {'page_size': 2})
+        seen, url, params = [], self.url, {'page_size': 5}
+        while url:
+            with CaptureQueriesContext(connection) as large:
+                data = self.client.get(url, params).json()
+            self.assertEqual(len(large), len(small))
+            seen.extend(row['id'] for row in data['results'])
+            url, params = data['next'], {}
+        self.assertEqual(seen, [a.pk for a in booked])
+        self.assertEqual(data['results'][-1]['provider']['name'], 'Doc Tor')
+
+    def test_sparse_fieldsets(self):
+        self.book(self.monday, time(9, 0))
+        row = self.client.get(self.url, {'fields': 'id,start_at'}).json()['results'][0]
+        self.assertEqual(set(row), {'id', 'start_at'})
+
+    def test_etag_round_trip(self):
+        appointment = self.book(self.monday, time(9, 0))
+        detail = reverse('api_v1:appointment-detail', args=[appointment.pk])
+        for url in (self.url, detail):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        transition_status(Appointment.objects.filter(pk=appointment.pk), 'CANCELLED')
+        self.assertEqual(self.client.get(detail, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_provider_directory_and_slots(self):
+        response = self.client.get(reverse('api_v1:provider-list'), {'specialization': 'cardiology'})
+        self.assertEqual([row['name'] for row in response.json()['results']], ['Doc Tor'])
+
+        url = reverse('api_v1:provider-slots', args=[self.provider.pk])
+        params = {'start_date': self.monday.isoformat(), 'end_date': self.monday.isoformat()}
+        response = self.client.get(url, params)
+        self.assertIn('10:00', response.json()['slots'][self.monday.isoformat()])
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        self.book(self.monday, time(10, 0))
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('10:00', response.json()['slots'][self.monday.isoformat()])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class AppointmentEventsTests(AppointmentTestMixin, TestCase):
+    async def connect(self, user, application=None, headers=()):
+        communicator = WebsocketCommunicator(
+            application or AppointmentEventsConsumer.as_asgi(), '/ws/appointments/', headers=list(headers)
+        )
+        if application is None:
+            communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    @database_sync_to_async
+    def committed(self, func, *args, **kwargs):
+        # Events go out on commit; run the callbacks the test transaction holds back
+        with self.captureOnCommitCallbacks(execute=True):
+            return func(*args, **kwargs)
+
+    def new_appointment(self, at):
+        appointment = Appointment(
+            patient=self.patient, provider=self.provider, date=self.monday, time=at, reason='Checkup'
+        )
+        return book_slot(appointment)
+
+    async def test_anonymous_connections_are_refused(self):
+        communicator = WebsocketCommunicator(AppointmentEventsConsumer.as_asgi(), '/ws/appointments/')
+        communicator.scope['user'] = AnonymousUser()
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+    async def test_booking_is_pushed_to_patient_and_provider_only(self):
+        other = await database_sync_to_async(User.objects.create_user)(
+            'other@example.com', None, username='other', user_type='patient'
+        )
+        patient, provider, bystander = [
+            await self.connect(user) for user in (self.patient, self.provider_user, other)
+        ]
+        appointment = await self.committed(self.new_appointment, time(10, 0))
+
+        for communicator in (patient, provider):
+            event = await communicator.receive_json_from()
+            self.assertEqual((event['event'], event['appointment'], event['status']), ('created', appointment.pk, 'SCHEDULED'))
+        self.assertTrue(await bystander.receive_nothing())
+        for communicator in (patient, provider, bystander):
+            await communicator.disconnect()
+
+    async def test_bulk_transitions_push_one_event_per_appointment(self):
+        appointments = [
+            await database_sync_to_async(self.book)(self.monday, time(9 + n, 0)) for n in range(3)
+        ]
+        provider = await self.connect(self.provider_user)
+        await self.committed(transition_status, Appointment.objects.filter(date=self.monday), 'CANCELLED')
+
+        events = [await provider.receive_json_from() for _ in appointments]
+        self.assertEqual(sorted(event['appointment'] for event in events), [a.pk for a in appointments])
+        self.assertTrue(all(
+            (event['event'], event['previous_status']) == ('cancelled', 'SCHEDULED') for event in events
+        ))
+        self.assertTrue(await provider.receive_nothing())
+        await provider.disconnect()
+
+    async def test_rolled_back_changes_are_not_pushed(self):
+        patient = await self.connect(self.patient)
+
+        def book_and_roll_back():
+            with transaction.atomic():
+                self.new_appointment(time(11, 0))
+                transaction.set_rollback(True)
+        await self.committed(book_and_roll_back)
+        self.assertTrue(await patient.receive_nothing())
+        await patient.disconnect()
+
+    async def test_asgi_application_authenticates_from_the_session(self):
+        await database_sync_to_async(self.client.force_login)(self.patient)
+        cookie = f'sessionid={self.client.cookies["sessionid"].value}'.encode()
+        patient = await self.connect(
+            None, application, headers=[(b'origin', b'http://testserver'), (b'cookie', cookie)]
+        )
+        await self.committed(self.new_appointment, time(12, 0))
+        self.assertEqual((await patient.receive_json_from())['event'], 'created')
+        await patient.disconnect()
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Plan assertions are written against SQLite EXPLAIN QUERY PLAN')
+class QueryPlanTests(AppointmentTestMixin, TestCase):
+    """
+    Runs each hot code path against a seeded database, captures the appointment
+    queries it issues and fails if their plan scans a whole table or index,
+    sorts in a temp b-tree, or stops using the index meant to serve it.
+    """
+    # A full table or index scan; SEARCH lines are index range reads
+    FULL_SCAN = re.compile(r'\bSCAN (?!CONSTANT ROW)')
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_patient = User.objects.create_user(
+            'other@example.com', None, username='other', user_type='patient'
+        )
+        other_user = User.objects.create_user(
+            'nurse@example.com', None, username='nurse', user_type='provider'
+        )
+        cls.other_provider = ProviderProfile.objects.create(
+            user=other_user, license_number='LIC-2', specialization='Dermatology'
+        )
+        statuses = ['SCHEDULED', 'SCHEDULED', 'COMPLETED', 'CANCELLED']
+        rows = []
+        for offset in range(-21, 21):
+            day = cls.monday + timedelta(days=offset)
+            for hour in range(9, 17):
+                for n, provider in enumerate((cls.provider, cls.other_provider)):
+                    appointment = Appointment(
+                        patient=(cls.patient, cls.other_patient)[(hour + n) % 2], provider=provider,
+                        date=day, time=time(hour, 0), reason='Checkup',
+                        status=statuses[(offset + hour + n) % len(statuses)],
+                    )
+                    appointment.sync_window()
+                    rows.append(appointment)
+        Appointment.objects.bulk_create(rows)
+
+    def capture_plans(self, func):
+        """Run func and return [(sql, plan)] for every SELECT it made on appointment tables"""
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT') or 'appointments_' not in sql:
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plans.append((sql, '\n'.join(row[-1] for row in cursor.fetchall())))
+        self.assertTrue(plans, 'No appointment queries were captured')
+        return plans
+
+    def assertIndexedPlans(self, func, *indexes):
+        plans = self.capture_plans(func)
+        for sql, plan in plans:
+            with self.subTest(sql=sql):
+                self.assertIsNone(self.FULL_SCAN.search(plan), f'Full scan in plan:\n{plan}')
+                self.assertNotIn('TEMP B-TREE', plan, f'Sort in plan:\n{plan}')
+        used = '\n'.join(plan for _, plan in plans)
+        for index in indexes:
+            self.assertIn(f'USING INDEX {index} ', used)
+
+    def test_provider_schedule(self):
+        self.client.force_login(self.provider_user)
+        self.assertIndexedPlans(
+            lambda: self.client.get(reverse('appointments:provider_schedule'), {'start_date': self.monday}),
+            'appointment_prov_status_idx',
+        )
+
+    def test_patient_list_pages(self):
+        self.client.force_login(self.patient)
+        url = reverse('appointments:appointment_list')
+        response = self.client.get(url, {'page_size': 5})
+        cursors = {
+            'upcoming_after': response.context['upcoming_cursor'],
+            'past_after': response.context['past_cursor'],
+        }
+        self.assertIndexedPlans(
+            lambda: self.client.get(url, {'page_size': 5, **cursors}),
+            'appointment_pat_status_idx', 'appointment_patient_start_idx',
+        )
+
+    def test_provider_list_pages(self):
+        self.client.force_login(self.provider_user)
+        url = reverse('appointments:appointment_list')
+        response = self.client.get(url, {'page_size': 5})
+        cursors = {
+            'upcoming_after': response.context['upcoming_cursor'],
+            'past_after': response.context['past_cursor'],
+        }
+        self.assertIndexedPlans(
+            lambda: self.client.get(url, {'page_size': 5, **cursors}),
+            'appointment_prov_status_idx', 'appointment_provider_start_idx',
+        )
+
+    def test_availability_lookup(self):
+        self.assertIndexedPlans(
+            lambda: AvailabilityIndex(self.provider, self.monday, self.monday + timedelta(days=6)),
+            'appointment_prov_status_idx',
+        )
+
+    def test_reminder_selection(self):
+        for shard_by in SHARD_BY_CHOICES:
+            with self.subTest(shard_by=shard_by):
+                self.assertIndexedPlans(
+                    lambda: dispatch_reminders(self.monday, shard=1, shards=2, shard_by=shard_by, chunk_size=4),
+                    'appointment_status_start_idx',
+                )
+
+    def test_outbox_delivery(self):
+        OutboxMessage.objects.bulk_create([
+            OutboxMessage(appointment=appointment, event='confirmation')
+            for appointment in Appointment.objects.filter(date=self.monday)
+        ])
+        self.assertIndexedPlans(lambda: deliver_pending(batch_size=5))
+
+    def test_reminder_queue(self):
+        schedule_upcoming()
+        ScheduledReminder.objects.filter(appointment__date=self.monday).update(
+            due_at=timezone.now() - timedelta(minutes=1)
+        )
+        self.assertIndexedPlans(lambda: send_due_reminders(batch_size=5), 'reminder_due_idx')
+
+    def test_waitlist_matching(self):
+        WaitlistEntry.objects.bulk_create([
+            WaitlistEntry(
+                patient=(self.patient, self.other_patient)[n % 2], reason='Sooner please',
+                specialization=('Cardiology', 'Dermatology', 'Neurology')[n % 3],
+                earliest_date=self.monday + timedelta(days=n % 20), latest_date=self.monday + timedelta(days=n % 20 + 3),
+                status=('WAITING', 'WAITING', 'BOOKED')[n % 3 - 1],
+            )
+            for n in range(300)
+        ])
+        self.assertIndexedPlans(
+            lambda: matching_entries(self.provider, self.monday + timedelta(days=2), time(10, 0), 30).first(),
+            'waitlist_queue_idx',
+        )
+
+    def test_calendar_feed_polls(self):
+        for user, kind, index in (
+            (self.patient, 'patient', 'appointment_patient_start_idx'),
+            (self.provider_user, 'provider', 'appointment_provider_start_idx'),
+        ):
+            feed = CalendarFeed.objects.create(user=user, kind=kind)
+            response = self.client.get(feed.get_absolute_url())
+            b''.join(response.streaming_content)
+            with self.subTest(kind=kind):
+                self.assertIndexedPlans(
+                    lambda: self.client.get(feed.get_absolute_url(), headers={'if_none_match': response['ETag']}),
+                    index,
+                )
+
+    def test_unordered_querysets_do_not_sort(self):
+        plan = Appointment.objects.filter(provider=self.provider).explain()
+        self.assertNotIn('TEMP B-TREE', plan)
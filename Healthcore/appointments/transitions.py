@@ -0,0 +1,88 @@
+from collections import Counter
+from django.db import transaction
+from django.utils import timezone
+from . import reminders, rollups, waitlist
+from .events import event_payload, publish, status_event
+from .models import Appointment, OutboxMessage, StatusTransition
+
+DEFAULT_CHUNK_SIZE = 500
+
+# Statuses each target status may be reached from
+ALLOWED_TRANSITIONS = {
+    'COMPLETED': ('SCHEDULED', 'NO_SHOW'),
+    'NO_SHOW': ('SCHEDULED', 'COMPLETED'),
+    'CANCELLED': ('SCHEDULED',),
+}
+
+
+class InvalidTransition(ValueError):
+    """The target status cannot be reached through a transition"""
+
+
+def notification_event(status):
+    """Outbox event queued when an appointment moves to status"""
+    return 'cancellation' if status == 'CANCELLED' else 'status_update'
+
+
+def transition_status(queryset, status, changed_by=None, source='', chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Move every appointment in queryset that may reach status to it, chunk by chunk.
+    Each chunk is one transaction: lock and re-check the rows, update them, record
+    StatusTransition rows, adjust the reporting rollups, queue their notifications,
+    drop their pending reminders and publish live events, all with bulk queries, so
+    the cost per chunk does not depend on its size. Slots freed by a cancellation
+    are offered to the waitlist once the chunk commits. Rows that cannot make the
+    transition (already cancelled, already in status, ...) are skipped.
+    Returns the number of appointments changed.
+    """
+    if status not in ALLOWED_TRANSITIONS:
+        raise InvalidTransition(f'Appointments cannot be moved to {status}')
+    sources = ALLOWED_TRANSITIONS[status]
+    candidates = queryset.filter(status__in=sources).order_by('id').values_list('id', flat=True)
+
+    changed = last_id = 0
+    while True:
+        ids = list(candidates.filter(id__gt=last_id)[:chunk_size])
+        if not ids:
+            return changed
+        last_id = ids[-1]
+        with transaction.atomic():
+            # Re-read under lock: a row may have moved since the candidate scan
+            rows = list(
+                Appointment.objects.select_for_update()
+                .filter(id__in=ids, status__in=sources)
+                .values_list('id', 'status', 'patient_id', 'provider_id', 'start_at', 'date', 'appointment_type', 'time')
+            )
+            if not rows:
+                continue
+            locked_ids = [row[0] for row in rows]
+            Appointment.objects.filter(id__in=locked_ids).update(status=status, updated_at=timezone.now())
+            StatusTransition.objects.bulk_create([
+                StatusTransition(
+                    appointment_id=pk, from_status=from_status, to_status=status,
+                    changed_by=changed_by, source=source,
+                )
+                for pk, from_status, *_ in rows
+            ])
+            OutboxMessage.queue_many(locked_ids, notification_event(status))
+            # None of the target statuses is reminded about
+            reminders.cancel_reminders(locked_ids)
+            deltas = Counter()
+            for _, from_status, _, provider_id, _, date, appointment_type, _ in rows:
+                deltas[date, provider_id, from_status, appointment_type] -= 1
+                deltas[date, provider_id, status, appointment_type] += 1
+            rollups.apply(deltas)
+            publish(
+                (patient_id, provider_id, event_payload(status_event(status), pk, status, start_at, from_status))
+                for pk, from_status, patient_id, provider_id, start_at, *_ in rows
+            )
+            if status == 'CANCELLED':
+                freed = [
+                    Appointment(
+                        pk=pk, patient_id=patient_id, provider_id=provider_id, start_at=start_at,
+                        date=date, time=time, appointment_type=appointment_type,
+                    )
+                    for pk, _, patient_id, provider_id, start_at, date, appointment_type, time in rows
+                ]
+                transaction.on_commit(lambda freed=freed: waitlist.offer_freed_slots(freed))
+        changed += len(rows)
@@ -6,7 +6,16 @@ app_name = 'appointments'
 urlpatterns = [
     path('', views.appointment_list, name='appointment_list'),
     path('book/', views.book_appointment, name='book_appointment'),
+    path('book/series/', views.book_appointment_series, name='book_appointment_series'),
     path('<int:pk>/', views.appointment_detail, name='appointment_detail'),
     path('<int:pk>/cancel/', views.cancel_appointment, name='cancel_appointment'),
     path('schedule/', views.provider_schedule, name='provider_schedule'),
+    path('slots/', views.available_slots, name='available_slots'),
+    path('hold/', views.hold_appointment_slot, name='hold_appointment_slot'),
+    path('calendar/', views.calendar_feeds, name='calendar_feeds'),
+    path('calendar/<str:token>.ics', views.calendar_feed, name='calendar_feed'),
+    path('export/', views.export_appointments, name='export_appointments'),
+    path('waitlist/', views.waitlist, name='waitlist'),
+    path('waitlist/<int:pk>/withdraw/', views.withdraw_waitlist_entry, name='withdraw_waitlist_entry'),
+    path('waitlist/offers/<int:pk>/', views.respond_waitlist_offer, name='respond_waitlist_offer'),
 ]
@@ -1,14 +1,17 @@
-from django.core.mail import send_mail
+from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.conf import settings
-from django.utils import timezone
 from datetime import datetime, timedelta
-from dateutil import tz
+from Healthcore.mail import send_messages
+from .availability import AvailabilityIndex, parse_availability_hours
+from .ical import render_calendar
 
-def send_appointment_notification(appointment, notification_type):
+def build_appointment_messages(appointment, notification_type):
     """
-    Send email notifications for different appointment events
-    notification_type can be: 'confirmation', 'reminder', 'cancellation', 'rescheduled'
+    Build the patient and provider emails for an appointment event
+    notification_type can be: 'confirmation', 'reminder', 'cancellation', 'rescheduled', 'status_update',
+    'series_confirmation' (one summary of every occurrence of the appointment's series)
+    Returns an empty list for unknown notification types.
     """
     context = {
         'appointment': appointment,
@@ -31,87 +34,99 @@ def send_appointment_notification(appointment, notification_type):
     elif notification_type == 'rescheduled':
         subject = 'Appointment Rescheduled'
         template = 'appointments/email/rescheduled.html'
+    elif notification_type == 'status_update':
+        subject = f'Appointment Status Update: {appointment.get_status_display()}'
+        template = 'appointments/email/status_update.html'
+    elif notification_type == 'series_confirmation' and appointment.series_id:
+        subject = 'Recurring Appointments Confirmation'
+        template = 'appointments/email/series_confirmation.html'
+        context['series_appointments'] = appointment.series.appointments.order_by('start_at')
     else:
-        return  # Invalid notification type
+        return []  # Invalid notification type
 
     # Render email content
     html_message = render_to_string(template, context)
-    
-    # Send to patient
-    send_mail(
-        subject=subject,
-        message='',  # Plain text version
-        html_message=html_message,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[appointment.patient.email],
-        fail_silently=True
-    )
 
-    # Send to provider
-    send_mail(
-        subject=f'Provider: {subject}',
-        message='',  # Plain text version
-        html_message=html_message,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[appointment.provider.user.email],
-        fail_silently=True
-    )
+    messages = []
+    for message_subject, recipient in (
+        (subject, appointment.patient.email),                        # To patient
+        (f'Provider: {subject}', appointment.provider.user.email),   # To provider
+    ):
+        message = EmailMultiAlternatives(
+            subject=message_subject,
+            body='',  # Plain text version
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[recipient],
+        )
+        message.attach_alternative(html_message, 'text/html')
+        messages.append(message)
+    return messages
 
-def generate_ical_event(appointment):
-    """Generate iCalendar format string for the appointment"""
-    # Convert appointment time to UTC
-    local_tz = tz.gettz(settings.TIME_ZONE)
-    utc = tz.UTC
-    
-    # Combine date and time and make it timezone-aware
-    local_dt = datetime.combine(appointment.date, appointment.time).replace(tzinfo=local_tz)
-    start_time = local_dt.astimezone(utc)
-    end_time = start_time + timedelta(minutes=30)  # Assuming 30-minute appointments
-
-    description = f"""
-    Appointment Type: {appointment.get_appointment_type_display()}
-    Reason: {appointment.reason}
-    Provider: {appointment.provider.user.get_full_name()}
+def send_appointment_notification(appointment, notification_type, fail_silently=True, connection=None):
+    """
+    Send email notifications for different appointment events over the pooled
+    mail connection (or the connection given). Returns the number of emails sent.
     """
+    messages = build_appointment_messages(appointment, notification_type)
+    return send_messages(messages, fail_silently=fail_silently, connection=connection)
 
-    ical_data = f"""BEGIN:VCALENDAR
-VERSION:2.0
-BEGIN:VEVENT
-DTSTART:{start_time.strftime('%Y%m%dT%H%M%SZ')}
-DTEND:{end_time.strftime('%Y%m%dT%H%M%SZ')}
-SUMMARY:Medical Appointment - {appointment.get_appointment_type_display()}
-DESCRIPTION:{description}
-LOCATION:{appointment.provider.office_address if hasattr(appointment.provider, 'office_address') else 'TBD'}
-STATUS:CONFIRMED
-END:VEVENT
-END:VCALENDAR
-"""
-    return ical_data
+def generate_ical_event(appointment):
+    """Generate iCalendar format string for the appointment"""
+    return render_calendar([appointment])
 
-def check_appointment_availability(provider, date, time):
+def check_appointment_availability(provider, date, time, index=None, duration=None):
     """
     Check if the provider is available at the given date and time
     Returns (bool, str): (is_available, message)
+
+    duration is the appointment length in minutes (defaults to one slot).
+    Pass a prebuilt AvailabilityIndex to probe many slots with a single query.
     """
-    # Convert time to datetime for comparison
-    appointment_datetime = datetime.combine(date, time)
-    
+    if index is None:
+        index = AvailabilityIndex(provider, date)
+
     # Check if the time is in the future
-    if appointment_datetime <= timezone.now():
+    if index.is_past(date, time):
         return False, "Cannot book appointments in the past"
 
-    # Check if it's within provider's working hours (assuming 9 AM to 5 PM)
-    if time.hour < 9 or time.hour >= 17:
-        return False, "Appointments are only available between 9 AM and 5 PM"
-
-    # Check for existing appointments
-    existing_appointments = provider.provider_appointments.filter(
-        date=date,
-        time=time,
-        status='SCHEDULED'
-    ).exists()
+    # Check if it's within provider's working hours
+    if not index.is_within_hours(date, time, duration):
+        return False, "Appointments are only available during the provider's working hours"
 
-    if existing_appointments:
+    # Check for overlapping appointments
+    if index.is_booked(date, time, duration):
         return False, "This time slot is already booked"
 
     return True, "Time slot is available"
+
+def build_schedule_grid(appointments, start_date, days=7, slot_minutes=60, working_hours=None):
+    """
+    Bucket appointments into a day x time-slot grid in a single pass.
+    Returns (day_dates, rows) where each row is {'time': time, 'cells': [[appointment, ...], ...]}
+    with one cell per day. The time range covers the provider's working hours and
+    stretches to fit any appointment booked outside them.
+    """
+    day_dates = [start_date + timedelta(days=offset) for offset in range(days)]
+    schedule = parse_availability_hours(working_hours)
+    windows = [window for day in day_dates for window in schedule.get(day.weekday(), [])]
+    first = min((start for start, end in windows), default=9 * 60)
+    last = max((end for start, end in windows), default=17 * 60)
+
+    buckets = {}
+    for appointment in appointments:
+        offset = (appointment.date - start_date).days
+        if not 0 <= offset < days:
+            continue
+        minutes = appointment.time.hour * 60 + appointment.time.minute
+        first = min(first, minutes)
+        last = max(last, minutes + 1)
+        buckets.setdefault((offset, minutes // slot_minutes), []).append(appointment)
+
+    rows = []
+    for slot in range(first // slot_minutes, -(-last // slot_minutes)):
+        minutes = slot * slot_minutes
+        rows.append({
+            'time': (datetime.min + timedelta(minutes=minutes)).time(),
+            'cells': [buckets.get((offset, slot), []) for offset in range(days)],
+        })
+    return day_dates, rows
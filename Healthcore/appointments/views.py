@@ -1,42 +1,67 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
 from django.contrib import messages
-from django.http import HttpResponse, JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
-from django.db.models import Q
+from django.db.models import Count, Max, Q
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+import hashlib
 from datetime import datetime, timedelta
-from .models import Appointment
-from .forms import AppointmentForm
-from .utils import send_appointment_notification, generate_ical_event, check_appointment_availability
+from .models import Appointment, CalendarFeed, WaitlistEntry, WaitlistOffer
+from .forms import AppointmentForm, AppointmentSeriesForm, WaitlistEntryForm
+from .utils import generate_ical_event, build_schedule_grid
+from .booking import book_series, book_slot, hold_slot, SeriesConflict, SlotUnavailable
+from .availability import get_free_slots, day_bounds, parse_slot_range
+from .pagination import keyset_page, get_page_size
+from .exchange import FORMATS, export_lines, filter_export
+from .ical import calendar_lines
+from .transitions import transition_status
+from .waitlist import accept_offer, decline_offer
 from accounts.models import ProviderProfile
 
+MAX_SCHEDULE_DAYS = 31
+SCHEDULE_SLOT_CHOICES = (15, 30, 60)
+
+# Only the columns appointment_list.html displays
+LIST_FIELDS = (
+    'id', 'date', 'time', 'start_at', 'status', 'appointment_type',
+    'patient__first_name', 'patient__last_name',
+    'provider__user__first_name', 'provider__user__last_name',
+)
+
 @login_required
 def appointment_list(request):
-    today = timezone.now().date()
-    if hasattr(request.user, 'providerprofile'):
-        upcoming_appointments = Appointment.objects.filter(
-            provider=request.user.providerprofile,
-            date__gte=today,
-            status='SCHEDULED'
-        ).order_by('date', 'time')
-        past_appointments = Appointment.objects.filter(
-            provider=request.user.providerprofile,
-            date__lt=today
-        ).order_by('-date', '-time')
+    now = timezone.now()
+    is_provider = request.role.is_provider
+    if is_provider:
+        appointments = Appointment.objects.filter(provider=request.role.provider)
     else:
-        upcoming_appointments = Appointment.objects.filter(
-            patient=request.user,
-            date__gte=today,
-            status='SCHEDULED'
-        ).order_by('date', 'time')
-        past_appointments = Appointment.objects.filter(
-            patient=request.user,
-            date__lt=today
-        ).order_by('-date', '-time')
+        appointments = Appointment.objects.filter(patient=request.user)
+    appointments = appointments.select_related('patient', 'provider__user').only(*LIST_FIELDS)
+
+    page_size = get_page_size(request.GET.get('page_size'))
+    upcoming_appointments, upcoming_cursor = keyset_page(
+        appointments.filter(start_at__gte=now, status='SCHEDULED'),
+        request.GET.get('upcoming_after'),
+        page_size,
+    )
+    past_appointments, past_cursor = keyset_page(
+        appointments.filter(start_at__lt=now),
+        request.GET.get('past_after'),
+        page_size,
+        descending=True,
+    )
 
     return render(request, 'appointments/appointment_list.html', {
         'upcoming_appointments': upcoming_appointments,
-        'past_appointments': past_appointments
+        'past_appointments': past_appointments,
+        'upcoming_cursor': upcoming_cursor,
+        'past_cursor': past_cursor,
+        'page_size': page_size,
+        'is_provider': is_provider,
     })
 
 @login_required
@@ -44,28 +69,20 @@ def book_appointment(request):
     if request.method == 'POST':
         form = AppointmentForm(request.POST)
         if form.is_valid():
-            date = form.cleaned_data['date']
-            time = form.cleaned_data['time']
-            provider = form.cleaned_data['provider']
-
-            # Check availability
-            is_available, message = check_appointment_availability(provider, date, time)
-            
-            if not is_available:
-                messages.error(request, message)
+            appointment = form.save(commit=False)
+            appointment.patient = request.user
+
+            # Check availability and save under the provider lock
+            try:
+                book_slot(appointment)
+            except SlotUnavailable as e:
+                messages.error(request, str(e))
                 return render(request, 'appointments/book_appointment.html', {
                     'form': form,
                     'providers': ProviderProfile.objects.all()
                 })
 
-            appointment = form.save(commit=False)
-            appointment.patient = request.user
-            appointment.save()
-
-            # Send confirmation email
-            send_appointment_notification(appointment, 'confirmation')
-
-            messages.success(request, 'Appointment booked successfully! A confirmation email has been sent.')
+            messages.success(request, 'Appointment booked successfully! A confirmation email is on its way.')
             return redirect('appointments:appointment_detail', pk=appointment.pk)
     else:
         form = AppointmentForm()
@@ -76,10 +93,103 @@ def book_appointment(request):
         'providers': providers
     })
 
+@login_required
+def book_appointment_series(request):
+    conflicts = []
+    if request.method == 'POST':
+        form = AppointmentSeriesForm(request.POST)
+        if form.is_valid():
+            series = form.save(commit=False)
+            series.patient = request.user
+
+            # Every occurrence is checked up front; nothing is booked if any date is taken
+            try:
+                appointments = book_series(series, end_date=form.cleaned_data['end_date'])
+            except SeriesConflict as e:
+                conflicts = e.conflicts
+                messages.error(request, str(e))
+            except SlotUnavailable as e:
+                messages.error(request, str(e))
+            except ValueError as e:
+                form.add_error(None, str(e))
+            else:
+                messages.success(
+                    request,
+                    f'{len(appointments)} appointments booked successfully! A confirmation email is on its way.'
+                )
+                return redirect('appointments:appointment_list')
+    else:
+        form = AppointmentSeriesForm()
+
+    return render(request, 'appointments/book_appointment_series.html', {
+        'form': form,
+        'conflicts': conflicts,
+    })
+
+@login_required
+def waitlist(request):
+    """The patient's waitlist entries and open offers, and the form to join"""
+    if request.method == 'POST':
+        form = WaitlistEntryForm(request.POST)
+        if form.is_valid():
+            entry = form.save(commit=False)
+            entry.patient = request.user
+            entry.specialization = form.cleaned_data['specialization']
+            entry.save()
+            messages.success(request, "You're on the waitlist. We'll email you as soon as a matching slot opens up.")
+            return redirect('appointments:waitlist')
+    else:
+        form = WaitlistEntryForm()
+
+    entries = (
+        WaitlistEntry.objects.filter(patient=request.user, status__in=['WAITING', 'OFFERED'])
+        .select_related('provider__user').order_by('created_at')
+    )
+    offers = (
+        WaitlistOffer.objects.filter(entry__patient=request.user, status='PENDING', expires_at__gt=timezone.now())
+        .select_related('entry', 'provider__user').order_by('expires_at')
+    )
+    return render(request, 'appointments/waitlist.html', {
+        'form': form,
+        'entries': entries,
+        'offers': offers,
+    })
+
+@login_required
+@require_POST
+def respond_waitlist_offer(request, pk):
+    offer = get_object_or_404(
+        WaitlistOffer.objects.select_related('entry'), pk=pk, entry__patient=request.user, status='PENDING'
+    )
+    if request.POST.get('action') == 'accept':
+        try:
+            appointment = accept_offer(offer)
+        except SlotUnavailable as e:
+            messages.error(request, str(e))
+            return redirect('appointments:waitlist')
+        messages.success(request, 'Appointment booked successfully! A confirmation email is on its way.')
+        return redirect('appointments:appointment_detail', pk=appointment.pk)
+
+    decline_offer(offer)
+    messages.success(request, "Offer declined. You're still on the waitlist.")
+    return redirect('appointments:waitlist')
+
+@login_required
+@require_POST
+def withdraw_waitlist_entry(request, pk):
+    entry = get_object_or_404(WaitlistEntry, pk=pk, patient=request.user, status__in=['WAITING', 'OFFERED'])
+    WaitlistEntry.objects.filter(pk=entry.pk).update(status='WITHDRAWN')
+    # Pass any slot currently held for the entry on to the next patient
+    for offer in entry.offers.filter(status='PENDING').select_related('entry'):
+        decline_offer(offer)
+    messages.success(request, 'You have left the waitlist.')
+    return redirect('appointments:waitlist')
+
 @login_required
 def appointment_detail(request, pk):
-    appointment = get_object_or_404(Appointment, pk=pk)
-    if request.user != appointment.patient and (not hasattr(request.user, 'providerprofile') or request.user.providerprofile != appointment.provider):
+    # The page shows both participants
+    appointment = get_object_or_404(Appointment.objects.select_related('patient', 'provider__user'), pk=pk)
+    if not request.role.can_access(appointment):
         messages.error(request, 'You do not have permission to view this appointment.')
         return redirect('appointments:appointment_list')
 
@@ -96,8 +206,8 @@ def appointment_detail(request, pk):
 
 @login_required
 def cancel_appointment(request, pk):
-    appointment = get_object_or_404(Appointment, pk=pk)
-    if request.user != appointment.patient and (not hasattr(request.user, 'providerprofile') or request.user.providerprofile != appointment.provider):
+    appointment = get_object_or_404(Appointment.objects.select_related('patient', 'provider__user'), pk=pk)
+    if not request.role.can_access(appointment):
         messages.error(request, 'You do not have permission to cancel this appointment.')
         return redirect('appointments:appointment_list')
     
@@ -106,13 +216,13 @@ def cancel_appointment(request, pk):
             messages.error(request, 'This appointment cannot be cancelled.')
             return redirect('appointments:appointment_detail', pk=pk)
 
-        appointment.status = 'CANCELLED'
-        appointment.save()
+        # Also hands the freed slot to the first patient on the waitlist it suits
+        transition_status(
+            Appointment.objects.filter(pk=appointment.pk), 'CANCELLED',
+            changed_by=request.user, source='web'
+        )
 
-        # Send cancellation notification
-        send_appointment_notification(appointment, 'cancellation')
-
-        messages.success(request, 'Appointment cancelled successfully. A notification email has been sent.')
+        messages.success(request, 'Appointment cancelled successfully. A notification email is on its way.')
         return redirect('appointments:appointment_list')
     
     return render(request, 'appointments/cancel_appointment.html', {
@@ -122,24 +232,158 @@ def cancel_appointment(request, pk):
 @login_required
 def provider_schedule(request):
     """View for providers to see their daily/weekly schedule"""
-    if not hasattr(request.user, 'providerprofile'):
+    if not request.role.is_provider:
         messages.error(request, 'Only providers can access the schedule view.')
         return redirect('appointments:appointment_list')
 
-    # Get date range for schedule
+    # Get date range and grid granularity for schedule
     today = timezone.now().date()
-    start_date = request.GET.get('start_date')
-    start_date = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else today
-    end_date = start_date + timedelta(days=7)
+    try:
+        start_date = request.GET.get('start_date')
+        start_date = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else today
+        days = min(max(int(request.GET.get('days', 7)), 1), MAX_SCHEDULE_DAYS)
+        slot_minutes = int(request.GET.get('slot', 60))
+    except ValueError:
+        start_date, days, slot_minutes = today, 7, 60
+    if slot_minutes not in SCHEDULE_SLOT_CHOICES:
+        slot_minutes = 60
+    end_date = start_date + timedelta(days=days - 1)
 
+    provider = request.role.provider
+    range_start, range_end = day_bounds(start_date, end_date)
     appointments = Appointment.objects.filter(
-        provider=request.user.providerprofile,
-        date__range=[start_date, end_date],
+        provider=provider,
+        start_at__gte=range_start,
+        start_at__lt=range_end,
         status='SCHEDULED'
-    ).order_by('date', 'time')
+    ).select_related('patient').order_by('start_at')
+
+    day_dates, rows = build_schedule_grid(
+        appointments, start_date, days, slot_minutes, provider.availability_hours
+    )
 
     return render(request, 'appointments/provider_schedule.html', {
-        'appointments': appointments,
+        'days': day_dates,
+        'rows': rows,
         'start_date': start_date,
-        'end_date': end_date
+        'end_date': end_date,
+        'slot_minutes': slot_minutes,
+        'slot_choices': SCHEDULE_SLOT_CHOICES,
+        'day_count': days,
+    })
+
+@login_required
+def available_slots(request):
+    """Free slots for a provider over a date range, as JSON"""
+    try:
+        provider_id = int(request.GET.get('provider', ''))
+    except ValueError:
+        return JsonResponse({'error': 'provider must be a provider id'}, status=400)
+    provider = get_object_or_404(ProviderProfile, pk=provider_id)
+
+    try:
+        start_date, end_date = parse_slot_range(request.GET.get('start_date'), request.GET.get('end_date'))
+    except ValueError:
+        return JsonResponse({'error': 'Dates must be in YYYY-MM-DD format'}, status=400)
+
+    slots = get_free_slots(provider, start_date, end_date)
+    return JsonResponse({
+        'provider': provider.pk,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'slots': {
+            date.isoformat(): [slot.strftime('%H:%M') for slot in times]
+            for date, times in slots.items()
+        },
     })
+
+@login_required
+@require_POST
+def hold_appointment_slot(request):
+    """Reserve a slot while the booking form is being filled in"""
+    try:
+        provider_id = int(request.POST.get('provider', ''))
+        date = datetime.strptime(request.POST.get('date', ''), '%Y-%m-%d').date()
+        time = datetime.strptime(request.POST.get('time', ''), '%H:%M').time()
+    except ValueError:
+        return JsonResponse(
+            {'error': 'Expected a provider id, date as YYYY-MM-DD and time as HH:MM'}, status=400
+        )
+    provider = get_object_or_404(ProviderProfile, pk=provider_id)
+
+    try:
+        hold = hold_slot(provider, date, time, request.user)
+    except SlotUnavailable as e:
+        return JsonResponse({'held': False, 'error': str(e)}, status=409)
+    return JsonResponse({'held': True, 'expires_at': hold.expires_at.isoformat()})
+
+@staff_member_required
+def export_appointments(request):
+    """
+    Stream appointments as CSV (default) or NDJSON (?format=ndjson).
+    Filters: ?start_date, ?end_date (YYYY-MM-DD), ?status, ?provider.
+    """
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in FORMATS:
+        return JsonResponse({'error': f'format must be one of {", ".join(FORMATS)}'}, status=400)
+    try:
+        start_date, end_date = (
+            datetime.strptime(request.GET[name], '%Y-%m-%d').date() if request.GET.get(name) else None
+            for name in ('start_date', 'end_date')
+        )
+        provider_id = int(request.GET['provider']) if request.GET.get('provider') else None
+    except ValueError:
+        return JsonResponse({'error': 'Dates must be in YYYY-MM-DD format and provider an id'}, status=400)
+
+    queryset = filter_export(Appointment.objects.all(), start_date, end_date, request.GET.get('status'), provider_id)
+    content_type = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(export_lines(queryset, export_format), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="appointments.{export_format}"'
+    return response
+
+@login_required
+def calendar_feeds(request):
+    """Subscription URLs for the user's calendar feeds, with a way to reset them"""
+    kinds = ['patient'] + (['provider'] if request.role.is_provider else [])
+    feeds = [CalendarFeed.objects.get_or_create(user=request.user, kind=kind)[0] for kind in kinds]
+
+    if request.method == 'POST':
+        for feed in feeds:
+            if feed.kind == request.POST.get('kind'):
+                feed.reset_token()
+                messages.success(request, 'Your calendar link has been reset. Subscribe again with the new link.')
+        return redirect('appointments:calendar_feeds')
+
+    for feed in feeds:
+        feed.url = request.build_absolute_uri(feed.get_absolute_url())
+        feed.webcal_url = 'webcal://' + feed.url.split('://', 1)[1]
+    return render(request, 'appointments/calendar_feeds.html', {'feeds': feeds})
+
+def calendar_feed(request, token):
+    """
+    Upcoming appointments as an .ics feed for calendar apps, authorised by the token in
+    the URL. Clients poll every few minutes, so the version check is a single MAX/COUNT
+    over the indexed upcoming range and unchanged polls are answered with 304.
+    """
+    feed = get_object_or_404(CalendarFeed, token=token)
+    appointments = feed.appointments()
+    # Any change bumps updated_at; the count catches appointments leaving the window or deleted
+    version = appointments.aggregate(changed=Max('updated_at'), count=Count('id'))
+    last_modified = version['changed'] or feed.created_at
+    etag = quote_etag(hashlib.md5(
+        f'{feed.token}:{last_modified.isoformat()}:{version["count"]}'.encode(), usedforsecurity=False
+    ).hexdigest())
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+    if response is None:
+        events = (
+            appointments.exclude(status='CANCELLED')
+            .select_related('provider__user').order_by('start_at', 'id').iterator(chunk_size=500)
+        )
+        name = 'MediConnect Schedule' if feed.kind == 'provider' else 'MediConnect Appointments'
+        response = StreamingHttpResponse(calendar_lines(events, name), content_type='text/calendar; charset=utf-8')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified.timestamp())
+    # The URL is the credential; shared caches must not keep a copy
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,217 @@
+"""
+Cancellation waitlist.
+
+When a future appointment is cancelled, offer_slot() picks the first waiting
+entry the freed slot suits and reserves the slot for that patient with a
+SlotHold until the offer expires. Matching is one query on the partial index
+of waiting entries for the provider's specialization, walked in queue order,
+so its cost does not grow with the number of patients waiting elsewhere.
+Offers that expire or are declined cascade to the next matching entry.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db import transaction
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+from Healthcore.mail import dispatch
+from accounts.models import ProviderProfile
+from .availability import AvailabilityIndex
+from .booking import SlotUnavailable, book_slot
+from .models import Appointment, SlotHold, WaitlistEntry, WaitlistOffer
+from .outbox import SEND_LEASE
+
+DEFAULT_OFFER_SECONDS = 30 * 60
+DEFAULT_BATCH_SIZE = 50
+
+
+def offer_ttl():
+    return timedelta(seconds=getattr(settings, 'WAITLIST_OFFER_SECONDS', DEFAULT_OFFER_SECONDS))
+
+
+def matching_entries(provider, date, time, duration):
+    """Waiting entries a slot suits, first in the queue first"""
+    # Only appointment types that fit in the freed gap
+    types = [value for value, _ in Appointment.APPOINTMENT_TYPES if Appointment.duration_for(value) <= duration]
+    return (
+        WaitlistEntry.objects.filter(
+            status='WAITING', specialization=provider.specialization,
+            earliest_date__lte=date, latest_date__gte=date, appointment_type__in=types,
+        )
+        .filter(Q(provider__isnull=True) | Q(provider=provider))
+        .filter(Q(earliest_time__isnull=True) | Q(earliest_time__lte=time))
+        .filter(Q(latest_time__isnull=True) | Q(latest_time__gte=time))
+        # Nobody is offered the same slot twice
+        .exclude(pk__in=WaitlistOffer.objects.filter(provider=provider, date=date, time=time).values('entry_id'))
+        .order_by('created_at', 'id')
+    )
+
+
+def offer_slot(provider, date, time, duration, exclude_patient=None):
+    """
+    Offer a free slot to the first matching waitlist entry and hold it for them.
+    Returns the WaitlistOffer, or None if the slot is no longer free or nobody matches.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # Same lock as booking, so the slot cannot be taken between the check and the hold
+        provider = ProviderProfile.objects.select_for_update().get(pk=provider.pk)
+        SlotHold.objects.filter(provider=provider, date=date, time=time, expires_at__lte=now).delete()
+        if SlotHold.objects.filter(provider=provider, date=date, time=time).exists():
+            return None
+        if not AvailabilityIndex(provider, date).is_free(date, time, duration):
+            return None
+
+        entries = matching_entries(provider, date, time, duration)
+        if exclude_patient is not None:
+            entries = entries.exclude(patient=exclude_patient)
+        entry = entries.first()
+        if entry is None:
+            return None
+
+        expires_at = now + offer_ttl()
+        SlotHold.objects.create(provider=provider, date=date, time=time, holder_id=entry.patient_id, expires_at=expires_at)
+        WaitlistEntry.objects.filter(pk=entry.pk).update(status='OFFERED')
+        entry.status = 'OFFERED'
+        return WaitlistOffer.objects.create(
+            entry=entry, provider=provider, date=date, time=time, duration=duration, expires_at=expires_at,
+        )
+
+
+def offer_freed_slot(appointment):
+    """Offer a just-cancelled appointment's slot to the waitlist"""
+    if appointment.start_at <= timezone.now():
+        return None
+    return offer_slot(
+        appointment.provider, appointment.date, appointment.time, appointment.duration,
+        exclude_patient=appointment.patient_id,
+    )
+
+
+def offer_freed_slots(appointments):
+    """offer_freed_slot() for each of a batch of cancelled appointments; returns the offers made"""
+    offers = [offer_freed_slot(appointment) for appointment in appointments]
+    return [offer for offer in offers if offer is not None]
+
+
+def _close_offer(offer, status):
+    # Put the entry back in the queue, release the hold and move on to the next entry
+    with transaction.atomic():
+        closed = WaitlistOffer.objects.filter(pk=offer.pk, status='PENDING').update(status=status)
+        if not closed:
+            return None
+        offer.status = status
+        WaitlistEntry.objects.filter(pk=offer.entry_id, status='OFFERED').update(status='WAITING')
+        SlotHold.objects.filter(
+            provider_id=offer.provider_id, date=offer.date, time=offer.time, holder_id=offer.entry.patient_id
+        ).delete()
+    # The patient may be waiting further down the queue too; don't hand the slot straight back
+    return offer_slot(offer.provider, offer.date, offer.time, offer.duration, exclude_patient=offer.entry.patient_id)
+
+
+def decline_offer(offer):
+    """Decline a pending offer; returns the offer made to the next entry, if any"""
+    return _close_offer(offer, 'DECLINED')
+
+
+def accept_offer(offer):
+    """
+    Book the offered slot for the entry's patient.
+    Raises SlotUnavailable if the offer has lapsed or the slot is gone.
+    """
+    if not offer.is_open:
+        raise SlotUnavailable('This offer has expired')
+    entry = offer.entry
+
+    def claim():
+        # Conditional, like _close_offer: an accept racing the expiry sweep books nothing once the offer is closed
+        accepted = WaitlistOffer.objects.filter(
+            pk=offer.pk, status='PENDING', expires_at__gt=timezone.now()
+        ).update(status='ACCEPTED')
+        if not accepted:
+            raise SlotUnavailable('This offer has expired')
+        WaitlistEntry.objects.filter(pk=entry.pk).update(status='BOOKED')
+
+    appointment = book_slot(Appointment(
+        patient_id=entry.patient_id, provider_id=offer.provider_id,
+        date=offer.date, time=offer.time,
+        appointment_type=entry.appointment_type, reason=entry.reason,
+    ), claim=claim)
+    offer.status, entry.status = 'ACCEPTED', 'BOOKED'
+    return appointment
+
+
+def expire_offers(batch_size=DEFAULT_BATCH_SIZE):
+    """Expire one batch of lapsed offers and cascade their slots; returns (expired, reoffered)"""
+    expired = reoffered = 0
+    lapsed = (
+        WaitlistOffer.objects.filter(status='PENDING', expires_at__lte=timezone.now())
+        .select_related('entry', 'provider').order_by('expires_at')[:batch_size]
+    )
+    for offer in lapsed:
+        next_offer = _close_offer(offer, 'EXPIRED')
+        if offer.status == 'EXPIRED':
+            expired += 1
+            reoffered += next_offer is not None
+    return expired, reoffered
+
+
+def retire_stale_entries():
+    """Take entries whose window has passed out of the queue; returns the number retired"""
+    return WaitlistEntry.objects.filter(
+        status='WAITING', latest_date__lt=timezone.localdate()
+    ).update(status='EXPIRED')
+
+
+def build_offer_message(offer):
+    entry = offer.entry
+    patient = entry.patient
+    html_message = render_to_string('appointments/email/waitlist_offer.html', {
+        'offer': offer,
+        'patient_name': patient.get_full_name() or patient.email,
+        'provider_name': offer.provider.user.get_full_name(),
+        'appointment_date': offer.date.strftime('%B %d, %Y'),
+        'appointment_time': offer.time.strftime('%I:%M %p'),
+        'expires_at': timezone.localtime(offer.expires_at),
+    })
+    message = EmailMultiAlternatives(
+        subject='An Earlier Appointment Is Available',
+        body='',
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[patient.email],
+    )
+    message.attach_alternative(html_message, 'text/html')
+    return message
+
+
+def notify_offers(batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Email one batch of open offers nobody has been told about yet; returns the number sent.
+    The batch is claimed in a short transaction by setting notify_claimed_until
+    SEND_LEASE ahead and mailed after the lock is released, as the outbox worker
+    does; failed offers are released for the next run, and a claim that is never
+    recorded because the worker died lapses after SEND_LEASE.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            WaitlistOffer.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(status='PENDING', expires_at__gt=now, notified_at__isnull=True)
+            .filter(Q(notify_claimed_until__isnull=True) | Q(notify_claimed_until__lte=now))
+            .select_related('entry__patient', 'provider__user')
+            .order_by('expires_at')[:batch_size]
+        )
+        if not batch:
+            return 0
+        WaitlistOffer.objects.filter(pk__in=[offer.pk for offer in batch]).update(
+            notify_claimed_until=now + SEND_LEASE
+        )
+
+    # No row locks are held while talking to the mail server
+    results = dispatch([build_offer_message(offer) for offer in batch])
+    sent = {offer.pk for offer, result in zip(batch, results) if result.sent}
+    WaitlistOffer.objects.filter(pk__in=sent).update(notified_at=timezone.now(), notify_claimed_until=None)
+    failed = [offer.pk for offer in batch if offer.pk not in sent]
+    WaitlistOffer.objects.filter(pk__in=failed).update(notify_claimed_until=None)
+    return len(sent)
@@ -1,11 +1,16 @@
 from django.contrib import admin
+from Healthcore.changelist import PrefixSearchMixin
 from .models import Patient
 
 @admin.register(Patient)
-class PatientAdmin(admin.ModelAdmin):
+class PatientAdmin(PrefixSearchMixin, admin.ModelAdmin):
     list_display = ['user', 'get_full_name', 'phone_number', 'blood_type', 'get_age']
     list_filter = ['blood_type', 'gender', 'created_at']
-    search_fields = ['user__email', 'user__first_name', 'user__last_name', 'phone_number']
+    list_select_related = ['user']
+    # Email/name prefix of the user, or phone number prefix
+    prefix_search_users = ['user']
+    prefix_search_fields = ['phone_number']
+    ordering = ['-id']
     readonly_fields = ['created_at', 'updated_at']
     
     fieldsets = (
@@ -0,0 +1,107 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:53
+
+import django.core.validators
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='patient',
+            options={'verbose_name': 'Patient', 'verbose_name_plural': 'Patients'},
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='address',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='allergies',
+            field=models.TextField(blank=True, help_text='List any known allergies'),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='blood_type',
+            field=models.CharField(blank=True, choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('AB+', 'AB+'), ('AB-', 'AB-'), ('O+', 'O+'), ('O-', 'O-')], max_length=3),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='current_medications',
+            field=models.TextField(blank=True, help_text='List current medications'),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='emergency_contact_name',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='emergency_contact_phone',
+            field=models.CharField(blank=True, max_length=17, validators=[django.core.validators.RegexValidator(message="Phone number must be entered in the format: '+999999999'. Up to 15 digits allowed.", regex='^\\+?1?\\d{9,15}$')]),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='gender',
+            field=models.CharField(choices=[('M', 'Male'), ('F', 'Female'), ('O', 'Other')], default='', max_length=1),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='height',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Height in centimeters', max_digits=5, null=True),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='insurance_policy_number',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='insurance_provider',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='medical_conditions',
+            field=models.TextField(blank=True, help_text='List any chronic conditions'),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='phone_number',
+            field=models.CharField(blank=True, max_length=17, validators=[django.core.validators.RegexValidator(message="Phone number must be entered in the format: '+999999999'. Up to 15 digits allowed.", regex='^\\+?1?\\d{9,15}$')]),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='weight',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Weight in kilograms', max_digits=5, null=True),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='medical_history',
+            field=models.TextField(blank=True, help_text='Past medical procedures and conditions'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['phone_number'], name='patient_phone_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.core.validators import RegexValidator
 from accounts.models import User
 
@@ -64,6 +65,10 @@ class Patient(models.Model):
     class Meta:
         verbose_name = 'Patient'
         verbose_name_plural = 'Patients'
+        indexes = [
+            # Prefix search in the admin changelist, which matches on Lower(column)
+            models.Index(Lower('phone_number'), name='patient_phone_lower_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.get_full_name()} - {self.user.email}"
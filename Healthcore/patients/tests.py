@@ -1,3 +1,74 @@
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+from accounts.models import User
+from .models import Patient
 
-# Create your tests here.
+
+class PatientAdminTests(TestCase):
+    def setUp(self):
+        admin_user = User.objects.create_superuser('admin@example.com', None, username='admin')
+        self.client.force_login(admin_user)
+        self.url = reverse('admin:patients_patient_changelist')
+
+    def add_patient(self, n):
+        user = User.objects.create_user(
+            f'patient{n}@example.com', None, username=f'patient{n}',
+            first_name=f'Pat{n}', last_name='Ient', user_type='patient'
+        )
+        return Patient.objects.create(user=user, gender='O', phone_number=f'+1555000{n:04d}')
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        self.add_patient(0)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(self.url)
+        for n in range(1, 15):
+            self.add_patient(n)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.context['cl'].result_list), 15)
+        self.assertEqual(len(few), len(many))
+
+    def test_search_by_email_name_or_phone_prefix(self):
+        patients = [self.add_patient(n) for n in range(12)]
+        for term, expected in (
+            ('patient11@', [patients[11]]),
+            ('pat1', [patients[1], patients[10], patients[11]]),
+            ('+1555000000', patients[:10]),
+            ('ient pat1', [patients[1], patients[10], patients[11]]),
+            ('Pat2 +15550000', [patients[2]]),
+        ):
+            with self.subTest(term=term):
+                response = self.client.get(self.url, {'q': term})
+                self.assertEqual(
+                    sorted(p.pk for p in response.context['cl'].result_list),
+                    sorted(p.pk for p in expected),
+                )
+
+    def test_search_ignores_case(self):
+        user = User.objects.create_user(
+            'sean@example.com', None, username='sean',
+            first_name='Seán', last_name="O'Brien-McDonald", user_type='patient'
+        )
+        patient = Patient.objects.create(user=user, gender='O', phone_number='+15559990000')
+        self.add_patient(1)
+        for term in ("o'brien", "O'BRIEN", "o'Brien-mc", 'SEAN@EXAMPLE'):
+            with self.subTest(term=term):
+                response = self.client.get(self.url, {'q': term})
+                self.assertEqual(list(response.context['cl'].result_list), [patient])
+
+    def test_search_reads_lowercase_indexes(self):
+        self.add_patient(1)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url, {'q': 'pat1'})
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                if 'LOWER(' in query['sql']:
+                    cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                    plans.append('\n'.join(row[-1] for row in cursor.fetchall()))
+        used = '\n'.join(plans)
+        for index in ('user_email_lower_idx', 'user_last_name_lower_idx', 'user_first_name_lower_idx',
+                      'patient_phone_lower_idx'):
+            self.assertIn(index, used)